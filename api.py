@@ -1,114 +1,337 @@
+## ASGI api, run with: uvicorn api:app --port 3000 (or python api.py)
+## one event loop owns the DBHelper pool, every handler awaits the db directly
+## so many requests can be in flight at once instead of one blocked thread each
 
-from flask import Flask, request, jsonify
-from helpers.db_helper import DBHelper
-from helpers.query_engine import execute_sql_query_cached_sync
 import asyncio
-import threading
-
-app = Flask(__name__)
-
-# Global DB helper instance
-db_helper = None
-loop = None
-loop_thread = None
-
-def run_event_loop(loop):
-    """Run event loop in background thread"""
-    asyncio.set_event_loop(loop)
-    loop.run_forever()
-
-def init_db():
-    """Initialize database connection with persistent event loop"""
-    global db_helper, loop, loop_thread
-    
-    # Create event loop in background thread
-    loop = asyncio.new_event_loop()
-    loop_thread = threading.Thread(target=run_event_loop, args=(loop,), daemon=True)
-    loop_thread.start()
-    
-    # Create DB helper
-    db_helper = DBHelper()
-    
-    # Run connect in the background loop
-    future = asyncio.run_coroutine_threadsafe(db_helper.connect(), loop)
-    future.result(timeout=10)  # Wait for connection
-    
-    print("✅ Database connected for API")
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from email.utils import format_datetime
+import json
+import os
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from helpers.db_helper import READ_AFTER_WRITE_SECONDS, DBHelper
+from helpers import query_engine
+from helpers.intent_matcher import MAX_ROWS
+from helpers.query_engine import execute_sql_query_cached
+from helpers.response_cache import ResponseCache
+
+# Global DB helper instance, connected in lifespan()
+db_helper = DBHelper()
+
+# most ids / names one /repos/batch request may ask for
+REPOS_BATCH_MAX = int(os.getenv("REPOS_BATCH_MAX", 5000))
+# biggest /repos page, full exports go through ?format=ndjson instead
+REPOS_PAGE_MAX = int(os.getenv("REPOS_PAGE_MAX", 1000))
+
+# /stats, /repos pages and /repos/<id> only change when a writer bumps the data generation
+response_cache = ResponseCache(
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", 60)),
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1024)),
+)
+
+
+def json_default(o):
+    """Same encoding flask's jsonify used, so responses don't change shape for clients"""
+    if isinstance(o, datetime):
+        if o.tzinfo is None:
+            o = o.replace(tzinfo=timezone.utc)
+        return format_datetime(o.astimezone(timezone.utc), usegmt=True)
+    if isinstance(o, date):
+        return format_datetime(datetime(o.year, o.month, o.day, tzinfo=timezone.utc), usegmt=True)
+    if isinstance(o, Decimal):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    return json.dumps(data, default=json_default, separators=(",", ":"))
+
+
+class JSON(JSONResponse):
+    def render(self, content):
+        return dumps(content).encode("utf-8")
+
+
+def on_data_generation(generation):
+    """A writer committed (or we just started up), every cache keyed on the old data is stale"""
+    db_helper.read_from_primary_for(READ_AFTER_WRITE_SECONDS)
+    response_cache.set_generation(generation)
+    query_engine.set_data_generation(generation)
+
+
+def int_arg(request, name, default):
+    """Like flask's request.args.get(name, default, type=int): bad values fall back to default"""
+    try:
+        return int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        return default
 
 
-def run_async(coro):
-    """Run async coroutine in the background event loop"""
-    if loop is None or loop.is_closed():
-        raise RuntimeError("Event loop not initialized")
-    future = asyncio.run_coroutine_threadsafe(coro, loop)
-    return future.result(timeout=30)  # 30 second timeout
+async def warm_caches():
+    """Fill caches from persisted state in the background, reads are served meanwhile"""
+    try:
+        warmed = await query_engine.warm_sql_cache(db_helper)
+        await response_cache.get_or_load(('stats',), db_helper.get_stats)
+        print(f"🔥 Warmed {warmed} cached questions and /stats")
+    except Exception as e:
+        print(f"⚠️  Cache warm-up failed: {e!r}")
+
 
+@asynccontextmanager
+async def lifespan(app):
+    await db_helper.connect()
+    db_helper.start_metrics_reporter()
+    on_data_generation(await db_helper.get_data_generation())
+    await db_helper.listen_data_generation(on_data_generation)
+    warmup = asyncio.create_task(warm_caches())
+    print("✅ Database connected for API")
+    try:
+        yield
+    finally:
+        warmup.cancel()
+        await db_helper.close()
 
-@app.route('/')
-def home():
-    return jsonify({
+
+async def home(request):
+    return JSON({
         "message": "GitHub Repository Query API",
         "endpoints": {
-            "/repos": "GET - Get all repos",
+            "/repos": "GET - Get repos by stars (?limit, ?cursor, ?fields, ?format=ndjson)",
             "/repos/<repo_id>": "GET - Get repo by ID",
+            "/repos/batch": "POST - Many repos at once ({repo_ids, repo_names, fields, include: [languages, topics]})",
             "/stats": "GET - Get database statistics",
+            "/trending": "GET - Fastest rising repos from archive activity (?window=1h|24h|7d, ?language or ?topic, ?limit)",
+            "/metrics": "GET - Per-statement DB latency, rows and pool wait, cache hit rates",
             "/query": "POST - Natural language query"
         }
     })
 
 
-@app.route('/repos', methods=['GET'])
-def get_all_repos():
-    """Get all repos with optional limit"""
-    limit = request.args.get('limit', 100, type=int)
-    repos = run_async(db_helper.get_all_repos(limit=limit))
-    return jsonify(repos)
+async def get_all_repos(request):
+    """
+    Repos ordered by stars, keyset paginated.
+
+    ?limit=100          page size, at most REPOS_PAGE_MAX
+    ?cursor=...         value of the previous page's X-Next-Cursor header
+    ?fields=a,b         only return these columns (repo_id and stars always included)
+    ?format=ndjson      stream everything from the cursor on, one JSON object per line
+    """
+    limit = max(1, min(int_arg(request, 'limit', 100), REPOS_PAGE_MAX))
+    cursor = request.query_params.get('cursor')
+    fields = [f for f in request.query_params.get('fields', '').split(',') if f] or None
 
+    try:
+        if request.query_params.get('format') == 'ndjson':
+            return await stream_repos_ndjson(fields, cursor)
 
-@app.route('/repos/<int:repo_id>', methods=['GET'])
-def get_repo_by_id(repo_id):
+        repos, next_cursor = await response_cache.get_or_load(
+            ('repos', limit, cursor, tuple(fields or ())),
+            lambda: db_helper.get_repos_page(limit=limit, cursor=cursor, fields=fields)
+        )
+    except ValueError as e:
+        return JSON({"error": str(e)}, status_code=400)
+
+    response = JSON(repos)
+    if next_cursor:
+        base_url = str(request.url.replace(query=""))
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{base_url}?limit={limit}&cursor={next_cursor}>; rel="next"'
+    return response
+
+
+async def stream_repos_ndjson(fields, cursor):
+    """Pull rows one keyset page at a time, so memory stays flat for full exports"""
+    rows = db_helper.iter_repos(fields=fields, cursor=cursor)
+    # fail fast on bad fields/cursor before the 200 goes out
+    first = await anext_or_none(rows)
+
+    async def generate():
+        row = first
+        try:
+            while row is not None:
+                yield dumps(row) + "\n"
+                row = await anext_or_none(rows)
+        finally:
+            await rows.aclose()
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+async def anext_or_none(agen):
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def get_repo_by_id(request):
     """Get a single repo by repo_id"""
-    repo = run_async(db_helper.get_repo_by_id(repo_id))
+    repo_id = request.path_params['repo_id']
+    repo = await response_cache.get_or_load(('repo', repo_id), lambda: db_helper.get_repo_by_id(repo_id))
     if repo:
-        return jsonify(repo)
+        return JSON(repo)
     else:
-        return jsonify({"error": "Repo not found"}), 404
+        return JSON({"error": "Repo not found"}, status_code=404)
+
 
+async def get_repos_batch(request):
+    """
+    Many repos in one request and one query.
+
+    {"repo_ids": [1, 2], "repo_names": ["owner/repo"], "fields": [...], "include": ["languages", "topics"]}
+    Repos come back in the order asked for, ids first, with anything not found listed under "missing".
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JSON({"error": "Request body must be a JSON object"}, status_code=400)
 
-@app.route('/stats', methods=['GET'])
-def get_stats():
+    repo_ids = data.get('repo_ids') or []
+    repo_names = data.get('repo_names') or []
+    if not isinstance(repo_ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in repo_ids):
+        return JSON({"error": "repo_ids must be a list of integers"}, status_code=400)
+    if not isinstance(repo_names, list) or not all(isinstance(n, str) for n in repo_names):
+        return JSON({"error": "repo_names must be a list of strings"}, status_code=400)
+    for key in ('fields', 'include'):
+        value = data.get(key)
+        if value is not None and (not isinstance(value, list) or not all(isinstance(v, str) for v in value)):
+            return JSON({"error": f"{key} must be a list of strings"}, status_code=400)
+    if not repo_ids and not repo_names:
+        return JSON({"error": "repo_ids or repo_names is required"}, status_code=400)
+    if len(repo_ids) + len(repo_names) > REPOS_BATCH_MAX:
+        return JSON({"error": f"At most {REPOS_BATCH_MAX} repo_ids + repo_names per request"}, status_code=400)
+
+    # dedupe, keep the order asked for
+    repo_ids = list(dict.fromkeys(repo_ids))
+    repo_names = list(dict.fromkeys(repo_names))
+
+    try:
+        rows = await db_helper.get_repos_by_ids(
+            repo_ids=repo_ids,
+            repo_names=repo_names,
+            fields=data.get('fields') or None,
+            include=data.get('include') or (),
+        )
+    except ValueError as e:
+        return JSON({"error": str(e)}, status_code=400)
+
+    by_id = {row['repo_id']: row for row in rows}
+    by_name = {row['repo_name']: row for row in rows}
+
+    repos = []
+    seen = set()
+    for row in [by_id.get(i) for i in repo_ids] + [by_name.get(n) for n in repo_names]:
+        if row is not None and row['repo_id'] not in seen:
+            seen.add(row['repo_id'])
+            repos.append(row)
+
+    return JSON({
+        "repos": repos,
+        "missing": {
+            "repo_ids": [i for i in repo_ids if i not in by_id],
+            "repo_names": [n for n in repo_names if n not in by_name],
+        }
+    })
+
+
+async def get_stats(request):
     """Get database statistics"""
-    stats = run_async(db_helper.get_stats())
-    return jsonify(stats)
+    stats = await response_cache.get_or_load(('stats',), db_helper.get_stats)
+    return JSON(stats)
+
 
+async def get_trending(request):
+    """
+    Precomputed trending leaderboard, ranked by events in the window minus the window before.
 
-@app.route('/query', methods=['POST'])
-def natural_language_query():
+    ?window=24h         1h, 24h or 7d
+    ?language=Rust      only repos whose primary language is this
+    ?topic=rust         only repos with this topic
+    ?limit=50
+    """
+    window = request.query_params.get('window', '24h')
+    language = request.query_params.get('language') or None
+    topic = request.query_params.get('topic') or None
+    limit = max(1, int_arg(request, 'limit', 50))
+
+    try:
+        trending = await response_cache.get_or_load(
+            ('trending', window, language, topic, limit),
+            lambda: db_helper.get_trending(window, language=language, topic=topic, limit=limit)
+        )
+    except ValueError as e:
+        return JSON({"error": str(e)}, status_code=400)
+    return JSON(trending)
+
+
+async def get_metrics(request):
+    """Per-statement DB timings since startup (or the last periodic log), plus cache counters"""
+    return JSON({
+        "statements": db_helper.metrics.snapshot(),
+        "response_cache": response_cache.stats(),
+        "query_cache": query_engine.cache_stats(),
+        "replica": db_helper.replica_status(),
+    })
+
+
+async def natural_language_query(request):
     """Natural language query endpoint"""
-    data = request.json
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JSON({"error": "Request body must be a JSON object"}, status_code=400)
+
     question = data.get('question')
-    
     if not question:
-        return jsonify({"error": "Question is required"}), 400
-    
+        return JSON({"error": "Question is required"}, status_code=400)
+
+    # the limit is bound into SQL as-is, so it has to be a real positive int before it gets there
+    limit = data.get('limit', 100)
+    if isinstance(limit, str) and limit.strip().isdigit():
+        limit = int(limit)
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        return JSON({"error": "limit must be a positive integer"}, status_code=400)
+    limit = min(limit, MAX_ROWS)
+
     try:
-        limit = data.get('limit', 100)
-        # This already handles async internally
-        columns, results = execute_sql_query_cached_sync(question, db_helper, limit)
-        
-        return jsonify({
+        columns, results = await execute_sql_query_cached(question, db_helper, limit)
+
+        return JSON({
             "columns": columns,
             "results": results,
             "count": len(results)
         })
     except ValueError as e:
-        return jsonify({"error": str(e)}), 400
+        return JSON({"error": str(e)}, status_code=400)
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return JSON({"error": str(e)}, status_code=500)
+
+
+routes = [
+    Route('/', home),
+    Route('/repos', get_all_repos, methods=['GET']),
+    Route('/repos/batch', get_repos_batch, methods=['POST']),
+    Route('/repos/{repo_id:int}', get_repo_by_id, methods=['GET']),
+    Route('/stats', get_stats, methods=['GET']),
+    Route('/trending', get_trending, methods=['GET']),
+    Route('/metrics', get_metrics, methods=['GET']),
+    Route('/query', natural_language_query, methods=['POST']),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
 
 
 if __name__ == "__main__":
-    init_db()
-    app.run(debug=True, port=3000)
+    import uvicorn
+    uvicorn.run(app, port=3000)
@@ -0,0 +1,86 @@
+## concurrent load against one or more running api servers, e.g. the asgi app vs an older build
+## run from the repo root: python -m bench.bench_api_load http://localhost:3000 http://localhost:3001
+## -c concurrency, -n total requests per server, -p paths to rotate through
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+DEFAULT_PATHS = ["/stats", "/repos?limit=50", "/repos?limit=20&fields=repo_name,stars", "/metrics"]
+
+
+async def worker(session, base_url, paths, counter, latencies, errors):
+    while True:
+        i = counter[0]
+        if i >= counter[1]:
+            return
+        counter[0] += 1
+
+        path = paths[i % len(paths)]
+        start = time.perf_counter()
+        try:
+            async with session.get(base_url + path) as resp:
+                await resp.read()
+                if resp.status >= 400:
+                    errors[resp.status] = errors.get(resp.status, 0) + 1
+                    continue
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            key = type(e).__name__
+            errors[key] = errors.get(key, 0) + 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run_load(base_url, paths, concurrency, total):
+    latencies = []
+    errors = {}
+    counter = [0, total]  # next request index, total
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # warm up the pool / connections so the first requests don't skew p99
+        async with session.get(base_url + paths[0]) as resp:
+            await resp.read()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            worker(session, base_url, paths, counter, latencies, errors)
+            for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    return latencies, errors, elapsed
+
+
+def pct(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="concurrent GET load against api servers")
+    parser.add_argument("base_urls", nargs="+")
+    parser.add_argument("-c", "--concurrency", type=int, default=200)
+    parser.add_argument("-n", "--requests", type=int, default=5000)
+    parser.add_argument("-p", "--paths", nargs="+", default=DEFAULT_PATHS)
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests per server, {args.concurrency} in flight")
+    print(f"{'server':<28} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>8}")
+    for base_url in args.base_urls:
+        base_url = base_url.rstrip("/")
+        latencies, errors, elapsed = await run_load(base_url, args.paths, args.concurrency, args.requests)
+        latencies.sort()
+        print(f"{base_url:<28} {len(latencies) / elapsed:>8.0f} {pct(latencies, 0.50):>8.1f} "
+              f"{pct(latencies, 0.95):>8.1f} {pct(latencies, 0.99):>8.1f} "
+              f"{(latencies[-1] if latencies else 0):>8.1f} {sum(errors.values()):>8}")
+        if errors:
+            print(f"  errors: {errors}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+## hit rate and match time of helpers.intent_matcher over a query log
+## run from the repo root:
+##   python -m bench.bench_intents                 built-in sample questions
+##   python -m bench.bench_intents questions.txt   one question per line
+##   python -m bench.bench_intents --from-db       questions in generated_sql_cache, weighted by hits
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from helpers.intent_matcher import match_intent
+
+ROUNDS = 200
+
+SAMPLE_QUESTIONS = [
+    "Show me top 10 Python repos",
+    "How many repos have more than 1000 stars?",
+    "Find repos with high activity in the last 30 days",
+    "Show me repos about machine learning",
+    "What are the most popular languages?",
+    "top 20 rust repositories",
+    "best go projects",
+    "repos with over 10k stars",
+    "most popular topics",
+    "list the 5 most active repos",
+    "repos written in typescript",
+    "how many repositories have fewer than 10 stars",
+    "which repos gained the most stars this week",
+    "repos with the most contributors",
+    "average number of forks for javascript repos",
+    "repos that depend on numpy",
+    "show me repos tagged with kubernetes",
+    "top 10 starred repos",
+]
+
+
+async def questions_from_db():
+    from helpers.db_helper import DBHelper
+
+    db_helper = DBHelper()
+    await db_helper.connect()
+    try:
+        async with db_helper.acquire('bench_intents') as conn:
+            rows = await conn.fetch("SELECT question, hits FROM generated_sql_cache")
+    finally:
+        await db_helper.close()
+    # every row was asked at least once, then hits more times from the shared cache
+    return [row['question'] for row in rows for _ in range(row['hits'] + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="intent matcher hit rate over a query log")
+    parser.add_argument("log", nargs="?", help="file with one question per line")
+    parser.add_argument("--from-db", action="store_true", help="read questions from generated_sql_cache")
+    args = parser.parse_args()
+
+    if args.from_db:
+        questions = asyncio.run(questions_from_db())
+    elif args.log:
+        with open(args.log) as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = SAMPLE_QUESTIONS
+
+    if not questions:
+        print("no questions to match")
+        return
+
+    intents = Counter()
+    misses = []
+    for question in questions:
+        match = match_intent(question)
+        if match is None:
+            misses.append(question)
+        else:
+            intents[match.intent] += 1
+
+    timings = []
+    for _ in range(ROUNDS):
+        for question in questions:
+            start = time.perf_counter_ns()
+            match_intent(question)
+            timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+
+    matched = len(questions) - len(misses)
+    print(f"{len(questions)} questions, {matched} matched locally ({matched / len(questions):.1%})")
+    for intent, count in intents.most_common():
+        print(f"  {intent:<24} {count:>6}")
+    print(f"match time: p50 {timings[len(timings) // 2] / 1000:.1f} us, "
+          f"p99 {timings[int(len(timings) * 0.99)] / 1000:.1f} us")
+    if misses:
+        print("sent to the LLM, most common first:")
+        for question, count in Counter(misses).most_common(10):
+            print(f"  {count:>4}  {question}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+## microbenchmark: per-repo dict parsing + unpacking vs parse_repo_batch
+## run from the repo root: python -m bench.bench_parse
+
+import time
+import tracemalloc
+
+from helpers.repo_parser import RepoBatch, parse_repo_batch
+
+N_REPOS = 1000
+ROUNDS = 20
+
+
+def make_payload(i):
+    return {
+        "stargazerCount": i * 7,
+        "forkCount": i * 3,
+        "openIssues": {"totalCount": i % 50},
+        "closedIssues": {"totalCount": i % 200},
+        "watchers": {"totalCount": i % 90},
+        "languages": {
+            "edges": [
+                {"node": {"name": f"Lang{j}"}, "size": 1000 * (j + 1) + i}
+                for j in range(6)
+            ]
+        },
+        "repositoryTopics": {
+            "nodes": [{"topic": {"name": f"topic-{j}"}} for j in range(8)]
+        },
+    }
+
+
+def legacy_parse_repo_data(repo_data):
+    # the per-repo dict parser processor.py used before parse_repo_batch, kept here as the baseline
+    languages = {}
+    for edge in repo_data["languages"]["edges"]:
+        languages[edge["node"]["name"]] = edge["size"]
+
+    total_size = sum(languages.values())
+    language_percentages = {
+        lang_name: (size / total_size) * 100
+        for lang_name, size in languages.items()
+    }
+
+    topics = {}
+    for node in repo_data["repositoryTopics"]["nodes"]:
+        topic_name = node["topic"]["name"]
+        topics[topic_name] = topics.get(topic_name, 0) + 1
+
+    return {
+        "stars": repo_data["stargazerCount"],
+        "forks": repo_data["forkCount"],
+        "open_issues": repo_data["openIssues"]["totalCount"],
+        "closed_issues": repo_data["closedIssues"]["totalCount"],
+        "subscribers": repo_data["watchers"]["totalCount"],
+        "languages": languages,
+        "language_percentages": language_percentages,
+        "topics": topics,
+    }
+
+
+def legacy_path(items):
+    # parse to dicts, then bulk_save_enriched_repos unpacks them again
+    enriched_data_list = [
+        {
+            "repo_id": repo_id,
+            "repo_name": repo_name,
+            "activity_score": activity_score,
+            "parsed_data": legacy_parse_repo_data(repo_data),
+        }
+        for repo_id, repo_name, activity_score, repo_data in items
+    ]
+    return RepoBatch.from_enriched(enriched_data_list)
+
+
+def batch_path(items):
+    return parse_repo_batch(items)
+
+
+def measure(fn, items):
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        fn(items)
+    cpu_per_round = (time.process_time() - start) / ROUNDS
+
+    tracemalloc.start()
+    fn(items)
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+
+    return cpu_per_round, peak, blocks
+
+
+def main():
+    items = [(i, f"owner/repo{i}", i % 100, make_payload(i)) for i in range(N_REPOS)]
+
+    # both paths must produce the same rows
+    legacy, batch = legacy_path(items), batch_path(items)
+    assert (legacy.repos, legacy.languages, legacy.topics) == (batch.repos, batch.languages, batch.topics)
+
+    print(f"{'path':<10} {'cpu ms/1k':>10} {'peak KiB':>10} {'live blocks':>12}")
+    for name, fn in (("legacy", legacy_path), ("batch", batch_path)):
+        cpu, peak, blocks = measure(fn, items)
+        print(f"{name:<10} {cpu * 1000 * 1000 / N_REPOS:>10.2f} {peak / 1024:>10.1f} {blocks:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+## how long until an api worker can serve reads
+## run from the repo root:
+##   python -m bench.bench_startup            import time of api (python -X importtime), slowest modules
+##   python -m bench.bench_startup --serve    also start uvicorn and time the first 200 from /stats (needs the db)
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+RUNS = 5
+
+
+def import_times(module):
+    """{module: (self_us, cumulative_us)} from one fresh `python -X importtime -c 'import module'`"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr)
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_read(timeout=30):
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise SystemExit("api did not serve /stats in time")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="api startup time")
+    parser.add_argument("--module", default="api")
+    parser.add_argument("--serve", action="store_true", help="also time uvicorn start to first /stats response")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(RUNS)]
+    totals = [run[args.module][1] / 1000 for run in runs]
+    print(f"import {args.module}: median {statistics.median(totals):.0f} ms over {RUNS} runs "
+          f"(min {min(totals):.0f}, max {max(totals):.0f})")
+
+    print("slowest modules by cumulative time (last run):")
+    last = runs[-1]
+    top_level = [(name, cum) for name, (_, cum) in last.items() if name != args.module]
+    for name, cumulative_us in sorted(top_level, key=lambda item: -item[1])[:10]:
+        print(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+
+    if args.serve:
+        ready = [time_to_first_read() for _ in range(3)]
+        print(f"uvicorn start -> first /stats 200: median {statistics.median(ready) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
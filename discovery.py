@@ -16,12 +16,37 @@ import gzip
 
 
 import helpers.db_helper as db_helper
+from helpers.sketches import ActivityFilter, BloomFilter
+from helpers.token_bucket import RateLimiter
+
+##only queue repos with at least this many events across hours seen (estimated), 0 queues every repo
+DISCOVERY_MIN_ACTIVITY = int(os.getenv("DISCOVERY_MIN_ACTIVITY", 0))
+##halve the filter's counts every this many archive hours so old activity fades
+DISCOVERY_ACTIVITY_HALF_LIFE_HOURS = int(os.getenv("DISCOVERY_ACTIVITY_HALF_LIFE_HOURS", 168))
+
+##downloads are read in chunks of this size so DISCOVERY_MAX_BYTES_PER_SECOND can pace them
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+##the known-repos bloom filter is sized for twice the queue, and never less than this
+KNOWN_REPOS_MIN_CAPACITY = 1_000_000
+
+##event types whose actors get their own distinct count, every event also counts towards 'actors'
+##(pushers aren't here, repo_push_activity already counts them exactly)
+ACTOR_EVENT_CLASSES = {
+    'WatchEvent': 'stargazers',
+    'IssuesEvent': 'issue_authors',
+}
 
 class Discovery:
     def __init__(self, MAX_CONCURRENCY=5):
         self.db_helper = db_helper.DBHelper()
         self.base_url = "https://data.gharchive.org"
         self.semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        ##DISCOVERY_MAX_REQUESTS_PER_SECOND / DISCOVERY_MAX_BYTES_PER_SECOND toward gharchive
+        self.limiter = RateLimiter.from_env("DISCOVERY")
+        self.activity_filter = None
+        self.known_repos = None
+        self.known_repos_task = None
 
 
     ##compute all the gh_archieve links and store it in json and use it as source of truth
@@ -40,7 +65,76 @@ class Discovery:
 
     async def setup(self):
         await self.db_helper.connect()
+        self.db_helper.start_metrics_reporter()
         print("✅ Database connected")
+        print(f"✅ gharchive downloads: {self.limiter.describe()}")
+        await self.start_known_repos()
+
+        if DISCOVERY_MIN_ACTIVITY > 0:
+            self.activity_filter = ActivityFilter(DISCOVERY_MIN_ACTIVITY, DISCOVERY_ACTIVITY_HALF_LIFE_HOURS)
+            state = await self.db_helper.load_activity_filter_state()
+            if state:
+                self.activity_filter.restore(state['sketch'], state['heavy_hitters'], state['hours'])
+            print(f"✅ Queueing repos with >= {DISCOVERY_MIN_ACTIVITY} events ({self.activity_filter.hours} hours of history)")
+
+    ##repo ids already in repo_queue, so their counts go out as one array UPDATE instead of upserts.
+    ##seeding runs in the background: until it's done unknown repos just take the upsert path
+    async def start_known_repos(self):
+        queue_size = await self.db_helper.get_repo_queue_size()
+        self.known_repos = BloomFilter(max(2 * queue_size, KNOWN_REPOS_MIN_CAPACITY))
+        self.known_repos_task = asyncio.create_task(self.seed_known_repos(self.known_repos))
+
+    async def seed_known_repos(self, known_repos):
+        start = datetime.now()
+        async for repo_ids in self.db_helper.iter_queued_repo_ids():
+            known_repos.update(repo_ids)
+        print(f"✅ Seeded {known_repos.count} known repos in {(datetime.now() - start).total_seconds():.1f}s "
+              f"({len(known_repos.array) // 1024 // 1024} MiB)")
+
+    ##persist the filter so a restart doesn't forget which repos were getting close
+    async def save_activity_filter(self):
+        if self.activity_filter is None:
+            return
+        await self.db_helper.save_activity_filter_state(self.activity_filter)
+        f = self.activity_filter
+        if f.seen:
+            print(f"  🧮 Queued {f.admitted}/{f.seen} repo-hours ({f.admitted / f.seen:.1%}), "
+                  f"heaviest: {[repo_id for repo_id, _, _ in f.heavy_hitters.top(5)]}")
+
+    ##push events give us commit counts and pushers for free, no need to ask graphql for history
+    def count_push_event(self, push_activity, event):
+        payload = event.get('payload') or {}
+        commits = payload.get('size')
+        if commits is None:
+            commits = len(payload.get('commits') or [])
+
+        key = (event['repo']['id'], event['created_at'][:10])
+        if key not in push_activity:
+            push_activity[key] = {
+                'commits': 0,
+                'pushes': 0,
+                'pushers': set()
+            }
+        push_activity[key]['commits'] += commits
+        push_activity[key]['pushes'] += 1
+        push_activity[key]['pushers'].add(event['actor']['id'])
+
+    ##archive files are named YYYY-MM-DD-H.json.gz, one per hour
+    def archive_hour(self, filename):
+        return datetime.strptime(filename.split('.')[0], '%Y-%m-%d-%H')
+
+    ##distinct actors per repo and day, the db folds them into hyperloglog sketches
+    def count_actor(self, actor_activity, event):
+        key = (event['repo']['id'], event['created_at'][:10])
+        classes = actor_activity.setdefault(key, {})
+        actor_id = event['actor']['id']
+        classes.setdefault('actors', set()).add(actor_id)
+
+        event_class = ACTOR_EVENT_CLASSES.get(event['type'])
+        if event_class == 'issue_authors' and (event.get('payload') or {}).get('action') != 'opened':
+            return
+        if event_class:
+            classes.setdefault(event_class, set()).add(actor_id)
 
     async def fetch_url_and_download(self, url):
         filename = url.split('/')[-1]
@@ -49,17 +143,24 @@ class Discovery:
                 async with self.semaphore:
                     async with aiohttp.ClientSession() as session:
                         print(f"[Semaphore acquired] Downloading {url}")
+                        await self.limiter.acquire(requests=1)
                         async with session.get(url) as resp:
                             if resp.status != 200:
                                 print(f"✗ {filename}: {resp.status}")
                                 return
-                            compressed_data = await resp.read()
-                            decompressed_data = gzip.decompress(compressed_data).decode('utf-8')
+                            ##not reading ahead of the byte budget lets tcp flow control slow the sender
+                            compressed_data = bytearray()
+                            async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                                await self.limiter.acquire(bytes=len(chunk))
+                                compressed_data += chunk
                             decompressed_data = gzip.decompress(compressed_data).decode('utf-8')
 
                             repo_activity = {}
+                            push_activity = {}
+                            actor_activity = {}
 
-                            for line in decompressed_data.splitlines('\n'):
+                            ##one event per line. not splitlines(): it also breaks on \u2028 etc inside event json
+                            for line in decompressed_data.split('\n'):
                                 if not line:
                                     continue
 
@@ -73,12 +174,27 @@ class Discovery:
                                             'count': 0
                                         }
                                     repo_activity[repo_id]['count'] += 1
+
+                                    if event['type'] == 'PushEvent':
+                                        self.count_push_event(push_activity, event)
+                                    self.count_actor(actor_activity, event)
                                 except:
                                     continue
                         
                         #TODO:save to db
-                        await self.db_helper.save_repo_id_to_queue(repo_activity)
+                        queued = self.activity_filter.admit(repo_activity) if self.activity_filter else repo_activity
+                        await self.db_helper.save_repo_id_to_queue(queued, self.known_repos)
+                        self.known_repos.update(queued)
+                        await self.db_helper.save_push_activity(push_activity, self.archive_hour(filename))
+                        if self.activity_filter:
+                            ##sketches are only read for queued repos, prune_actor_sketches drops the ones never processed
+                            actor_activity = {key: classes for key, classes in actor_activity.items() if key[0] in queued}
+                        await self.db_helper.save_actor_sketches(actor_activity)
+                        await self.db_helper.save_hourly_activity(self.archive_hour(filename), repo_activity)
                         await self.db_helper.mark_url_done(url)
+                        if self.activity_filter:
+                            ##only now: an attempt that failed above is retried and must not count twice
+                            self.activity_filter.record(repo_activity, queued)
                         print(f"  Found {len(repo_activity)} repos")
 
                         return len(repo_activity)
@@ -112,6 +228,15 @@ async def main():
         print(f"✅ Processed {len(results)} URLs")
         print(f"✅ Pending URLs: {len(await discovery.db_helper.get_pending_urls(limit=1))}")
         print(f"✅ Total URLs: {len(await discovery.db_helper.get_pending_urls())}")
+        await discovery.save_activity_filter()
+        if discovery.known_repos.saturated:
+            print("📝 Known repos filter is full, rebuilding it larger")
+            discovery.known_repos_task.cancel()
+            await discovery.start_known_repos()
+        await discovery.db_helper.prune_push_activity()
+        await discovery.db_helper.prune_actor_sketches()
+        await discovery.db_helper.prune_hourly_activity()
+        await discovery.db_helper.refresh_trending_leaderboards()
         await asyncio.sleep(1)
 
 if __name__ == "__main__":
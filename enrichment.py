@@ -0,0 +1,167 @@
+## second, low priority lane for the expensive graphql fields
+## dependency graphs and contributor lists cost a lot of points,
+## so they get their own queue, their own slice of the hourly budget and their own refresh cadence
+## the core lane in processor.py always goes first and this lane only spends what is left over
+
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+
+ENRICHMENT_QUERY = """
+query ($owner: String!, $name: String!) {
+  rateLimit { cost }
+  repository(owner: $owner, name: $name) {
+    mentionableUsers(first: 100) {
+      totalCount
+      nodes { login }
+    }
+    dependencyGraphManifests(first: 20) {
+      nodes {
+        filename
+        dependencies(first: 100) {
+          nodes { packageName requirements }
+        }
+      }
+    }
+  }
+}
+"""
+
+RATE_LIMIT_PER_HOUR = 5000
+ENRICHMENT_BUDGET_SHARE = 0.2  # share of the hourly points this lane may spend
+CORE_RESERVE = 1000  # never dip below this many remaining points, they belong to the core lane
+ENRICHMENT_BATCH_SIZE = 5
+ENRICHMENT_MAX_CON = 2
+
+
+class EnrichmentLane:
+    def __init__(self, processor):
+        ##share the session, db pool and rate limit view with the core lane
+        self.processor = processor
+        self.db_helper = processor.db_helper
+        self.semaphore = asyncio.Semaphore(ENRICHMENT_MAX_CON)
+
+        self.budget = int(RATE_LIMIT_PER_HOUR * ENRICHMENT_BUDGET_SHARE)
+        self.points_spent = 0
+        self.budget_window_reset = None
+
+    def _has_budget(self):
+        # the rate limit window rolled over, start a fresh allowance
+        if self.processor.rate_limit_reset != self.budget_window_reset:
+            self.budget_window_reset = self.processor.rate_limit_reset
+            self.points_spent = 0
+
+        return (
+            self.points_spent < self.budget
+            and self.processor.remaining_requests > CORE_RESERVE
+        )
+
+    async def fetch_enrichment(self, repo_id, owner, name):
+        async with self.semaphore:
+            headers = {
+                "Authorization": f"Bearer {GITHUB_TOKEN}",
+                "Content-Type": "application/json",
+                # dependency graph still needs the preview media type on some installs
+                "Accept": "application/vnd.github.hawkgirl-preview+json",
+            }
+            await self.processor.limiter.acquire(requests=1)
+            response = await self.processor.session.post(
+                GRAPHQL_URL,
+                json={"query": ENRICHMENT_QUERY, "variables": {"owner": owner, "name": name}},
+                headers=headers,
+            )
+
+            if response.status != 200:
+                print(f"❌ Enrichment {repo_id}: HTTP {response.status}")
+                return None
+
+            await self.processor._update_rate_limit(response)
+
+            await self.processor.limiter.acquire(bytes=len(await response.read()))
+            data = await response.json()
+
+            if "data" not in data or data["data"] is None:
+                return None
+
+            rate_limit = data["data"].get("rateLimit") or {}
+            self.points_spent += rate_limit.get("cost", 1)
+
+            return data["data"]["repository"]
+
+    ##repo_languages belongs to the core lane, its query has totalSize for the percentages
+    def parse_enrichment_data(self, repo_data):
+        users = repo_data.get("mentionableUsers") or {}
+        contributors = [node["login"] for node in users.get("nodes", []) or []]
+
+        dependencies = []
+        for manifest in (repo_data.get("dependencyGraphManifests") or {}).get("nodes", []) or []:
+            for dep in (manifest.get("dependencies") or {}).get("nodes", []) or []:
+                dependencies.append(
+                    {
+                        "package": dep["packageName"],
+                        "requirements": dep.get("requirements", ""),
+                        "manifest": manifest["filename"],
+                    }
+                )
+
+        return {
+            "contributors": contributors,
+            "contributors_count": users.get("totalCount", len(contributors)),
+            "dependencies": dependencies,
+        }
+
+    async def process_batch(self, batch_size=ENRICHMENT_BATCH_SIZE):
+        """Run one enrichment batch if the lane has budget. Returns how many repos were enriched."""
+        if not self._has_budget():
+            return 0
+
+        # cap the batch so a single round can't blow through the lane's allowance
+        batch_size = min(batch_size, self.budget - self.points_spent)
+        repos = await self.db_helper.claim_enrichment_batch(batch_size)
+        if not repos:
+            return 0
+
+        tasks = []
+        valid_repos = []
+        for repo in repos:
+            parts = repo["repo_name"].split("/")
+            if len(parts) != 2:
+                continue
+            owner, name = parts
+            tasks.append(self.fetch_enrichment(repo["repo_id"], owner, name))
+            valid_repos.append(repo)
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        enriched_data_list = []
+        for repo, result in zip(valid_repos, results):
+            if isinstance(result, Exception):
+                print(f"❌ Error enriching {repo['repo_name']} (expensive lane): {result}")
+                continue
+            if result is None:
+                continue
+            try:
+                enriched_data_list.append(
+                    {
+                        "repo_id": repo["repo_id"],
+                        "parsed_data": self.parse_enrichment_data(result),
+                    }
+                )
+            except Exception as e:
+                print(f"❌ Error parsing enrichment for {repo['repo_id']}: {e}")
+
+        if enriched_data_list:
+            await self.db_helper.save_repo_enrichment(enriched_data_list)
+
+        print(
+            f"Enrichment lane: {len(enriched_data_list)}/{len(repos)} repos, "
+            f"{self.points_spent}/{self.budget} points spent this window"
+        )
+        return len(enriched_data_list)
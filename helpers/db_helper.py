@@ -1,220 +1,908 @@
 import asyncpg
+import base64
+import json
 import os
+import re
+import time
 
 from dotenv import load_dotenv
 load_dotenv()
 import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+from helpers.db_metrics import InstrumentedConnection, QueryMetrics, now_ms
+from helpers.migrations import check_schema_version
+from helpers.repo_parser import RepoBatch
+from helpers.sketches import HyperLogLog
+
+# rolling window for commit/push counts derived from gh archive PushEvents
+PUSH_ACTIVITY_WINDOW_DAYS = 30
+
+# column order of RepoBatch.repos rows
+REPO_STAGING_COLUMNS = (
+    'repo_id', 'repo_name', 'stars', 'forks', 'open_issues', 'closed_issues', 'subscribers',
+    'commits_last_30_days', 'pushes_last_30_days', 'pushers_last_30_days', 'activity_score'
+)
+
+# columns clients may ask for with fields=
+REPO_COLUMNS = (
+    'id', 'repo_id', 'repo_name', 'stars', 'forks', 'open_issues', 'closed_issues', 'subscribers',
+    'commits_last_30_days', 'pushes_last_30_days', 'pushers_last_30_days', 'contributors_count',
+    'actors_last_30_days', 'stargazers_last_30_days', 'issue_authors_last_30_days',
+    'activity_score', 'enriched_at', 'updated_at'
+)
+
+# serializes read-merge-write of one day's actor sketches, second key is the day's ordinal
+ACTOR_SKETCH_LOCK_ID = 7_351_904
+# days of sketches kept for a repo the processor hasn't saved yet, the rest of its window is dropped
+ACTOR_SKETCH_UNPROCESSED_DAYS = int(os.getenv("ACTOR_SKETCH_UNPROCESSED_DAYS", 7))
+# repos columns filled from the actor sketches, by event class
+ENGAGEMENT_COLUMNS = {
+    'actors': 'actors_last_30_days',
+    'stargazers': 'stargazers_last_30_days',
+    'issue_authors': 'issue_authors_last_30_days',
+}
+
+# serializes writers of the trending windows, they have to advance in one order
+TRENDING_LOCK_ID = 7_351_903
+# rows per precomputed leaderboard, and the least events a repo needs in a window to rank at all
+TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", 100))
+TRENDING_MIN_EVENTS = int(os.getenv("TRENDING_MIN_EVENTS", 3))
+
+# child tables /repos/batch can fold into each repo
+REPO_BATCH_INCLUDES = ('languages', 'topics')
+
+# metrics snapshotted into repo_metrics_history
+HISTORY_METRICS = ('stars', 'forks', 'open_issues', 'closed_issues')
+
+# how often the expensive enrichment lane revisits a repo
+ENRICHMENT_REFRESH_INTERVAL = timedelta(days=7)
+
+# guard rails for execute_query (LLM generated / ad-hoc SQL)
+ADHOC_STATEMENT_TIMEOUT_MS = int(os.getenv("ADHOC_STATEMENT_TIMEOUT_MS", 5000))
+ADHOC_WORK_MEM = os.getenv("ADHOC_WORK_MEM", "16MB")
+ADHOC_MAX_COST = float(os.getenv("ADHOC_MAX_COST", 1_000_000))
+ADHOC_MAX_PLAN_ROWS = float(os.getenv("ADHOC_MAX_PLAN_ROWS", 50_000_000))
+
+# optional read replica (DB_READ_DSN): read-only methods go there while it's within the lag bound
+READ_MAX_LAG_SECONDS = float(os.getenv("DB_READ_MAX_LAG_SECONDS", 5))
+READ_LAG_CHECK_INTERVAL = float(os.getenv("DB_READ_LAG_CHECK_INTERVAL", 1))
+READ_RETRY_AFTER_SECONDS = float(os.getenv("DB_READ_RETRY_AFTER_SECONDS", 30))
+# after a data_generation bump, read from the primary this long so caches don't fill from a replica
+# that hasn't replayed the commit yet
+READ_AFTER_WRITE_SECONDS = float(os.getenv("DB_READ_AFTER_WRITE_SECONDS", 1))
+# a replica that has replayed everything it received isn't behind, even if the primary was idle.
+# >= because after a restart the receive position restarts at the segment boundary
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_replay_lsn() >= pg_last_wal_receive_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+# errors that mean the replica is gone rather than that the query was bad
+REPLICA_DOWN_ERRORS = (
+    OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError, asyncpg.AdminShutdownError, asyncpg.CrashShutdownError,
+)
+
+def _window_start(days=PUSH_ACTIVITY_WINDOW_DAYS):
+    """First day of a rolling window of `days` days ending today. Writes, reads and prunes
+    all bind this date, so they agree on the window and only the app clock decides it."""
+    return date.today() - timedelta(days=days - 1)
+
+
+def _rows_affected(status):
+    """Row count from an asyncpg status string like 'INSERT 0 3' or 'DELETE 2'."""
+    try:
+        return int(status.rsplit(' ', 1)[-1])
+    except (AttributeError, ValueError):
+        return 0
+
+
+def _repo_projection(fields):
+    """Column list for a fields= projection. repo_id and stars always come along for the cursor."""
+    if not fields:
+        return '*'
+    unknown = [field for field in fields if field not in REPO_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    columns = ['repo_id', 'stars'] + [field for field in fields if field not in ('repo_id', 'stars')]
+    return ', '.join(columns)
+
+
+def _max_plan_rows(plan):
+    """Largest row estimate of any node in an EXPLAIN (FORMAT JSON) plan, catches cross joins under a LIMIT"""
+    return max([plan.get('Plan Rows', 0)] + [_max_plan_rows(child) for child in plan.get('Plans', ())])
+
+
+# a quoted literal or identifier (kept as is), or a comment (dropped)
+SQL_COMMENT = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|--[^\n]*|/\*.*?\*/""", re.DOTALL)
+
+
+def _strip_sql_comments(sql):
+    """Generated SQL without comments or trailing semicolons, so it can be wrapped in a subquery"""
+    sql = SQL_COMMENT.sub(lambda m: m.group(1) or ' ', sql)
+    return sql.strip().rstrip(';').strip()
+
+
+def encode_repo_cursor(stars, repo_id):
+    return base64.urlsafe_b64encode(f"{stars}:{repo_id}".encode()).decode().rstrip('=')
+
+
+def decode_repo_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        stars, repo_id = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+        return int(stars), int(repo_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
 class DBHelper:
-    def __init__(self):
+    def __init__(self, read_dsn=None):
         self.pool = None
+        # execute_query only, capped so ad-hoc queries can't take connections from the writers
+        self.adhoc_pool = None
+        # same two pools against the replica, only when a read dsn is configured
+        self.read_dsn = read_dsn or os.getenv("DB_READ_DSN")
+        self.read_pool = None
+        self.adhoc_read_pool = None
+        self._replica_lag = 0.0
+        self._replica_checked_at = 0.0
+        self._replica_down_until = 0.0
+        self._primary_reads_until = 0.0
+        self.metrics = QueryMetrics()
+        self._metrics_partition_month = None
+        self._metrics_reporter = None
+        # LISTEN data_generation session and the task that replaces it when it drops
+        self._generation_listener = None
+        self._generation_relisten = None
 
-    async def connect(self):
-        self.pool = await asyncpg.create_pool(
+    def _connection_settings(self):
+        return dict(
             host=os.getenv("DB_HOST"),
             port=os.getenv("DB_PORT"),
             user=os.getenv("DB_USER"),
             password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME")
+            database=os.getenv("DB_NAME"),
         )
 
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                """
-                ALTER TABLE repo_queue ADD COLUMN IF NOT EXISTS processed BOOLEAN DEFAULT FALSE;
-
-                -- Create repos table ONLY if it doesn't exist
-                CREATE TABLE IF NOT EXISTS repos (
-                    id SERIAL PRIMARY KEY,
-                    repo_id BIGINT UNIQUE NOT NULL,
-                    repo_name TEXT,
-                    stars INTEGER DEFAULT 0,
-                    forks INTEGER DEFAULT 0,
-                    open_issues INTEGER DEFAULT 0,
-                    closed_issues INTEGER DEFAULT 0,
-                    subscribers INTEGER DEFAULT 0,
-                    commits_last_30_days INTEGER DEFAULT 0,
-                    contributors_count INTEGER DEFAULT 0,
-                    activity_score INTEGER,
-                    enriched_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-                
-                -- Add any missing columns (for schema migrations)
-                DO $$ 
-                BEGIN
-                    -- Add columns that might be missing (idempotent)
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                   WHERE table_name='repos' AND column_name='subscribers') THEN
-                        ALTER TABLE repos ADD COLUMN subscribers INTEGER DEFAULT 0;
-                    END IF;
-                    
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                   WHERE table_name='repos' AND column_name='commits_last_30_days') THEN
-                        ALTER TABLE repos ADD COLUMN commits_last_30_days INTEGER DEFAULT 0;
-                    END IF;
-                    
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                   WHERE table_name='repos' AND column_name='contributors_count') THEN
-                        ALTER TABLE repos ADD COLUMN contributors_count INTEGER DEFAULT 0;
-                    END IF;
-                    
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                   WHERE table_name='repos' AND column_name='activity_score') THEN
-                        ALTER TABLE repos ADD COLUMN activity_score INTEGER;
-                    END IF;
-                    
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                   WHERE table_name='repos' AND column_name='enriched_at') THEN
-                        ALTER TABLE repos ADD COLUMN enriched_at TIMESTAMP DEFAULT NOW();
-                    END IF;
-                    
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                   WHERE table_name='repos' AND column_name='updated_at') THEN
-                        ALTER TABLE repos ADD COLUMN updated_at TIMESTAMP DEFAULT NOW();
-                    END IF;
-                END $$;
-                """
-            )
+    def _pool_settings(self):
+        # asyncpg keeps a per-connection cache of prepared statements keyed by query text,
+        # so every fixed query string below is parsed and planned once per connection
+        return dict(
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", 256)),
+            max_cached_statement_lifetime=int(os.getenv("DB_STATEMENT_CACHE_LIFETIME", 3600)),
+            max_inactive_connection_lifetime=float(os.getenv("DB_POOL_MAX_IDLE", 300)),
+        )
 
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                """CREATE TABLE IF NOT EXISTS repo_activity (
-                    id SERIAL PRIMARY KEY,
-                    repo_id BIGINT UNIQUE,
-                    repo_name TEXT,
-                    activity_count INTEGER
-                )"""
-            )
+    def _adhoc_pool_settings(self):
+        return dict(
+            min_size=0,
+            max_size=int(os.getenv("DB_ADHOC_POOL_MAX_SIZE", 2)),
+            # generated SQL is mostly one-off text, no point caching its plans
+            statement_cache_size=0,
+            max_inactive_connection_lifetime=float(os.getenv("DB_POOL_MAX_IDLE", 300)),
+        )
 
-            await conn.execute(
-                """CREATE TABLE IF NOT EXISTS repo_queue (
-                    id SERIAL PRIMARY KEY,
-                    repo_id BIGINT UNIQUE,
-                    repo_name TEXT,
-                    activity_count INTEGER
-                )"""
-            )
+    async def connect(self):
+        self.pool = await asyncpg.create_pool(**self._connection_settings(), **self._pool_settings())
+        self.adhoc_pool = await asyncpg.create_pool(**self._connection_settings(), **self._adhoc_pool_settings())
+
+        if self.read_dsn:
+            # min_size=0: nothing connects yet, so a replica that's down doesn't block startup,
+            # the lag check in _pick_read_pool finds out and we read from the primary meanwhile
+            self.read_pool = await asyncpg.create_pool(self.read_dsn, **{**self._pool_settings(), 'min_size': 0})
+            self.adhoc_read_pool = await asyncpg.create_pool(self.read_dsn, **self._adhoc_pool_settings())
+
+        # DDL lives in helpers/migrations.py now, startup only checks the version
+        async with self.pool.acquire() as conn:
+            await check_schema_version(conn)
 
-            await conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS url_queue(
-                    id SERIAL PRIMARY KEY,
-                    url TEXT UNIQUE NOT NULL,
-                    done BOOLEAN DEFAULT FALSE,
-                    scraped_at TIMESTAMP,   
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    @asynccontextmanager
+    async def acquire(self, name, pool=None):
+        """
+        Pool acquire that records pool wait, latency and rows under a short statement name.
+        Use it instead of self.pool.acquire() so every call shows up in self.metrics.
+        """
+        start = now_ms()
+        async with (pool or self.pool).acquire() as conn:
+            acquired = now_ms()
+            instrumented = InstrumentedConnection(conn)
+            error = False
+            try:
+                yield instrumented
+            except Exception:
+                error = True
+                raise
+            finally:
+                self.metrics.record(
+                    name,
+                    elapsed_ms=now_ms() - acquired,
+                    pool_wait_ms=acquired - start,
+                    rows=instrumented.rows,
+                    error=error
                 )
-                """
-            )
 
-            await conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_url_queue_done ON url_queue(done)"
-            )
-            await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_url_queue_url ON url_queue(url)"
-            )
-            await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_url_queue_scraped_at ON url_queue(scraped_at)"
-            )
-            await conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_url_queue_created_at ON url_queue(created_at)"
-            )
+    @asynccontextmanager
+    async def acquire_read(self, name, adhoc=False):
+        """
+        acquire() for read-only methods: the replica when one is configured, up and within
+        DB_READ_MAX_LAG_SECONDS, the primary otherwise. Replica calls are recorded as name@replica.
+        """
+        primary = self.adhoc_pool if adhoc else self.pool
+        replica = self.adhoc_read_pool if adhoc else self.read_pool
+        pool = await self._pick_read_pool(primary, replica)
+        if pool is primary:
+            async with self.acquire(name, pool=pool) as conn:
+                yield conn
+            return
 
-        # Create related tables (languages, topics, dependencies) - repos table must exist first
-        async with self.pool.acquire() as conn:
-            # Drop enriched_repos table if it exists (we're using repos now)
-            await conn.execute("DROP TABLE IF EXISTS enriched_repos CASCADE;")
+        handed_out = False
+        try:
+            async with self.acquire(f"{name}@replica", pool=pool) as conn:
+                handed_out = True
+                yield conn
+            return
+        except REPLICA_DOWN_ERRORS as e:
+            # following calls go to the primary until the retry window passes
+            self._mark_replica_down(e)
+            if handed_out:
+                # the caller's body already ran on the replica, it can't be replayed from here
+                raise
 
-            # Languages table (many-to-many with repos)
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS repo_languages (
-                    id SERIAL PRIMARY KEY,
-                    repo_id BIGINT NOT NULL,
-                    language_name TEXT NOT NULL,
-                    size_bytes BIGINT,
-                    percentage NUMERIC(5, 2),
-                    FOREIGN KEY (repo_id) REFERENCES repos(repo_id) ON DELETE CASCADE,
-                    UNIQUE(repo_id, language_name)
+        # the replica failed before we had a connection, this call can still use the primary
+        async with self.acquire(name, pool=primary) as conn:
+            yield conn
+
+    async def _pick_read_pool(self, primary, replica):
+        if replica is None:
+            return primary
+        now = time.monotonic()
+        if now < self._replica_down_until or now < self._primary_reads_until:
+            return primary
+
+        if now - self._replica_checked_at >= READ_LAG_CHECK_INTERVAL:
+            # set before awaiting so concurrent callers don't all run the check
+            self._replica_checked_at = now
+            try:
+                async with self.read_pool.acquire(timeout=1) as conn:
+                    self._replica_lag = float(await conn.fetchval(REPLICA_LAG_SQL, timeout=1))
+            except REPLICA_DOWN_ERRORS as e:
+                self._mark_replica_down(e)
+                return primary
+
+        if self._replica_lag > READ_MAX_LAG_SECONDS:
+            return primary
+        return replica
+
+    def _mark_replica_down(self, error=None):
+        self._replica_down_until = time.monotonic() + READ_RETRY_AFTER_SECONDS
+        # re-check as soon as the window is over
+        self._replica_checked_at = 0.0
+        print(f"⚠️  Read replica unavailable, reading from the primary for {READ_RETRY_AFTER_SECONDS:.0f}s"
+              + (f": {error!r}" if error else ""))
+
+    def read_from_primary_for(self, seconds):
+        """Read-your-writes window: call after a commit whose results must be visible right away"""
+        self._primary_reads_until = max(self._primary_reads_until, time.monotonic() + seconds)
+
+    def replica_status(self):
+        if self.read_pool is None:
+            return None
+        now = time.monotonic()
+        return {
+            "up": now >= self._replica_down_until,
+            "lag_seconds": round(self._replica_lag, 3),
+            "max_lag_seconds": READ_MAX_LAG_SECONDS,
+            "primary_reads_for": round(max(0.0, self._primary_reads_until - now), 3),
+        }
+
+    def start_metrics_reporter(self, interval=None):
+        """Log a statement summary every `interval` seconds (DB_METRICS_LOG_INTERVAL, 0 disables)."""
+        if interval is None:
+            interval = int(os.getenv("DB_METRICS_LOG_INTERVAL", 300))
+        if interval <= 0 or self._metrics_reporter is not None:
+            return
+        self._metrics_reporter = asyncio.create_task(self.metrics.report_periodically(interval))
+
+    async def close(self):
+        if self._metrics_reporter is not None:
+            self._metrics_reporter.cancel()
+            self._metrics_reporter = None
+        if self._generation_relisten is not None:
+            self._generation_relisten.cancel()
+            self._generation_relisten = None
+        # cleared first so our own close doesn't look like a dropped session
+        listener, self._generation_listener = self._generation_listener, None
+        if listener is not None:
+            await listener.close()
+        for attr in ('adhoc_read_pool', 'read_pool', 'adhoc_pool', 'pool'):
+            pool = getattr(self, attr)
+            if pool is not None:
+                await pool.close()
+                setattr(self, attr, None)
+
+    async def save_repo_id_to_queue(self, repo_activity, known_repo_ids=None):
+        """
+        Add one archive hour's repos to repo_queue, or bump their activity_count.
+
+        Args:
+            repo_activity: {repo_id: {'name': str, 'count': int}}
+            known_repo_ids: optional container (Discovery's bloom filter) of repo ids
+                already queued. Those only get an array UPDATE of their counts, with no
+                insert attempt or conflict handling. Any the UPDATE didn't find (a
+                false positive) fall through to the insert like every new repo.
+        """
+        if not repo_activity:
+            return
+
+        BATCH_SIZE = 5000
+        rows = sorted(repo_activity.items())
+        inserted = updated = 0
+        for i in range(0, len(rows), BATCH_SIZE):
+            batch = rows[i:i + BATCH_SIZE]
+            for attempt in range(3):
+                try:
+                    batch_inserted, batch_updated = await self._save_queue_batch(batch, known_repo_ids)
+                    break
+                except asyncpg.exceptions.DeadlockDetectedError:
+                    if attempt == 2:
+                        raise
+                    await asyncio.sleep(2 * (attempt + 1)) ##backoff
+            inserted += batch_inserted
+            updated += batch_updated
+
+        print(f"  💾 Queued {inserted} new repos, bumped {updated} known ones")
+
+    async def _save_queue_batch(self, batch, known_repo_ids):
+        known = []
+        new = []
+        for repo_id, data in batch:
+            (known if known_repo_ids is not None and repo_id in known_repo_ids else new).append((repo_id, data))
+
+        async with self.acquire('save_repo_id_to_queue') as conn:
+            async with conn.transaction():
+                updated = 0
+                if known:
+                    # the join below locks rows in whatever order the plan visits them, take the
+                    # locks in repo_id order first so overlapping hours can't deadlock each other
+                    await conn.execute("""
+                        SELECT 1 FROM repo_queue
+                        WHERE repo_id = ANY($1::bigint[])
+                        ORDER BY repo_id
+                        FOR UPDATE
+                    """, [repo_id for repo_id, _ in known])
+                    found = await conn.fetch("""
+                        UPDATE repo_queue q
+                        SET activity_count = q.activity_count + v.count
+                        FROM unnest($1::bigint[], $2::int[]) AS v(repo_id, count)
+                        WHERE q.repo_id = v.repo_id
+                        RETURNING q.repo_id
+                    """, [repo_id for repo_id, _ in known], [data['count'] for _, data in known])
+                    updated = len(found)
+                    if updated < len(known):
+                        found = {row['repo_id'] for row in found}
+                        new.extend(row for row in known if row[0] not in found)
+                        new.sort(key=lambda row: row[0])
+
+                inserted = 0
+                if new:
+                    # still an upsert, another hour (or a repo the bloom filter hasn't seen yet)
+                    # may already be queued; xmax is only 0 on rows this statement inserted
+                    rows = await conn.fetch("""
+                        INSERT INTO repo_queue (repo_id, repo_name, activity_count)
+                        SELECT * FROM unnest($1::bigint[], $2::text[], $3::int[])
+                        ON CONFLICT (repo_id) DO UPDATE
+                        SET activity_count = repo_queue.activity_count + EXCLUDED.activity_count
+                        RETURNING repo_id, xmax = 0 AS inserted
+                    """, [repo_id for repo_id, _ in new], [data['name'] for _, data in new],
+                        [data['count'] for _, data in new])
+                    inserted = sum(row['inserted'] for row in rows)
+                    updated += len(rows) - inserted
+
+                return inserted, updated
+
+    async def get_repo_queue_size(self):
+        """Upper bound on repo_queue rows from its serial id, much cheaper than COUNT(*)"""
+        async with self.acquire('get_repo_queue_size') as conn:
+            return await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM repo_queue")
+
+    async def iter_queued_repo_ids(self, batch_size=50_000):
+        """Every repo_id in repo_queue, in lists of batch_size through a server-side cursor"""
+        async with self.acquire('iter_queued_repo_ids') as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor("SELECT repo_id FROM repo_queue")
+                while rows := await cursor.fetch(batch_size):
+                    yield [row['repo_id'] for row in rows]
+
+    async def save_push_activity(self, push_activity, hour):
+        """
+        Merge one archive hour's per-day PushEvent counts into repo_push_activity.
+        The hour is recorded in the same transaction, so replaying it is a no-op.
+        Returns False if the hour was already saved.
+
+        Args:
+            push_activity: Dict keyed by (repo_id, 'YYYY-MM-DD') with
+                commits, pushes and a set of pusher actor ids.
+            hour: datetime of the archive hour the counts come from
+        """
+        oldest_day = _window_start()
+        values = []
+        for (repo_id, day), data in sorted(push_activity.items()):
+            day = date.fromisoformat(day)
+            ##anything older than the window would be pruned right away
+            if day < oldest_day:
+                continue
+            values.append((repo_id, day, data['commits'], data['pushes'], list(data['pushers'])))
+
+        if not values:
+            return True
+
+        async with self.acquire('save_push_activity') as conn:
+            async with conn.transaction():
+                recorded = await conn.fetchval("""
+                    INSERT INTO push_activity_hours (hour) VALUES ($1)
+                    ON CONFLICT DO NOTHING
+                    RETURNING hour
+                """, hour)
+                if recorded is None:
+                    print(f"  ⏭️  Push activity for {hour} already saved")
+                    return False
+
+                await conn.executemany("""
+                    INSERT INTO repo_push_activity (repo_id, day, commits, pushes, pusher_ids)
+                    VALUES ($1, $2, $3, $4, $5)
+                    ON CONFLICT (repo_id, day) DO UPDATE SET
+                        commits = repo_push_activity.commits + EXCLUDED.commits,
+                        pushes = repo_push_activity.pushes + EXCLUDED.pushes,
+                        pusher_ids = ARRAY(
+                            SELECT DISTINCT unnest(repo_push_activity.pusher_ids || EXCLUDED.pusher_ids)
+                        )
+                """, values)
+                print(f"  💾 Saved push activity for {len(values)} repo-days")
+                return True
+
+    async def get_push_activity(self, repo_ids):
+        """Commit/push counts and distinct pushers over the rolling window, keyed by repo_id"""
+        if not repo_ids:
+            return {}
+
+        async with self.acquire('get_push_activity') as conn:
+            rows = await conn.fetch("""
+                WITH w AS (
+                    SELECT * FROM repo_push_activity
+                    WHERE repo_id = ANY($1::bigint[])
+                      AND day >= $2
                 )
-            """)
+                SELECT t.repo_id, t.commits, t.pushes, COALESCE(p.pushers, 0) AS pushers
+                FROM (
+                    SELECT repo_id, SUM(commits) AS commits, SUM(pushes) AS pushes
+                    FROM w GROUP BY repo_id
+                ) t
+                LEFT JOIN (
+                    SELECT repo_id, COUNT(DISTINCT pusher_id) AS pushers
+                    FROM w, unnest(w.pusher_ids) AS pusher_id
+                    GROUP BY repo_id
+                ) p USING (repo_id)
+            """, repo_ids, _window_start())
+
+            return {
+                row['repo_id']: {
+                    'commits': row['commits'],
+                    'pushes': row['pushes'],
+                    'pushers': row['pushers']
+                }
+                for row in rows
+            }
 
-            # Topics table (many-to-many with repos)
+    async def prune_push_activity(self):
+        """Drop push activity that fell out of the rolling window"""
+        async with self.acquire('prune_push_activity') as conn:
             await conn.execute("""
-                CREATE TABLE IF NOT EXISTS repo_topics (
-                    id SERIAL PRIMARY KEY,
-                    repo_id BIGINT NOT NULL,
-                    topic_name TEXT NOT NULL,
-                    FOREIGN KEY (repo_id) REFERENCES repos(repo_id) ON DELETE CASCADE,
-                    UNIQUE(repo_id, topic_name)
-                )
-            """)
+                DELETE FROM repo_push_activity
+                WHERE day < $1
+            """, _window_start())
+            await conn.execute("""
+                DELETE FROM push_activity_hours
+                WHERE hour < $1::date
+            """, _window_start())
+
+    async def save_actor_sketches(self, actor_activity):
+        """
+        Union one archive hour's distinct actors into the per repo, day and event class
+        HyperLogLogs. Sketches are merged here, so hours of the same day take turns on
+        a per-day lock. A retried hour is harmless, a union is idempotent, and sketches
+        that didn't change aren't written back.
 
-            # Dependencies table
+        Args:
+            actor_activity: Dict keyed by (repo_id, 'YYYY-MM-DD') of {event_class: set of actor ids}
+        """
+        oldest_day = _window_start()
+        by_day = {}
+        for (repo_id, day), classes in actor_activity.items():
+            day = date.fromisoformat(day)
+            if day < oldest_day:
+                continue
+            for event_class, actors in classes.items():
+                by_day.setdefault(day, {})[(repo_id, event_class)] = actors
+
+        saved = 0
+        async with self.acquire('save_actor_sketches') as conn:
+            for day, actors_by_key in sorted(by_day.items()):
+                async with conn.transaction():
+                    await conn.execute(
+                        "SELECT pg_advisory_xact_lock($1, $2)", ACTOR_SKETCH_LOCK_ID, day.toordinal()
+                    )
+                    rows = await conn.fetch("""
+                        SELECT repo_id, event_class, sketch FROM repo_actor_sketches
+                        WHERE day = $1 AND repo_id = ANY($2::bigint[])
+                    """, day, sorted({repo_id for repo_id, _ in actors_by_key}))
+                    existing = {(row['repo_id'], row['event_class']): row['sketch'] for row in rows}
+
+                    records = []
+                    for (repo_id, event_class), actors in sorted(actors_by_key.items()):
+                        old = existing.get((repo_id, event_class))
+                        sketch = HyperLogLog.from_bytes(old) if old else HyperLogLog()
+                        sketch.update(actors)
+                        new = sketch.to_bytes()
+                        if new != old:
+                            records.append((repo_id, day, event_class, new))
+                    if not records:
+                        continue
+
+                    await conn.execute("""
+                        SET LOCAL client_min_messages = warning;
+                        CREATE TEMP TABLE IF NOT EXISTS actor_sketches_staging (
+                            repo_id BIGINT,
+                            day DATE,
+                            event_class TEXT,
+                            sketch BYTEA
+                        ) ON COMMIT DELETE ROWS;
+                    """)
+                    await conn.copy_records_to_table(
+                        'actor_sketches_staging', records=records,
+                        columns=('repo_id', 'day', 'event_class', 'sketch')
+                    )
+                    await conn.execute("""
+                        INSERT INTO repo_actor_sketches (repo_id, day, event_class, sketch)
+                        SELECT repo_id, day, event_class, sketch FROM actor_sketches_staging
+                        ON CONFLICT (day, repo_id, event_class) DO UPDATE SET sketch = EXCLUDED.sketch
+                    """)
+                    saved += len(records)
+
+        if saved:
+            print(f"  💾 Saved {saved} actor sketches")
+
+    async def get_actor_counts(self, repo_ids, days=PUSH_ACTIVITY_WINDOW_DAYS):
+        """Estimated distinct actors per event class over the last `days` days, {repo_id: {event_class: n}}"""
+        if not repo_ids:
+            return {}
+
+        async with self.acquire_read('get_actor_counts') as conn:
+            rows = await conn.fetch("""
+                SELECT repo_id, event_class, sketch FROM repo_actor_sketches
+                WHERE repo_id = ANY($1::bigint[])
+                  AND day >= $2
+            """, repo_ids, _window_start(days))
+
+        unions = {}
+        for row in rows:
+            sketch = HyperLogLog.from_bytes(row['sketch'])
+            key = (row['repo_id'], row['event_class'])
+            if key in unions:
+                unions[key].merge(sketch)
+            else:
+                unions[key] = sketch
+
+        counts = {}
+        for (repo_id, event_class), sketch in unions.items():
+            counts.setdefault(repo_id, {})[event_class] = sketch.count()
+        return counts
+
+    async def refresh_repo_engagement(self, repo_ids):
+        """Fill the *_last_30_days engagement columns of these repos from their actor sketches"""
+        if not repo_ids:
+            return 0
+
+        counts = await self.get_actor_counts(repo_ids)
+        no_actors = {}
+        columns = list(ENGAGEMENT_COLUMNS.items())
+        values = [
+            [counts.get(repo_id, no_actors).get(event_class, 0) for repo_id in repo_ids]
+            for event_class, _ in columns
+        ]
+
+        assignments = ', '.join(f'{column} = v.{column}' for _, column in columns)
+        old_values = ', '.join(f'r.{column}' for _, column in columns)
+        new_values = ', '.join(f'v.{column}' for _, column in columns)
+        unnest_args = ', '.join(f'${i + 2}::int[]' for i in range(len(columns)))
+        column_list = ', '.join(column for _, column in columns)
+
+        async with self.acquire('refresh_repo_engagement') as conn:
+            async with conn.transaction():
+                updated = _rows_affected(await conn.execute(f"""
+                    UPDATE repos r SET {assignments}
+                    FROM unnest($1::bigint[], {unnest_args}) AS v(repo_id, {column_list})
+                    WHERE r.repo_id = v.repo_id
+                      AND ({old_values}) IS DISTINCT FROM ({new_values})
+                """, list(repo_ids), *values))
+                if updated:
+                    await self._bump_data_generation(conn)
+                return updated
+
+    async def prune_actor_sketches(self):
+        """
+        Drop actor sketches that fell out of the rolling window, and those of repos that
+        never made it into repos: every active repo gets sketched, most are never processed.
+        Repos still waiting keep their last ACTOR_SKETCH_UNPROCESSED_DAYS days, failed ones
+        (processed but not in repos) keep nothing.
+        """
+        async with self.acquire('prune_actor_sketches') as conn:
             await conn.execute("""
-                CREATE TABLE IF NOT EXISTS repo_dependencies (
-                    id SERIAL PRIMARY KEY,
-                    repo_id BIGINT NOT NULL,
-                    package_name TEXT NOT NULL,
-                    requirements TEXT,
-                    manifest_filename TEXT,
-                    FOREIGN KEY (repo_id) REFERENCES repos(repo_id) ON DELETE CASCADE
+                DELETE FROM repo_actor_sketches s
+                WHERE s.day < $1
+                   OR (NOT EXISTS (SELECT 1 FROM repos r WHERE r.repo_id = s.repo_id)
+                       AND (s.day < $2
+                            OR EXISTS (SELECT 1 FROM repo_queue q WHERE q.repo_id = s.repo_id AND q.processed)))
+            """, _window_start(), _window_start(ACTOR_SKETCH_UNPROCESSED_DAYS))
+
+    async def save_hourly_activity(self, hour, repo_activity):
+        """
+        Record the event counts of one gh archive hour and fold them into the trending windows.
+
+        Each window keeps events in (as_of - L, as_of] and in the L hours before that.
+        A newer hour H moves a window with one range delta, touching only repos active
+        in those ranges:
+            events      += sum(as_of, H]          - sum(as_of - L, H - L]
+            prev_events += sum(as_of - L, H - L]  - sum(as_of - 2L, H - 2L]
+        An older hour (backfill finishes files out of order) is added to whichever
+        of the two windows it falls in. Returns False if the hour was already recorded.
+
+        Args:
+            hour: datetime of the archive hour
+            repo_activity: {repo_id: {'name': str, 'count': int}} from the archive file
+        """
+        if not repo_activity:
+            return False
+
+        records = sorted((hour, repo_id, data['count']) for repo_id, data in repo_activity.items())
+
+        async with self.acquire('save_hourly_activity') as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", TRENDING_LOCK_ID)
+
+                recorded = await conn.fetchval("""
+                    INSERT INTO trending_hours (hour) VALUES ($1)
+                    ON CONFLICT DO NOTHING
+                    RETURNING hour
+                """, hour)
+                if recorded is None:
+                    return False
+
+                await conn.copy_records_to_table(
+                    'repo_hourly_activity', records=records, columns=('hour', 'repo_id', 'events')
                 )
-            """)
 
-            # Create indexes for better query performance
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_repos_repo_id ON repos(repo_id)
-            """)
+                windows = await conn.fetch("SELECT window_name, hours, as_of FROM trending_windows")
+                for window in windows:
+                    await self._advance_trending_window(
+                        conn, window['window_name'], timedelta(hours=window['hours']), window['as_of'], hour
+                    )
+                return True
+
+    async def _advance_trending_window(self, conn, window_name, length, as_of, hour):
+        if as_of is None:
+            # first hour this window sees, build it from whatever history is there
+            await conn.execute("DELETE FROM repo_trending WHERE window_name = $1", window_name)
             await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_repo_languages_repo_id ON repo_languages(repo_id)
-            """)
+                INSERT INTO repo_trending (window_name, repo_id, events, prev_events)
+                SELECT $1, repo_id,
+                    COALESCE(SUM(events) FILTER (WHERE hour > $2::timestamp - $3::interval), 0),
+                    COALESCE(SUM(events) FILTER (WHERE hour <= $2::timestamp - $3::interval), 0)
+                FROM repo_hourly_activity
+                WHERE hour > $2::timestamp - 2 * $3::interval AND hour <= $2
+                GROUP BY repo_id
+            """, window_name, hour, length)
+            as_of = hour
+
+        elif hour > as_of:
+            changed = await conn.fetch("""
+                WITH delta AS (
+                    SELECT repo_id,
+                        COALESCE(SUM(events) FILTER (WHERE hour > $2 AND hour <= $3), 0)
+                        - COALESCE(SUM(events) FILTER (
+                            WHERE hour > $2::timestamp - $4::interval AND hour <= $3::timestamp - $4::interval), 0) AS events,
+                        COALESCE(SUM(events) FILTER (
+                            WHERE hour > $2::timestamp - $4::interval AND hour <= $3::timestamp - $4::interval), 0)
+                        - COALESCE(SUM(events) FILTER (
+                            WHERE hour > $2::timestamp - 2 * $4::interval AND hour <= $3::timestamp - 2 * $4::interval), 0) AS prev_events
+                    FROM repo_hourly_activity
+                    WHERE (hour > $2 AND hour <= $3)
+                       OR (hour > $2::timestamp - $4::interval AND hour <= $3::timestamp - $4::interval)
+                       OR (hour > $2::timestamp - 2 * $4::interval AND hour <= $3::timestamp - 2 * $4::interval)
+                    GROUP BY repo_id
+                )
+                INSERT INTO repo_trending (window_name, repo_id, events, prev_events)
+                SELECT $1, repo_id, events, prev_events
+                FROM delta
+                WHERE events <> 0 OR prev_events <> 0
+                ORDER BY repo_id
+                ON CONFLICT (window_name, repo_id) DO UPDATE SET
+                    events = repo_trending.events + EXCLUDED.events,
+                    prev_events = repo_trending.prev_events + EXCLUDED.prev_events
+                RETURNING repo_id, events, prev_events
+            """, window_name, as_of, hour, length)
+
+            # repos that went quiet in both windows
+            idle = [row['repo_id'] for row in changed if row['events'] == 0 and row['prev_events'] == 0]
+            if idle:
+                await conn.execute("""
+                    DELETE FROM repo_trending
+                    WHERE window_name = $1 AND repo_id = ANY($2::bigint[])
+                      AND events = 0 AND prev_events = 0
+                """, window_name, idle)
+            as_of = hour
+
+        elif hour > as_of - 2 * length:
             await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_repo_topics_repo_id ON repo_topics(repo_id)
+                INSERT INTO repo_trending (window_name, repo_id, events, prev_events)
+                SELECT $1, repo_id,
+                    CASE WHEN $3 THEN events ELSE 0 END,
+                    CASE WHEN $3 THEN 0 ELSE events END
+                FROM repo_hourly_activity
+                WHERE hour = $2
+                ORDER BY repo_id
+                ON CONFLICT (window_name, repo_id) DO UPDATE SET
+                    events = repo_trending.events + EXCLUDED.events,
+                    prev_events = repo_trending.prev_events + EXCLUDED.prev_events
+            """, window_name, hour, hour > as_of - length)
+
+        else:
+            # older than both windows, nothing to change
+            return
+
+        await conn.execute("""
+            UPDATE trending_windows SET as_of = $2, changes = changes + 1
+            WHERE window_name = $1
+        """, window_name, as_of)
+
+    async def refresh_trending_leaderboards(self, top_k=TRENDING_TOP_K, min_events=TRENDING_MIN_EVENTS):
+        """
+        Rebuild the top-K tables of every window that changed since its last rebuild:
+        overall, per primary language and per topic, ranked by velocity (events minus
+        the previous window's events) so steady giants don't crowd out what's rising.
+        """
+        async with self.acquire('refresh_trending_leaderboards') as conn:
+            windows = await conn.fetch("""
+                SELECT window_name, changes FROM trending_windows
+                WHERE changes > leaderboard_changes
             """)
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_repo_dependencies_repo_id ON repo_dependencies(repo_id)
+            if not windows:
+                return 0
+
+            async with conn.transaction():
+                for window in windows:
+                    await conn.execute(
+                        "DELETE FROM trending_leaderboard WHERE window_name = $1", window['window_name']
+                    )
+                    await conn.execute("""
+                        WITH candidates AS (
+                            SELECT repo_id, events, prev_events, events - prev_events AS velocity
+                            FROM repo_trending
+                            WHERE window_name = $1 AND events >= $3
+                        ),
+                        primary_language AS (
+                            SELECT DISTINCT ON (repo_id) repo_id, language_name
+                            FROM repo_languages
+                            WHERE repo_id IN (SELECT repo_id FROM candidates)
+                            ORDER BY repo_id, size_bytes DESC
+                        ),
+                        scoped AS (
+                            SELECT 'all' AS scope, '' AS scope_value, c.* FROM candidates c
+                            UNION ALL
+                            SELECT 'language', l.language_name, c.*
+                            FROM candidates c JOIN primary_language l USING (repo_id)
+                            UNION ALL
+                            SELECT 'topic', t.topic_name, c.*
+                            FROM candidates c JOIN repo_topics t USING (repo_id)
+                        ),
+                        ranked AS (
+                            SELECT scoped.*, ROW_NUMBER() OVER (
+                                PARTITION BY scope, scope_value
+                                ORDER BY velocity DESC, events DESC, repo_id
+                            ) AS rank
+                            FROM scoped
+                        )
+                        INSERT INTO trending_leaderboard (
+                            window_name, scope, scope_value, rank, repo_id, repo_name,
+                            events, prev_events, velocity
+                        )
+                        SELECT $1, r.scope, r.scope_value, r.rank, r.repo_id, q.repo_name,
+                               r.events, r.prev_events, r.velocity
+                        FROM ranked r
+                        LEFT JOIN repo_queue q ON q.repo_id = r.repo_id
+                        WHERE r.rank <= $2
+                    """, window['window_name'], top_k, min_events)
+
+                    # only up to the change count we read, a save that landed meanwhile keeps it stale
+                    await conn.execute("""
+                        UPDATE trending_windows SET leaderboard_changes = $2
+                        WHERE window_name = $1
+                    """, window['window_name'], window['changes'])
+
+                await self._bump_data_generation(conn)
+
+            print(f"  🔥 Refreshed trending leaderboards for {', '.join(w['window_name'] for w in windows)}")
+            return len(windows)
+
+    async def prune_hourly_activity(self):
+        """Drop archive hours no trending window can reach any more (two window lengths back)"""
+        async with self.acquire('prune_hourly_activity') as conn:
+            cutoff = await conn.fetchval("""
+                SELECT MIN(as_of - 2 * hours * INTERVAL '1 hour') FROM trending_windows
             """)
+            if cutoff is None:
+                return
+            await conn.execute("DELETE FROM repo_hourly_activity WHERE hour <= $1", cutoff)
+            await conn.execute("DELETE FROM trending_hours WHERE hour <= $1", cutoff)
 
-    async def save_repo_id_to_queue(self, repo_activity):
-        MAX_RETRIES = 3
-        retries = 0
-        while retries < MAX_RETRIES:
-            try:
-                async with self.pool.acquire() as conn:
-                    if not repo_activity:
-                        return
-                    BATCH_SIZE = 1000
-                    
-                    #sort by activity count
-                    sorted_repo_actitivity = sorted(repo_activity.items())
-                    for i in range(0, len(sorted_repo_actitivity), BATCH_SIZE):
-                        batch = sorted_repo_actitivity[i:i+BATCH_SIZE]
-                        values = [
-                            (repo_id, data['name'], data['count'])
-                            for repo_id, data in batch
-                        ]
-                        await conn.executemany("""
-                            INSERT INTO repo_queue (repo_id, repo_name, activity_count)
-                            VALUES ($1, $2, $3)
-                            ON CONFLICT (repo_id) DO UPDATE 
-                            SET activity_count = repo_queue.activity_count + EXCLUDED.activity_count
-                        """, values)
-
-                    print(f"  💾 Saved {len(batch)} repos to DB")
-                    return
-
-            except 'OperationalError' as e:
-                if "deadlock detected" in str(e).lower():
-                    retries += 1
-                    await asyncio.sleep(2 * retries) ##backoff
-                    continue
-                else:
-                    raise
-            except Exception as e:
-                raise e
+    async def get_trending(self, window_name='24h', language=None, topic=None, limit=TRENDING_TOP_K):
+        """Precomputed leaderboard rows, an index range scan of at most `limit` rows"""
+        if language and topic:
+            raise ValueError("Pass language or topic, not both")
+        scope, scope_value = ('language', language) if language else ('topic', topic) if topic else ('all', '')
+
+        async with self.acquire_read('get_trending') as conn:
+            as_of = await conn.fetchrow(
+                "SELECT as_of FROM trending_windows WHERE window_name = $1", window_name
+            )
+            if as_of is None:
+                raise ValueError(f"Unknown window: {window_name}")
+
+            rows = await conn.fetch("""
+                SELECT rank, repo_id, repo_name, events, prev_events, velocity
+                FROM trending_leaderboard
+                WHERE window_name = $1 AND scope = $2 AND scope_value = $3
+                ORDER BY rank
+                LIMIT $4
+            """, window_name, scope, scope_value, min(limit, TRENDING_TOP_K))
+
+            return {
+                "window": window_name,
+                "as_of": as_of['as_of'],
+                "scope": scope,
+                "scope_value": scope_value or None,
+                "repos": [dict(row) for row in rows],
+            }
+
+    async def load_activity_filter_state(self, name='discovery'):
+        """Saved ActivityFilter state as {'hours', 'sketch', 'heavy_hitters'}, or None"""
+        async with self.acquire('load_activity_filter_state') as conn:
+            row = await conn.fetchrow("""
+                SELECT hours, sketch, heavy_hitters FROM activity_filter_state WHERE name = $1
+            """, name)
+            return dict(row) if row else None
+
+    async def save_activity_filter_state(self, activity_filter, name='discovery'):
+        async with self.acquire('save_activity_filter_state') as conn:
+            await conn.execute("""
+                INSERT INTO activity_filter_state (name, hours, sketch, heavy_hitters)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (name) DO UPDATE SET
+                    hours = EXCLUDED.hours,
+                    sketch = EXCLUDED.sketch,
+                    heavy_hitters = EXCLUDED.heavy_hitters,
+                    updated_at = NOW()
+            """, name, activity_filter.hours, activity_filter.sketch.to_bytes(),
+                activity_filter.heavy_hitters.to_bytes())
 
     async def bulk_insert_urls(self, urls):
-        async with self.pool.acquire() as conn:
+        async with self.acquire('bulk_insert_urls') as conn:
             await conn.executemany("""
             INSERT INTO url_queue (url, done)
             VALUES ($1, FALSE)
@@ -223,7 +911,7 @@ class DBHelper:
             print(f"  📝 Inserted {len(urls)} URLs into queue")
 
     async def mark_url_done(self, url):
-        async with self.pool.acquire() as conn:
+        async with self.acquire('mark_url_done') as conn:
             await conn.execute("""
                 UPDATE url_queue
                 SET done = TRUE,
@@ -232,7 +920,7 @@ class DBHelper:
             """, url)
     
     async def get_pending_urls(self, limit=None):
-        async with self.pool.acquire() as conn:
+        async with self.acquire('get_pending_urls') as conn:
             if limit:
                 rows = await conn.fetch("""
                  SELECT url FROM url_queue WHERE done = FALSE ORDER BY created_at LIMIT $1
@@ -251,143 +939,490 @@ class DBHelper:
             enriched_data_list: List of dicts, each containing:
                 - repo_id: The repository ID
                 - repo_name: The repository name (owner/repo)
-                - parsed_data: The parsed data from parse_repo_data()
+                - parsed_data: dict of stars, forks, ..., languages, language_percentages, topics, dependencies
         """
         if not enriched_data_list:
             return
 
-        async with self.pool.acquire() as conn:
+        await self.bulk_save_repo_batch(RepoBatch.from_enriched(enriched_data_list))
+
+    async def bulk_save_repo_batch(self, batch):
+        """
+        Bulk save a RepoBatch from helpers.repo_parser.parse_repo_batch().
+
+        Rows are COPYed into temp staging tables and merged with set-based
+        statements inside a single short transaction. Child tables are diffed
+        against staging, so only added, changed or removed rows get written and
+        a refresh of a stable repo writes next to nothing.
+        """
+        if not batch.repos:
+            return
+
+        await self._ensure_metrics_partitions()
+
+        async with self.acquire('bulk_save_repo_batch') as conn:
             async with conn.transaction():
-                # Prepare data for bulk insert
-                repos_to_insert = []
-                languages_to_insert = []
-                topics_to_insert = []
-                dependencies_to_insert = []
-
-                for item in enriched_data_list:
-                    repo_id = item['repo_id']
-                    repo_name = item['repo_name']
-                    data = item['parsed_data']
-                    activity_score = item.get('activity_score', 0)
-
-                    # Main repo data
-                    repos_to_insert.append((
-                        repo_id,
-                        repo_name,
-                        data.get('stars', 0),
-                        data.get('forks', 0),
-                        data.get('open_issues', 0),
-                        data.get('closed_issues', 0),
-                        data.get('subscribers', 0),
-                        data.get('commits_last_30_days', 0),
-                        data.get('contributors_count', 0),
+                await self._create_staging_tables(conn)
+
+                await conn.copy_records_to_table(
+                    'repos_staging', records=batch.repos, columns=REPO_STAGING_COLUMNS
+                )
+
+                # Snapshot only repos that are new or whose metrics moved, compared
+                # with repos before the upsert below overwrites it
+                await conn.execute("""
+                    INSERT INTO repo_metrics_history (repo_id, captured_at, stars, forks, open_issues, closed_issues)
+                    SELECT DISTINCT ON (s.repo_id)
+                        s.repo_id, NOW(), s.stars, s.forks, s.open_issues, s.closed_issues
+                    FROM repos_staging s
+                    LEFT JOIN repos r ON r.repo_id = s.repo_id
+                    WHERE r.repo_id IS NULL
+                       OR (r.stars, r.forks, r.open_issues, r.closed_issues)
+                          IS DISTINCT FROM (s.stars, s.forks, s.open_issues, s.closed_issues)
+                    ORDER BY s.repo_id
+                """)
+
+                # Rollup deltas, also read before the upsert. Locks the single rollup
+                # row first so every writer takes its locks in the same order.
+                await conn.execute("""
+                    UPDATE repo_stats_rollup SET
+                        total_repos = total_repos + d.new_repos,
+                        healthy_repos = healthy_repos + d.healthy_delta,
+                        starred_repos = starred_repos + d.starred_delta,
+                        stars_sum = stars_sum + d.stars_delta,
+                        updated_at = NOW()
+                    FROM (
+                        SELECT
+                            COUNT(*) FILTER (WHERE r.repo_id IS NULL) AS new_repos,
+                            SUM(
+                                COALESCE((s.commits_last_30_days > 0 AND s.activity_score > 10)::int, 0)
+                                - COALESCE((r.commits_last_30_days > 0 AND r.activity_score > 10)::int, 0)
+                            ) AS healthy_delta,
+                            SUM(
+                                COALESCE((s.stars > 0)::int, 0) - COALESCE((r.stars > 0)::int, 0)
+                            ) AS starred_delta,
+                            SUM(
+                                CASE WHEN s.stars > 0 THEN s.stars ELSE 0 END
+                                - CASE WHEN r.stars > 0 THEN r.stars ELSE 0 END
+                            ) AS stars_delta
+                        FROM (SELECT DISTINCT ON (repo_id) * FROM repos_staging ORDER BY repo_id) s
+                        LEFT JOIN repos r ON r.repo_id = s.repo_id
+                    ) d
+                """)
+
+                # Skip the rewrite when nothing changed, updated_at is the last real change
+                status = await conn.execute("""
+                    INSERT INTO repos (
+                        repo_id, repo_name, stars, forks, open_issues,
+                        closed_issues, subscribers, commits_last_30_days,
+                        pushes_last_30_days, pushers_last_30_days,
                         activity_score
-                    ))
-
-                    # Languages
-                    languages = data.get('languages', {})
-                    language_percentages = data.get('language_percentages', {})
-                    for lang_name, size in languages.items():
-                        percentage = language_percentages.get(lang_name, 0)
-                        languages_to_insert.append((
-                            repo_id,
-                            lang_name,
-                            size,
-                            float(percentage)
-                        ))
-
-                    # Topics
-                    topics = data.get('topics', {})
-                    for topic_name in topics.keys():
-                        topics_to_insert.append((
-                            repo_id,
-                            topic_name
-                        ))
-
-                    # Dependencies
-                    dependencies = data.get('dependencies', [])
-                    for dep in dependencies:
-                        dependencies_to_insert.append((
-                            repo_id,
-                            dep.get('package', ''),
-                            dep.get('requirements', ''),
-                            dep.get('manifest', '')
-                        ))
-
-                # Bulk insert enriched repos
-                if repos_to_insert:
-                    await conn.executemany("""
-                        INSERT INTO repos (
-                            repo_id, repo_name, stars, forks, open_issues, 
-                            closed_issues, subscribers, commits_last_30_days, 
-                            contributors_count, activity_score
-                        )
-                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                        ON CONFLICT (repo_id) DO UPDATE SET
-                            stars = EXCLUDED.stars,
-                            forks = EXCLUDED.forks,
-                            open_issues = EXCLUDED.open_issues,
-                            closed_issues = EXCLUDED.closed_issues,
-                            subscribers = EXCLUDED.subscribers,
-                            commits_last_30_days = EXCLUDED.commits_last_30_days,
-                            contributors_count = EXCLUDED.contributors_count,
-                            activity_score = EXCLUDED.activity_score,
-                            updated_at = NOW()
-                    """, repos_to_insert)
-
-                # Bulk insert languages (delete old ones first, then insert new)
-                if languages_to_insert:
-                    repo_ids = [item['repo_id'] for item in enriched_data_list]
-                    await conn.execute("""
-                        DELETE FROM repo_languages 
-                        WHERE repo_id = ANY($1::bigint[])
-                    """, repo_ids)
-                    
-                    await conn.executemany("""
-                        INSERT INTO repo_languages (repo_id, language_name, size_bytes, percentage)
-                        VALUES ($1, $2, $3, $4)
-                        ON CONFLICT (repo_id, language_name) DO UPDATE SET
-                            size_bytes = EXCLUDED.size_bytes,
-                            percentage = EXCLUDED.percentage
-                    """, languages_to_insert)
-
-                # Bulk insert topics (delete old ones first, then insert new)
-                if topics_to_insert:
-                    repo_ids = [item['repo_id'] for item in enriched_data_list]
-                    await conn.execute("""
-                        DELETE FROM repo_topics 
-                        WHERE repo_id = ANY($1::bigint[])
-                    """, repo_ids)
-                    
-                    await conn.executemany("""
-                        INSERT INTO repo_topics (repo_id, topic_name)
-                        VALUES ($1, $2)
-                        ON CONFLICT (repo_id, topic_name) DO NOTHING
-                    """, topics_to_insert)
-
-                # Bulk insert dependencies (delete old ones first, then insert new)
-                if dependencies_to_insert:
-                    repo_ids = [item['repo_id'] for item in enriched_data_list]
-                    await conn.execute("""
-                        DELETE FROM repo_dependencies 
-                        WHERE repo_id = ANY($1::bigint[])
-                    """, repo_ids)
-                    
-                    await conn.executemany("""
-                        INSERT INTO repo_dependencies (repo_id, package_name, requirements, manifest_filename)
-                        VALUES ($1, $2, $3, $4)
-                    """, dependencies_to_insert)
+                    )
+                    SELECT DISTINCT ON (repo_id)
+                        repo_id, repo_name, stars, forks, open_issues,
+                        closed_issues, subscribers, commits_last_30_days,
+                        pushes_last_30_days, pushers_last_30_days,
+                        activity_score
+                    FROM repos_staging
+                    ORDER BY repo_id
+                    ON CONFLICT (repo_id) DO UPDATE SET
+                        repo_name = EXCLUDED.repo_name,
+                        stars = EXCLUDED.stars,
+                        forks = EXCLUDED.forks,
+                        open_issues = EXCLUDED.open_issues,
+                        closed_issues = EXCLUDED.closed_issues,
+                        subscribers = EXCLUDED.subscribers,
+                        commits_last_30_days = EXCLUDED.commits_last_30_days,
+                        pushes_last_30_days = EXCLUDED.pushes_last_30_days,
+                        pushers_last_30_days = EXCLUDED.pushers_last_30_days,
+                        activity_score = EXCLUDED.activity_score,
+                        updated_at = NOW()
+                    WHERE (
+                        repos.repo_name, repos.stars, repos.forks, repos.open_issues,
+                        repos.closed_issues, repos.subscribers, repos.commits_last_30_days,
+                        repos.pushes_last_30_days, repos.pushers_last_30_days,
+                        repos.activity_score
+                    ) IS DISTINCT FROM (
+                        EXCLUDED.repo_name, EXCLUDED.stars, EXCLUDED.forks, EXCLUDED.open_issues,
+                        EXCLUDED.closed_issues, EXCLUDED.subscribers, EXCLUDED.commits_last_30_days,
+                        EXCLUDED.pushes_last_30_days, EXCLUDED.pushers_last_30_days,
+                        EXCLUDED.activity_score
+                    )
+                """)
+                repos_written = _rows_affected(status)
+
+                # A child list of None means the payloads never asked for that table
+                children_written = 0
+                if batch.languages is not None:
+                    await conn.copy_records_to_table(
+                        'languages_staging', records=batch.languages,
+                        columns=('repo_id', 'language_name', 'size_bytes', 'percentage')
+                    )
+                    children_written += await self._merge_child_rows(
+                        conn, 'repo_languages', 'languages_staging',
+                        match_columns=('language_name',),
+                        update_columns=('size_bytes', 'percentage'),
+                        popularity='language'
+                    )
+
+                if batch.topics is not None:
+                    await conn.copy_records_to_table(
+                        'topics_staging', records=batch.topics,
+                        columns=('repo_id', 'topic_name')
+                    )
+                    children_written += await self._merge_child_rows(
+                        conn, 'repo_topics', 'topics_staging',
+                        match_columns=('topic_name',),
+                        popularity='topic'
+                    )
+
+                if batch.dependencies is not None:
+                    await conn.copy_records_to_table(
+                        'dependencies_staging', records=batch.dependencies,
+                        columns=('repo_id', 'package_name', 'requirements', 'manifest_filename')
+                    )
+                    children_written += await self._merge_child_rows(
+                        conn, 'repo_dependencies', 'dependencies_staging',
+                        match_columns=('package_name', 'requirements', 'manifest_filename')
+                    )
+
+                await self._apply_popularity_deltas(conn)
+
+                # last statement in the transaction, so the generation row lock is held briefly
+                if repos_written or children_written:
+                    await self._bump_data_generation(conn)
+
+                print(f"  💾 Bulk saved {len(batch.repos)} enriched repos "
+                      f"({repos_written} repo rows and {children_written} child rows changed)")
+
+    async def _bump_data_generation(self, conn):
+        """Tell api response caches the data changed. The NOTIFY only goes out if the transaction commits."""
+        return await conn.fetchval("SELECT bump_data_generation()")
+
+    async def get_data_generation(self):
+        async with self.acquire('get_data_generation') as conn:
+            return await conn.fetchval("SELECT generation FROM data_generation")
+
+    async def listen_data_generation(self, callback):
+        """
+        Call callback(generation) whenever a write transaction bumps the data generation.
+        Uses its own connection outside the pool since LISTEN has to stay on one session.
+        If that session drops it is reconnected in the background. close() stops listening.
+        """
+        def on_notify(conn, pid, channel, payload):
+            callback(int(payload))
+
+        def on_terminate(conn):
+            if self._generation_listener is not conn:
+                return
+            self._generation_listener = None
+            if self._generation_relisten is None or self._generation_relisten.done():
+                self._generation_relisten = asyncio.create_task(self._relisten_data_generation(callback))
+
+        conn = await asyncpg.connect(**self._connection_settings())
+        await conn.add_listener('data_generation', on_notify)
+        conn.add_termination_listener(on_terminate)
+        self._generation_listener = conn
+
+    async def _relisten_data_generation(self, callback, max_delay=60):
+        """Reconnect the LISTEN session with backoff, then catch up on bumps sent while it was down"""
+        delay = 1
+        while True:
+            try:
+                if self._generation_listener is None:
+                    await self.listen_data_generation(callback)
+                # LISTEN is back before we read, so no bump can fall between the two
+                callback(await self.get_data_generation())
+                print("👂 data_generation listener reconnected")
+                return
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                print(f"⚠️  data_generation listener reconnect failed: {e!r}, retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
+
+    async def _ensure_metrics_partitions(self):
+        """
+        Make sure this month's and next month's repo_metrics_history partitions exist.
+        Runs outside the write transaction and only once per month per process.
+        """
+        month = date.today().replace(day=1)
+        if self._metrics_partition_month == month:
+            return
+
+        async with self.acquire('ensure_metrics_partitions') as conn:
+            await conn.execute("""
+                SET client_min_messages = warning;
+                SELECT ensure_repo_metrics_partition(NOW()::timestamp);
+                SELECT ensure_repo_metrics_partition((NOW() + INTERVAL '1 month')::timestamp);
+                RESET client_min_messages;
+            """)
+        self._metrics_partition_month = month
+
+    async def _create_staging_tables(self, conn):
+        """
+        Per-connection temp tables for COPY. They survive on the pooled connection
+        and are emptied on every commit, so we don't churn the catalog per batch.
+        """
+        await conn.execute("""
+            SET LOCAL client_min_messages = warning;
+
+            CREATE TEMP TABLE IF NOT EXISTS repos_staging (
+                repo_id BIGINT,
+                repo_name TEXT,
+                stars INTEGER,
+                forks INTEGER,
+                open_issues INTEGER,
+                closed_issues INTEGER,
+                subscribers INTEGER,
+                commits_last_30_days INTEGER,
+                pushes_last_30_days INTEGER,
+                pushers_last_30_days INTEGER,
+                activity_score INTEGER,
+                contributors_count INTEGER
+            ) ON COMMIT DELETE ROWS;
+
+            CREATE TEMP TABLE IF NOT EXISTS languages_staging (
+                repo_id BIGINT,
+                language_name TEXT,
+                size_bytes BIGINT,
+                percentage NUMERIC(5, 2)
+            ) ON COMMIT DELETE ROWS;
+
+            CREATE TEMP TABLE IF NOT EXISTS topics_staging (
+                repo_id BIGINT,
+                topic_name TEXT
+            ) ON COMMIT DELETE ROWS;
+
+            CREATE TEMP TABLE IF NOT EXISTS dependencies_staging (
+                repo_id BIGINT,
+                package_name TEXT,
+                requirements TEXT,
+                manifest_filename TEXT
+            ) ON COMMIT DELETE ROWS;
+
+            CREATE TEMP TABLE IF NOT EXISTS contributors_staging (
+                repo_id BIGINT,
+                login TEXT
+            ) ON COMMIT DELETE ROWS;
+
+            CREATE TEMP TABLE IF NOT EXISTS popularity_delta (
+                kind TEXT,
+                name TEXT,
+                delta INTEGER
+            ) ON COMMIT DELETE ROWS;
+        """)
+
+    async def _merge_child_rows(self, conn, table, staging, match_columns, update_columns=(),
+                                popularity=None):
+        """
+        Bring a child table in line with its staging table for every repo in
+        repos_staging, writing only the rows that were removed, changed or added.
+        A repo with no staged rows loses all of its children.
+
+        With popularity set ('language' or 'topic'), removed and added names are
+        also logged to popularity_delta for _apply_popularity_deltas().
+
+        Returns the number of rows written.
+        """
+        match = ' AND '.join(
+            ['t.repo_id = s.repo_id']
+            + [f't.{column} IS NOT DISTINCT FROM s.{column}' for column in match_columns]
+        )
+        columns = ('repo_id',) + tuple(match_columns) + tuple(update_columns)
+        column_list = ', '.join(columns)
+
+        def tracked(statement, alias, delta):
+            if popularity is None:
+                return statement
+            return f"""
+                WITH changed AS ({statement} RETURNING {alias}.{match_columns[0]} AS name)
+                INSERT INTO popularity_delta (kind, name, delta)
+                SELECT '{popularity}', name, {delta} FROM changed
+            """
+
+        written = _rows_affected(await conn.execute(tracked(f"""
+            DELETE FROM {table} t
+            USING repos_staging r
+            WHERE t.repo_id = r.repo_id
+              AND NOT EXISTS (SELECT 1 FROM {staging} s WHERE {match})
+        """, 't', -1)))
+
+        if update_columns:
+            assignments = ', '.join(f'{column} = s.{column}' for column in update_columns)
+            old_values = ', '.join(f't.{column}' for column in update_columns)
+            new_values = ', '.join(f's.{column}' for column in update_columns)
+            written += _rows_affected(await conn.execute(f"""
+                UPDATE {table} t SET {assignments}
+                FROM {staging} s
+                WHERE {match}
+                  AND ({old_values}) IS DISTINCT FROM ({new_values})
+            """))
+
+        # only for repos that still exist, so a concurrent delete can't break the FK
+        written += _rows_affected(await conn.execute(tracked(f"""
+            INSERT INTO {table} ({column_list})
+            SELECT DISTINCT ON (repo_id, {', '.join(match_columns)}) {column_list}
+            FROM {staging} s
+            WHERE EXISTS (SELECT 1 FROM repos WHERE repos.repo_id = s.repo_id)
+              AND NOT EXISTS (SELECT 1 FROM {table} t WHERE {match})
+        """, table, 1)))
+
+        return written
+
+    async def _apply_popularity_deltas(self, conn):
+        """
+        Fold this transaction's popularity_delta rows into language_popularity and
+        topic_popularity. Names are applied in sorted order so concurrent writers
+        lock the rollup rows in the same order and can't deadlock. Names whose count
+        drops to zero are removed, like a full refresh would leave them.
+        """
+        for kind, rollup_table, name_column in (
+            ('language', 'language_popularity', 'language_name'),
+            ('topic', 'topic_popularity', 'topic_name'),
+        ):
+            await conn.execute(f"""
+                INSERT INTO {rollup_table} ({name_column}, repo_count)
+                SELECT name, SUM(delta) FROM popularity_delta
+                WHERE kind = '{kind}'
+                GROUP BY name
+                HAVING SUM(delta) <> 0
+                ORDER BY name
+                ON CONFLICT ({name_column}) DO UPDATE SET
+                    repo_count = {rollup_table}.repo_count + EXCLUDED.repo_count
+            """)
+            # only rows the upsert above just locked, so this takes no new locks
+            await conn.execute(f"""
+                DELETE FROM {rollup_table}
+                WHERE repo_count <= 0
+                  AND {name_column} IN (SELECT name FROM popularity_delta WHERE kind = '{kind}')
+            """)
+
+    async def enqueue_for_enrichment(self, repos):
+        """
+        Queue freshly saved repos for the expensive enrichment lane, most starred first.
+
+        Args:
+            repos: List of (repo_id, repo_name, priority) tuples
+        """
+        if not repos:
+            return
+
+        async with self.acquire('enqueue_for_enrichment') as conn:
+            await conn.executemany("""
+                INSERT INTO enrichment_queue (repo_id, repo_name, priority)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (repo_id) DO UPDATE SET priority = EXCLUDED.priority
+            """, repos)
+
+    async def claim_enrichment_batch(self, limit):
+        """
+        Claim repos that are due for enrichment and push their next run out by the
+        refresh interval, so concurrent workers never pick the same repo.
+        """
+        if limit <= 0:
+            return []
+
+        async with self.acquire('claim_enrichment_batch') as conn:
+            return await conn.fetch("""
+                UPDATE enrichment_queue
+                SET next_run_at = NOW() + $2::interval,
+                    last_run_at = NOW()
+                WHERE repo_id IN (
+                    SELECT repo_id FROM enrichment_queue
+                    WHERE next_run_at <= NOW()
+                    ORDER BY priority DESC
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING repo_id, repo_name
+            """, limit, ENRICHMENT_REFRESH_INTERVAL)
 
-                print(f"  💾 Bulk saved {len(repos_to_insert)} enriched repos with "
-                      f"{len(languages_to_insert)} languages, {len(topics_to_insert)} topics, "
-                      f"and {len(dependencies_to_insert)} dependencies")
+    async def seconds_until_next_enrichment(self):
+        """Seconds until the earliest enrichment_queue row is due, 0 if one already is, None if the queue is empty"""
+        async with self.acquire('seconds_until_next_enrichment') as conn:
+            seconds = await conn.fetchval("""
+                SELECT EXTRACT(EPOCH FROM MIN(next_run_at) - NOW())::float FROM enrichment_queue
+            """)
+        if seconds is None:
+            return None
+        return max(seconds, 0.0)
+
+    async def save_repo_enrichment(self, enriched_data_list):
+        """
+        Save the expensive lane's results: contributors and dependencies.
+        Uses the same staging + diff merge as bulk_save_repo_batch. repo_languages
+        is left to the core lane, two writers would keep undoing each other.
+
+        Args:
+            enriched_data_list: List of dicts with repo_id and parsed_data from
+                EnrichmentLane.parse_enrichment_data()
+        """
+        if not enriched_data_list:
+            return
+
+        repos_to_stage = []
+        contributors_to_insert = []
+        dependencies_to_insert = []
+
+        for item in enriched_data_list:
+            repo_id = item['repo_id']
+            data = item['parsed_data']
+
+            repos_to_stage.append((repo_id, data['contributors_count']))
+            for login in data['contributors']:
+                contributors_to_insert.append((repo_id, login))
+            for dep in data['dependencies']:
+                dependencies_to_insert.append((
+                    repo_id,
+                    dep['package'],
+                    dep.get('requirements', ''),
+                    dep.get('manifest', '')
+                ))
+
+        async with self.acquire('save_repo_enrichment') as conn:
+            async with conn.transaction():
+                await self._create_staging_tables(conn)
+
+                await conn.copy_records_to_table(
+                    'repos_staging', records=repos_to_stage,
+                    columns=('repo_id', 'contributors_count')
+                )
+                await conn.execute("""
+                    UPDATE repos r
+                    SET contributors_count = s.contributors_count, enriched_at = NOW()
+                    FROM repos_staging s
+                    WHERE r.repo_id = s.repo_id
+                """)
+
+                await conn.copy_records_to_table(
+                    'contributors_staging', records=contributors_to_insert,
+                    columns=('repo_id', 'login')
+                )
+                await conn.copy_records_to_table(
+                    'dependencies_staging', records=dependencies_to_insert,
+                    columns=('repo_id', 'package_name', 'requirements', 'manifest_filename')
+                )
+
+                written = await self._merge_child_rows(
+                    conn, 'repo_contributors', 'contributors_staging',
+                    match_columns=('login',)
+                )
+                written += await self._merge_child_rows(
+                    conn, 'repo_dependencies', 'dependencies_staging',
+                    match_columns=('package_name', 'requirements', 'manifest_filename')
+                )
+
+                await self._bump_data_generation(conn)
+
+                print(f"  💾 Enrichment lane saved {len(repos_to_stage)} repos "
+                      f"({written} child rows changed)")
 
     async def mark_repos_as_processed(self, repo_ids):
         """Mark repos in repo_queue as processed."""
         if not repo_ids:
             return
         
-        async with self.pool.acquire() as conn:
+        async with self.acquire('mark_repos_as_processed') as conn:
             await conn.execute("""
                 UPDATE repo_queue 
                 SET processed = TRUE 
@@ -395,28 +1430,49 @@ class DBHelper:
             """, repo_ids)
             print(f"  ✅ Marked {len(repo_ids)} repos as processed")
 
-    async def execute_query(self, sql_query: str, limit: int = 100):
+    async def execute_query(self, sql_query: str, limit: int = 100, params=()):
         """
         Execute a SELECT query and return results.
         Safe wrapper that only allows SELECT queries.
+        params fill $1, $2... placeholders (helpers.intent_matcher templates).
+
+        Runs on the small adhoc pool in a read-only transaction with SET LOCAL
+        limits, after an EXPLAIN whose estimate has to stay under the cost and
+        row ceilings, so one bad generated join can't hog the database.
         """
-        sql_upper = sql_query.upper().strip()
-        
+        sql_query = _strip_sql_comments(sql_query)
+
         # Ensure it's a SELECT query
-        if not sql_upper.startswith('SELECT'):
+        if not sql_query.upper().startswith('SELECT'):
             raise ValueError("Only SELECT queries are allowed")
-        
-        # Add LIMIT if not present
-        if 'LIMIT' not in sql_upper:
-            sql_query = sql_query.rstrip(';') + f' LIMIT {limit}'
-        
-        async with self.pool.acquire() as conn:
-            # Set timeout
-            await conn.execute("SET statement_timeout = '5s'")
-            
-            # Execute query
-            rows = await conn.fetch(sql_query)
-            
+
+        # the estimate is taken with the limit applied, that's all we'll ever read
+        limited_query = f"SELECT * FROM (\n{sql_query}\n) AS adhoc LIMIT {int(limit)}"
+
+        async with self.acquire_read('execute_query', adhoc=True) as conn:
+            async with conn.transaction(readonly=True):
+                # LOCAL: gone at commit, nothing leaks to the next user of the connection
+                await conn.execute(f"SET LOCAL statement_timeout = '{ADHOC_STATEMENT_TIMEOUT_MS}ms'")
+                await conn.execute(f"SET LOCAL work_mem = '{ADHOC_WORK_MEM}'")
+
+                plan = json.loads(await conn.fetchval(f"EXPLAIN (FORMAT JSON) {limited_query}", *params))[0]['Plan']
+                cost, plan_rows = plan['Total Cost'], _max_plan_rows(plan)
+                if cost > ADHOC_MAX_COST:
+                    raise ValueError(f"Query too expensive: estimated cost {cost:.0f} > {ADHOC_MAX_COST:.0f}")
+                if plan_rows > ADHOC_MAX_PLAN_ROWS:
+                    raise ValueError(f"Query too expensive: a plan step estimates {plan_rows:.0f} rows "
+                                     f"> {ADHOC_MAX_PLAN_ROWS:.0f}")
+
+                # read the first `limit` rows off a cursor instead of running limited_query:
+                # an outer LIMIT doesn't promise to keep the subquery's ORDER BY, a cursor does,
+                # and no LIMIT inside a subquery or a string can dodge fetch(limit)
+                try:
+                    cursor = await conn.cursor(sql_query, *params)
+                    rows = await cursor.fetch(int(limit))
+                    conn.rows += len(rows)
+                except asyncpg.QueryCanceledError:
+                    raise ValueError(f"Query took longer than {ADHOC_STATEMENT_TIMEOUT_MS}ms")
+
             # Get column names from first row if available
             if rows:
                 columns = list(rows[0].keys())
@@ -427,56 +1483,248 @@ class DBHelper:
                 # For asyncpg, we need to execute and check
                 columns = []
                 results = []
-            
+
             return columns, results
-    
+
+    async def get_cached_sql(self, question_hash: str):
+        """Generated SQL from the shared cache table, or None. Marks the row as used."""
+        async with self.acquire('get_cached_sql') as conn:
+            return await conn.fetchval("""
+                UPDATE generated_sql_cache
+                SET hits = hits + 1, last_used_at = NOW()
+                WHERE question_hash = $1
+                RETURNING sql
+            """, question_hash)
+
+    async def save_cached_sql(self, question_hash: str, question: str, sql: str, max_rows: int):
+        """Upsert a generated query and trim the table to the max_rows most recently used"""
+        async with self.acquire('save_cached_sql') as conn:
+            await conn.execute("""
+                INSERT INTO generated_sql_cache (question_hash, question, sql)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (question_hash) DO UPDATE
+                SET sql = EXCLUDED.sql, last_used_at = NOW()
+            """, question_hash, question, sql)
+            # saves only happen after an LLM call, so this scan of the index is cheap by comparison
+            await conn.execute("""
+                DELETE FROM generated_sql_cache
+                WHERE question_hash IN (
+                    SELECT question_hash FROM generated_sql_cache
+                    ORDER BY last_used_at DESC
+                    OFFSET $1
+                )
+            """, max_rows)
+
+    async def load_cached_sql(self, limit: int):
+        """Most recently used (question_hash, sql) pairs, for warming the in-process cache"""
+        async with self.acquire('load_cached_sql') as conn:
+            rows = await conn.fetch("""
+                SELECT question_hash, sql FROM generated_sql_cache
+                ORDER BY last_used_at DESC
+                LIMIT $1
+            """, limit)
+            return [(row['question_hash'], row['sql']) for row in rows]
+
     async def get_all_repos(self, limit: int = 100):
         """Get all repos with limit"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire_read('get_all_repos') as conn:
             rows = await conn.fetch("""
                 SELECT * FROM repos 
                 ORDER BY stars DESC 
                 LIMIT $1
             """, limit)
             return [dict(row) for row in rows]
-    
+
+    async def get_repos_page(self, limit: int = 100, cursor: str = None, fields=None):
+        """
+        One page of repos ordered by stars, keyset paginated on (stars, repo_id).
+
+        Returns (rows, next_cursor); next_cursor is None on the last page.
+        """
+        columns = _repo_projection(fields)
+        after = decode_repo_cursor(cursor) if cursor else None
+
+        # one row past the page tells us whether there is a next page at all
+        async with self.acquire_read('get_repos_page') as conn:
+            if after:
+                rows = await conn.fetch(f"""
+                    SELECT {columns} FROM repos
+                    WHERE (stars, repo_id) < ($1, $2)
+                    ORDER BY stars DESC, repo_id DESC
+                    LIMIT $3
+                """, after[0], after[1], limit + 1)
+            else:
+                rows = await conn.fetch(f"""
+                    SELECT {columns} FROM repos
+                    ORDER BY stars DESC, repo_id DESC
+                    LIMIT $1
+                """, limit + 1)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_repo_cursor(rows[-1]['stars'], rows[-1]['repo_id'])
+        return [dict(row) for row in rows], next_cursor
+
+    async def iter_repos(self, fields=None, cursor: str = None, batch_size: int = 1000):
+        """
+        Every repo (from `cursor` on) in the same order as get_repos_page, one keyset
+        page of batch_size at a time. The connection goes back to the pool before rows
+        are handed out, so a slow reader holds neither a connection nor an old snapshot.
+        """
+        while True:
+            rows, cursor = await self.get_repos_page(limit=batch_size, cursor=cursor, fields=fields)
+            for row in rows:
+                yield row
+            if cursor is None:
+                return
+
     async def get_repo_by_id(self, repo_id: int):
         """Get a single repo by repo_id"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire_read('get_repo_by_id') as conn:
             row = await conn.fetchrow("""
                 SELECT * FROM repos WHERE repo_id = $1
             """, repo_id)
             return dict(row) if row else None
     
-    async def get_stats(self):
-        """Get database statistics"""
-        async with self.pool.acquire() as conn:
-            total_repos = await conn.fetchval("SELECT COUNT(*) FROM repos")
-            
-            # Calculate healthy repos (active with good activity)
-            healthy_repos = await conn.fetchval("""
-                SELECT COUNT(*) FROM repos 
-                WHERE commits_last_30_days > 0 AND activity_score > 10
+    async def get_repos_by_ids(self, repo_ids=(), repo_names=(), fields=None, include=()):
+        """
+        Many repos in one round trip: WHERE repo_id = ANY($1) OR repo_name = ANY($2).
+
+        include may hold 'languages' and/or 'topics', aggregated per repo through
+        lateral joins in the same query. Returns rows in no particular order.
+        """
+        unknown = [name for name in include if name not in REPO_BATCH_INCLUDES]
+        if unknown:
+            raise ValueError(f"Unknown include: {', '.join(unknown)}")
+
+        projection = _repo_projection(fields)
+        if projection == '*':
+            projection = 'r.*'
+        else:
+            columns = projection.split(', ')
+            # names have to come back so callers can match what they asked for
+            if 'repo_name' not in columns:
+                columns.append('repo_name')
+            projection = ', '.join(f'r.{column}' for column in columns)
+
+        select = [projection]
+        joins = []
+        if 'languages' in include:
+            select.append('l.languages')
+            joins.append("""
+                LEFT JOIN LATERAL (
+                    SELECT json_agg(json_build_object(
+                               'language_name', language_name, 'size_bytes', size_bytes, 'percentage', percentage
+                           ) ORDER BY size_bytes DESC) AS languages
+                    FROM repo_languages WHERE repo_id = r.repo_id
+                ) l ON TRUE
+            """)
+        if 'topics' in include:
+            select.append('t.topics')
+            joins.append("""
+                LEFT JOIN LATERAL (
+                    SELECT array_agg(topic_name ORDER BY topic_name) AS topics
+                    FROM repo_topics WHERE repo_id = r.repo_id
+                ) t ON TRUE
             """)
-            
-            avg_stars = await conn.fetchval("SELECT AVG(stars) FROM repos WHERE stars > 0")
-            
-            # Most popular language
-            lang_row = await conn.fetchrow("""
-                SELECT language_name, COUNT(*) as count
-                FROM repo_languages
-                GROUP BY language_name
-                ORDER BY count DESC
-                LIMIT 1
+
+        async with self.acquire_read('get_repos_by_ids') as conn:
+            rows = await conn.fetch(f"""
+                SELECT {', '.join(select)}
+                FROM repos r
+                {''.join(joins)}
+                WHERE r.repo_id = ANY($1::bigint[]) OR r.repo_name = ANY($2::text[])
+            """, list(repo_ids), list(repo_names))
+
+        repos = []
+        for row in rows:
+            repo = dict(row)
+            if 'languages' in include:
+                repo['languages'] = json.loads(repo['languages']) if repo['languages'] else []
+            if 'topics' in include:
+                repo['topics'] = repo['topics'] or []
+            repos.append(repo)
+        return repos
+
+    async def get_metric_growth(self, since, until=None, metric: str = "stars", limit: int = 20):
+        """
+        Repos whose metric grew the most between `since` and `until` (default now).
+
+        Growth is the last snapshot in the window minus the last snapshot before it,
+        or minus the first snapshot in the window for repos we first saw inside it.
+        Only repos with a snapshot in the window can have grown, so this is a BRIN
+        range scan plus one index lookup per changed repo.
+        """
+        if metric not in HISTORY_METRICS:
+            raise ValueError(f"Unknown metric {metric!r}, expected one of {HISTORY_METRICS}")
+
+        async with self.acquire_read('get_metric_growth') as conn:
+            rows = await conn.fetch(f"""
+                WITH changed AS (
+                    SELECT DISTINCT ON (repo_id) repo_id, {metric} AS latest
+                    FROM repo_metrics_history
+                    WHERE captured_at >= $1 AND captured_at < COALESCE($2, NOW()::timestamp)
+                    ORDER BY repo_id, captured_at DESC
+                )
+                SELECT c.repo_id, r.repo_name, c.latest AS {metric},
+                       c.latest - COALESCE(before.value, first_in.value) AS growth
+                FROM changed c
+                JOIN repos r ON r.repo_id = c.repo_id
+                LEFT JOIN LATERAL (
+                    SELECT h.{metric} AS value FROM repo_metrics_history h
+                    WHERE h.repo_id = c.repo_id AND h.captured_at < $1
+                    ORDER BY h.captured_at DESC LIMIT 1
+                ) before ON TRUE
+                LEFT JOIN LATERAL (
+                    SELECT h.{metric} AS value FROM repo_metrics_history h
+                    WHERE h.repo_id = c.repo_id AND h.captured_at >= $1
+                    ORDER BY h.captured_at ASC LIMIT 1
+                ) first_in ON TRUE
+                ORDER BY growth DESC NULLS LAST
+                LIMIT $3
+            """, since, until, limit)
+            return [dict(row) for row in rows]
+
+    async def get_repo_metrics_history(self, repo_id: int, since=None):
+        """Snapshots for one repo, oldest first"""
+        async with self.acquire_read('get_repo_metrics_history') as conn:
+            rows = await conn.fetch("""
+                SELECT captured_at, stars, forks, open_issues, closed_issues
+                FROM repo_metrics_history
+                WHERE repo_id = $1 AND ($2::timestamp IS NULL OR captured_at >= $2)
+                ORDER BY captured_at
+            """, repo_id, since)
+            return [dict(row) for row in rows]
+
+    async def get_stats(self):
+        """Get database statistics from the rollups, a single-row lookup whatever the table sizes"""
+        async with self.acquire_read('get_stats') as conn:
+            row = await conn.fetchrow("""
+                SELECT s.total_repos, s.healthy_repos, s.starred_repos, s.stars_sum,
+                       (SELECT language_name FROM language_popularity
+                        ORDER BY repo_count DESC, language_name LIMIT 1) AS most_popular_language
+                FROM repo_stats_rollup s
             """)
-            
-            most_popular_language = lang_row['language_name'] if lang_row else None
-            
+
+            if not row:
+                return {
+                    "total_repos": 0,
+                    "healthy_repos": 0,
+                    "avg_stars": 0.0,
+                    "most_popular_language": None
+                }
+
             return {
-                "total_repos": total_repos or 0,
-                "healthy_repos": healthy_repos or 0,
-                "avg_stars": float(avg_stars) if avg_stars else 0.0,
-                "most_popular_language": most_popular_language
+                "total_repos": row['total_repos'],
+                "healthy_repos": row['healthy_repos'],
+                "avg_stars": row['stars_sum'] / row['starred_repos'] if row['starred_repos'] else 0.0,
+                "most_popular_language": row['most_popular_language']
             }
 
-
+    async def refresh_stats_rollup(self):
+        """Recompute the rollups from scratch, repairs drift from concurrent writers"""
+        async with self.acquire('refresh_stats_rollup') as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT refresh_repo_rollups()")
+                await self._bump_data_generation(conn)
@@ -0,0 +1,161 @@
+## per-statement timing for DBHelper
+## every DBHelper call goes through DBHelper.acquire(name), which records latency, pool wait
+## and rows per short statement name, so we can see which call is eating the db time
+
+import asyncio
+import time
+
+# upper bounds in ms, the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+
+def rows_from_result(result):
+    """Best effort row count for whatever an asyncpg call returned."""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, str):
+        # status strings like 'INSERT 0 3', 'DELETE 2', 'COPY 100'
+        try:
+            return int(result.rsplit(' ', 1)[-1])
+        except ValueError:
+            return 0
+    if result is None:
+        return 0
+    return 1
+
+
+class StatementStats:
+    __slots__ = ('calls', 'errors', 'total_ms', 'max_ms', 'pool_wait_ms', 'rows', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.pool_wait_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+
+    def percentile(self, q):
+        """Upper bound of the histogram bucket that holds the q-th percentile."""
+        if not self.calls:
+            return 0.0
+        target = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound if bound != float('inf') else self.max_ms
+        return self.max_ms
+
+
+class QueryMetrics:
+    def __init__(self):
+        self.stats = {}
+
+    def record(self, name, elapsed_ms, pool_wait_ms=0.0, rows=0, error=False):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = StatementStats()
+
+        stats.calls += 1
+        stats.errors += int(error)
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        stats.pool_wait_ms += pool_wait_ms
+        stats.rows += rows
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                stats.buckets[i] += 1
+                break
+
+    def snapshot(self):
+        """Plain dict per statement name, sorted by total time spent, for logs or a /metrics endpoint"""
+        result = {}
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].total_ms):
+            result[name] = {
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "total_ms": round(stats.total_ms, 2),
+                "avg_ms": round(stats.total_ms / stats.calls, 2),
+                "p50_ms": stats.percentile(0.50),
+                "p95_ms": stats.percentile(0.95),
+                "p99_ms": stats.percentile(0.99),
+                "max_ms": round(stats.max_ms, 2),
+                "avg_pool_wait_ms": round(stats.pool_wait_ms / stats.calls, 2),
+                "rows": stats.rows,
+                "histogram": dict(zip(map(str, LATENCY_BUCKETS_MS), stats.buckets)),
+            }
+        return result
+
+    def reset(self):
+        self.stats = {}
+
+    def log_summary(self, reset=False):
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        print("📊 DB statement summary (sorted by total time)")
+        print(f"  {'statement':<32} {'calls':>7} {'errors':>6} {'total ms':>10} {'avg':>8} "
+              f"{'p95':>8} {'wait':>7} {'rows':>9}")
+        for name, s in snapshot.items():
+            print(f"  {name:<32} {s['calls']:>7} {s['errors']:>6} {s['total_ms']:>10.1f} {s['avg_ms']:>8.2f} "
+                  f"{s['p95_ms']:>8} {s['avg_pool_wait_ms']:>7.2f} {s['rows']:>9}")
+        if reset:
+            self.reset()
+
+    async def report_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.log_summary(reset=True)
+
+
+class InstrumentedConnection:
+    """
+    Thin wrapper over a pooled asyncpg connection that counts rows for the
+    statement it belongs to. Everything else is passed straight through.
+    """
+
+    __slots__ = ('_conn', 'rows')
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.rows = 0
+
+    def __getattr__(self, attr):
+        return getattr(self._conn, attr)
+
+    async def fetch(self, *args, **kwargs):
+        result = await self._conn.fetch(*args, **kwargs)
+        self.rows += len(result)
+        return result
+
+    async def fetchrow(self, *args, **kwargs):
+        result = await self._conn.fetchrow(*args, **kwargs)
+        self.rows += rows_from_result(result)
+        return result
+
+    async def fetchval(self, *args, **kwargs):
+        result = await self._conn.fetchval(*args, **kwargs)
+        self.rows += 1
+        return result
+
+    async def execute(self, *args, **kwargs):
+        result = await self._conn.execute(*args, **kwargs)
+        self.rows += rows_from_result(result)
+        return result
+
+    async def executemany(self, command, args, **kwargs):
+        args = list(args)
+        result = await self._conn.executemany(command, args, **kwargs)
+        self.rows += len(args)
+        return result
+
+    async def copy_records_to_table(self, *args, **kwargs):
+        result = await self._conn.copy_records_to_table(*args, **kwargs)
+        self.rows += rows_from_result(result)
+        return result
+
+
+def now_ms():
+    return time.perf_counter() * 1000
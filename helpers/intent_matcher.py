@@ -0,0 +1,170 @@
+## local fast path for /query: the question shapes from SCHEMA_CONTEXT's examples turned into
+## regex templates that produce parameterized SQL in microseconds. anything that doesn't match
+## (or names a language we don't know) still goes to the LLM
+
+import re
+from collections import namedtuple
+from decimal import Decimal
+
+IntentMatch = namedtuple('IntentMatch', ['intent', 'sql', 'params'])
+
+# never hand out more rows than this, whatever N the question asks for
+MAX_ROWS = 1000
+DEFAULT_N = 10
+# repos.stars is an INTEGER, a bigger threshold would fail to bind instead of matching nothing
+INT4_MAX = 2**31 - 1
+
+# lower-cased spelling -> language_name as github linguist writes it in repo_languages
+LANGUAGES = {
+    'python': 'Python', 'py': 'Python',
+    'javascript': 'JavaScript', 'js': 'JavaScript',
+    'typescript': 'TypeScript', 'ts': 'TypeScript',
+    'java': 'Java', 'kotlin': 'Kotlin', 'scala': 'Scala', 'groovy': 'Groovy', 'clojure': 'Clojure',
+    'go': 'Go', 'golang': 'Go',
+    'rust': 'Rust', 'c': 'C', 'c++': 'C++', 'cpp': 'C++', 'c#': 'C#', 'csharp': 'C#',
+    'ruby': 'Ruby', 'php': 'PHP', 'swift': 'Swift', 'objective-c': 'Objective-C',
+    'dart': 'Dart', 'elixir': 'Elixir', 'erlang': 'Erlang', 'haskell': 'Haskell',
+    'ocaml': 'OCaml', 'f#': 'F#', 'lua': 'Lua', 'perl': 'Perl', 'r': 'R', 'julia': 'Julia',
+    'zig': 'Zig', 'nim': 'Nim', 'crystal': 'Crystal', 'shell': 'Shell', 'bash': 'Shell',
+    'powershell': 'PowerShell', 'html': 'HTML', 'css': 'CSS', 'scss': 'SCSS', 'vue': 'Vue',
+    'svelte': 'Svelte', 'jupyter notebook': 'Jupyter Notebook', 'jupyter': 'Jupyter Notebook',
+    'solidity': 'Solidity', 'matlab': 'MATLAB', 'fortran': 'Fortran', 'assembly': 'Assembly',
+    'dockerfile': 'Dockerfile', 'hcl': 'HCL', 'terraform': 'HCL', 'nix': 'Nix', 'v': 'V',
+}
+
+PREFIX = (r"(?:(?:please\s+)?(?:show|list|find|give|get|display|fetch|return|what are|which are)"
+          r"(?:\s+me)?\s+)?(?:the\s+|all\s+)?")
+REPOS = r"(?:repos?|repositories|repository|projects?)"
+NUM = r"\d[\d,]*(?:\.\d+)?\s?[km]?"
+TOP = r"(?:top|best|most starred|most popular|biggest|largest)"
+OPERATORS = {
+    'more than': '>', 'over': '>', 'above': '>', 'greater than': '>', 'at least': '>=',
+    'fewer than': '<', 'less than': '<', 'under': '<', 'below': '<', 'at most': '<=',
+}
+OPERATOR = '|'.join(sorted(OPERATORS, key=len, reverse=True))
+# one or two words: "machine learning" is a topic, "machine learning in python" is a question for the LLM
+TOPIC = r"[a-z0-9][a-z0-9+#.\-]{0,24}(?:\s[a-z0-9][a-z0-9+#.\-]{0,24})?"
+# a topic that has one of these in it is really a filter on something else
+TOPIC_STOPWORDS = {'in', 'with', 'by', 'for', 'from', 'using', 'written', 'and', 'or', 'than', 'over', 'under'}
+
+
+def _compile(pattern):
+    return re.compile('^' + pattern + '$')
+
+
+# (intent, regex), first match wins, so the more specific shapes go first
+TEMPLATES = [
+    ('repo_count_by_stars', _compile(
+        rf"(?:how many|count(?: of)?|number of)\s+{REPOS}\s+(?:have|with|having|that have|has)?\s*"
+        rf"(?P<op>{OPERATOR})\s+(?P<x>{NUM})\s+stars?"
+    )),
+    ('repos_by_stars', _compile(
+        rf"{PREFIX}(?:(?:top\s+)?(?P<n>{NUM})\s+)?{REPOS}\s+(?:with|having|that have)\s+"
+        rf"(?P<op>{OPERATOR})\s+(?P<x>{NUM})\s+stars?"
+    )),
+    ('popular_languages', _compile(
+        rf"{PREFIX}(?:most popular|top|popular|most common|most used)\s+(?:(?P<n>{NUM})\s+)?"
+        rf"(?:programming\s+)?languages"
+    )),
+    ('popular_topics', _compile(
+        rf"{PREFIX}(?:most popular|top|popular|most common|most used)\s+(?:(?P<n>{NUM})\s+)?topics"
+    )),
+    ('repos_by_topic', _compile(
+        rf"{PREFIX}(?:{TOP}\s+)?(?:(?P<n>{NUM})\s+)?{REPOS}\s+"
+        rf"(?:about|related to|tagged(?: with)?|with (?:the )?topic|on the topic of)\s+(?P<topic>{TOPIC})"
+    )),
+    ('most_active_repos', _compile(
+        rf"{PREFIX}(?:top\s+)?(?:(?P<n>{NUM})\s+)?(?:most active|busiest)\s+{REPOS}"
+        rf"(?:\s+(?:in|over) the (?:last|past) (?:30 days|month))?"
+    )),
+    ('most_active_repos', _compile(
+        rf"{PREFIX}{REPOS}\s+with\s+(?:the\s+)?(?:high|highest|most|a lot of)\s+activity"
+        rf"(?:\s+(?:in|over) the (?:last|past) (?:30 days|month))?"
+    )),
+    ('top_repos_by_language', _compile(
+        rf"{PREFIX}(?:{TOP}\s+)?(?:(?P<n>{NUM})\s+)?(?P<lang>[a-z0-9+#.\-]+(?:\s[a-z0-9+#.\-]+)?)\s+{REPOS}"
+    )),
+    ('top_repos_by_language', _compile(
+        rf"{PREFIX}(?:{TOP}\s+)?(?:(?P<n>{NUM})\s+)?{REPOS}\s+(?:in|written in|using)\s+(?P<lang>[a-z0-9+#.\-]+(?:\s[a-z0-9+#.\-]+)?)"
+    )),
+    ('top_repos', _compile(
+        rf"{PREFIX}{TOP}\s+(?:(?P<n>{NUM})\s+)?(?:starred\s+)?{REPOS}"
+    )),
+]
+
+SQL = {
+    'repo_count_by_stars': "SELECT COUNT(*) FROM repos WHERE stars {op} $1",
+    'repos_by_stars': "SELECT repo_name, stars, forks FROM repos WHERE stars {op} $1 ORDER BY stars DESC LIMIT $2",
+    # the rollup tables from migration 5 already hold these counts
+    'popular_languages': "SELECT language_name, repo_count FROM language_popularity "
+                         "ORDER BY repo_count DESC, language_name LIMIT $1",
+    'popular_topics': "SELECT topic_name, repo_count FROM topic_popularity "
+                      "ORDER BY repo_count DESC, topic_name LIMIT $1",
+    'repos_by_topic': "SELECT DISTINCT r.repo_name, r.stars FROM repos r "
+                      "JOIN repo_topics rt ON r.repo_id = rt.repo_id "
+                      "WHERE rt.topic_name ILIKE $1 ORDER BY r.stars DESC LIMIT $2",
+    'most_active_repos': "SELECT repo_name, stars, commits_last_30_days, activity_score FROM repos "
+                         "ORDER BY commits_last_30_days DESC LIMIT $1",
+    'top_repos_by_language': "SELECT repo_name, stars, forks FROM repos WHERE repo_id IN "
+                             "(SELECT repo_id FROM repo_languages WHERE language_name = $1) "
+                             "ORDER BY stars DESC LIMIT $2",
+    'top_repos': "SELECT repo_name, stars, forks FROM repos ORDER BY stars DESC LIMIT $1",
+}
+
+
+def normalize(question: str) -> str:
+    """Lower-case, drop punctuation that can't be part of a name (keeps c++, c#, .net, k8s-operator)"""
+    question = re.sub(r"[?!,;:\"'()]+(?=\s|$)", ' ', question.lower())
+    return ' '.join(question.split()).rstrip('.')
+
+
+def parse_number(text: str) -> int:
+    """'10' -> 10, '1,000' -> 1000, '5k' -> 5000, '1.5m' -> 1500000"""
+    text = text.replace(',', '').replace(' ', '')
+    multiplier = 1
+    if text[-1] in 'km':
+        multiplier = 1000 if text[-1] == 'k' else 1_000_000
+        text = text[:-1]
+    # Decimal, not float: int(inf) raises on a long run of digits
+    return int(Decimal(text) * multiplier)
+
+
+def match_intent(question: str, limit: int = 100):
+    """
+    IntentMatch(intent, sql, params) for a question we can answer without the LLM, or None.
+    `limit` caps the N a question asks for, like the LIMIT execute_query appends.
+    """
+    text = normalize(question)
+    for intent, pattern in TEMPLATES:
+        m = pattern.match(text)
+        if m is None:
+            continue
+        groups = m.groupdict()
+
+        n = parse_number(groups['n']) if groups.get('n') else DEFAULT_N
+        n = max(1, min(n, limit, MAX_ROWS))
+
+        if intent in ('repo_count_by_stars', 'repos_by_stars'):
+            sql = SQL[intent].format(op=OPERATORS[groups['op']])
+            stars = min(parse_number(groups['x']), INT4_MAX)
+            params = (stars,) if intent == 'repo_count_by_stars' else (stars, n)
+            return IntentMatch(intent, sql, params)
+
+        if intent == 'top_repos_by_language':
+            language = LANGUAGES.get(groups['lang'])
+            if language is None:
+                # "top 10 starred repos", "show me rust-lang repos", ... not ours to guess
+                continue
+            return IntentMatch(intent, SQL[intent], (language, n))
+
+        if intent == 'repos_by_topic':
+            if TOPIC_STOPWORDS.intersection(groups['topic'].split()):
+                # "repos about rust with ...", "repos about ai by ..."
+                continue
+            # github topics are lower-case and hyphenated: "machine learning" -> machine-learning
+            slug = re.sub(r"[\s_]+", '-', groups['topic'].strip())
+            return IntentMatch(intent, SQL[intent], (f"%{slug}%", n))
+
+        return IntentMatch(intent, SQL[intent], (n,))
+
+    return None
@@ -1,25 +1,126 @@
+## LRU cache on an OrderedDict: get/put/evict are O(1) (move_to_end / popitem)
+## optional per-entry ttl and a total byte budget, since query_engine keeps whole result sets in here.
+## one RLock around every operation, nothing in here awaits so it's fine to use from async code too
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def estimate_size(value):
+    """Rough deep size in bytes of the plain data we cache (lists/tuples/dicts of scalars)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key) + estimate_size(item)
+    return size
+
+
 class LRUCache:
-    def __init__(self, capacity: int):
+    def __init__(self, capacity: int, ttl: float = None, max_bytes: int = None, sizeof=estimate_size):
+        """
+        Args:
+            capacity: max number of entries
+            ttl: default seconds an entry stays valid, None keeps it until evicted
+            max_bytes: max total estimated size of the cached values, None for no limit
+            sizeof: function giving the size of a value, only called when max_bytes is set
+        """
         self.capacity = capacity
-        self.cache = {}
-        self.order = []  # Track access order
-    
-    def get(self, key: str):
-        if key in self.cache:
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.cache = OrderedDict()  # key -> (value, expires_at or None, size), oldest first
+        self.total_bytes = 0
+        self.lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=-1):
+        with self.lock:
+            entry = self.cache.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at, _ = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
             # Move to end (most recently used)
-            self.order.remove(key)
-            self.order.append(key)
-            return self.cache[key]
-        return -1
-    
-    def put(self, key: str, value):
-        if key in self.cache:
-            # Update existing
-            self.order.remove(key)
-        elif len(self.cache) >= self.capacity:
-            # Remove least recently used
-            lru_key = self.order.pop(0)
-            del self.cache[lru_key]
-        
-        self.cache[key] = value
-        self.order.append(key)
\ No newline at end of file
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl: float = None):
+        """Insert or replace key. Returns False if the value alone is bigger than max_bytes."""
+        ttl = self.ttl if ttl is None else ttl
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+
+        with self.lock:
+            if key in self.cache:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return False
+
+            expires_at = time.monotonic() + ttl if ttl is not None else None
+            self.cache[key] = (value, expires_at, size)
+            self.total_bytes += size
+
+            # Remove least recently used until we fit both bounds
+            while len(self.cache) > self.capacity or (
+                self.max_bytes is not None and self.total_bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self.cache.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.cache:
+                self._remove(key)
+                return True
+            return False
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        _, _, size = self.cache.pop(key)
+        self.total_bytes -= size
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __contains__(self, key):
+        # no recency / counter side effects, expired entries count as missing
+        with self.lock:
+            entry = self.cache.get(key, _MISSING)
+            return entry is not _MISSING and (entry[1] is None or time.monotonic() < entry[1])
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.cache),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,458 @@
+## versioned schema migrations
+## DBHelper.connect() used to run every CREATE/ALTER on each start of discovery, the processor and the api,
+## taking locks on hot tables each time. now the ddl lives here, gets applied once with
+##   python -m helpers.migrations
+## and connect() only checks schema_version
+
+import asyncio
+import os
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# any constant works, it only has to be the same for every process running migrations
+MIGRATION_LOCK_ID = 7_351_902
+
+# (version, description, sql) - append only, never edit a migration that has shipped
+MIGRATIONS = [
+    (1, "baseline schema", """
+        CREATE TABLE IF NOT EXISTS repo_activity (
+            id SERIAL PRIMARY KEY,
+            repo_id BIGINT UNIQUE,
+            repo_name TEXT,
+            activity_count INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS repo_queue (
+            id SERIAL PRIMARY KEY,
+            repo_id BIGINT UNIQUE,
+            repo_name TEXT,
+            activity_count INTEGER
+        );
+        ALTER TABLE repo_queue ADD COLUMN IF NOT EXISTS processed BOOLEAN DEFAULT FALSE;
+
+        CREATE TABLE IF NOT EXISTS url_queue (
+            id SERIAL PRIMARY KEY,
+            url TEXT UNIQUE NOT NULL,
+            done BOOLEAN DEFAULT FALSE,
+            scraped_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_url_queue_done ON url_queue(done);
+        CREATE INDEX IF NOT EXISTS idx_url_queue_url ON url_queue(url);
+        CREATE INDEX IF NOT EXISTS idx_url_queue_scraped_at ON url_queue(scraped_at);
+        CREATE INDEX IF NOT EXISTS idx_url_queue_created_at ON url_queue(created_at);
+
+        CREATE TABLE IF NOT EXISTS repos (
+            id SERIAL PRIMARY KEY,
+            repo_id BIGINT UNIQUE NOT NULL,
+            repo_name TEXT,
+            stars INTEGER DEFAULT 0,
+            forks INTEGER DEFAULT 0,
+            open_issues INTEGER DEFAULT 0,
+            closed_issues INTEGER DEFAULT 0,
+            subscribers INTEGER DEFAULT 0,
+            commits_last_30_days INTEGER DEFAULT 0,
+            contributors_count INTEGER DEFAULT 0,
+            activity_score INTEGER,
+            enriched_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+        -- databases created before repos had all of its columns
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS subscribers INTEGER DEFAULT 0;
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS commits_last_30_days INTEGER DEFAULT 0;
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS contributors_count INTEGER DEFAULT 0;
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS activity_score INTEGER;
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS enriched_at TIMESTAMP DEFAULT NOW();
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
+        -- we're using repos now
+        DROP TABLE IF EXISTS enriched_repos CASCADE;
+
+        CREATE TABLE IF NOT EXISTS repo_languages (
+            id SERIAL PRIMARY KEY,
+            repo_id BIGINT NOT NULL,
+            language_name TEXT NOT NULL,
+            size_bytes BIGINT,
+            percentage NUMERIC(5, 2),
+            FOREIGN KEY (repo_id) REFERENCES repos(repo_id) ON DELETE CASCADE,
+            UNIQUE(repo_id, language_name)
+        );
+
+        CREATE TABLE IF NOT EXISTS repo_topics (
+            id SERIAL PRIMARY KEY,
+            repo_id BIGINT NOT NULL,
+            topic_name TEXT NOT NULL,
+            FOREIGN KEY (repo_id) REFERENCES repos(repo_id) ON DELETE CASCADE,
+            UNIQUE(repo_id, topic_name)
+        );
+
+        CREATE TABLE IF NOT EXISTS repo_dependencies (
+            id SERIAL PRIMARY KEY,
+            repo_id BIGINT NOT NULL,
+            package_name TEXT NOT NULL,
+            requirements TEXT,
+            manifest_filename TEXT,
+            FOREIGN KEY (repo_id) REFERENCES repos(repo_id) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_repos_repo_id ON repos(repo_id);
+        CREATE INDEX IF NOT EXISTS idx_repo_languages_repo_id ON repo_languages(repo_id);
+        CREATE INDEX IF NOT EXISTS idx_repo_topics_repo_id ON repo_topics(repo_id);
+        CREATE INDEX IF NOT EXISTS idx_repo_dependencies_repo_id ON repo_dependencies(repo_id);
+    """),
+
+    (2, "push activity from gh archive PushEvents", """
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS pushes_last_30_days INTEGER DEFAULT 0;
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS pushers_last_30_days INTEGER DEFAULT 0;
+
+        CREATE TABLE IF NOT EXISTS repo_push_activity (
+            repo_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            commits INTEGER DEFAULT 0,
+            pushes INTEGER DEFAULT 0,
+            pusher_ids BIGINT[] DEFAULT '{}',
+            PRIMARY KEY (repo_id, day)
+        );
+        CREATE INDEX IF NOT EXISTS idx_repo_push_activity_day ON repo_push_activity(day);
+    """),
+
+    (3, "enrichment lane queue and contributors", """
+        CREATE TABLE IF NOT EXISTS repo_contributors (
+            id SERIAL PRIMARY KEY,
+            repo_id BIGINT NOT NULL,
+            login TEXT NOT NULL,
+            FOREIGN KEY (repo_id) REFERENCES repos(repo_id) ON DELETE CASCADE,
+            UNIQUE(repo_id, login)
+        );
+
+        CREATE TABLE IF NOT EXISTS enrichment_queue (
+            repo_id BIGINT PRIMARY KEY,
+            repo_name TEXT NOT NULL,
+            priority INTEGER DEFAULT 0,
+            next_run_at TIMESTAMP DEFAULT NOW(),
+            last_run_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_enrichment_queue_next_run
+            ON enrichment_queue(next_run_at, priority DESC);
+    """),
+
+    (4, "time-series metric snapshots", """
+        -- one row per repo per enrichment that actually changed a metric, monthly partitions
+        CREATE TABLE IF NOT EXISTS repo_metrics_history (
+            repo_id BIGINT NOT NULL,
+            captured_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            stars INTEGER,
+            forks INTEGER,
+            open_issues INTEGER,
+            closed_issues INTEGER
+        ) PARTITION BY RANGE (captured_at);
+
+        -- rows arrive in time order, so a BRIN index keeps window scans tiny
+        CREATE INDEX IF NOT EXISTS idx_repo_metrics_history_captured_at
+            ON repo_metrics_history USING BRIN (captured_at);
+        -- "last snapshot before the window" lookups per repo
+        CREATE INDEX IF NOT EXISTS idx_repo_metrics_history_repo
+            ON repo_metrics_history (repo_id, captured_at DESC);
+
+        CREATE OR REPLACE FUNCTION ensure_repo_metrics_partition(ts TIMESTAMP) RETURNS VOID AS $$
+        DECLARE
+            month_start TIMESTAMP := date_trunc('month', ts);
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF repo_metrics_history FOR VALUES FROM (%L) TO (%L)',
+                'repo_metrics_history_' || to_char(month_start, 'YYYY_MM'),
+                month_start,
+                month_start + INTERVAL '1 month'
+            );
+        END;
+        $$ LANGUAGE plpgsql;
+
+        SELECT ensure_repo_metrics_partition(NOW()::timestamp);
+        SELECT ensure_repo_metrics_partition((NOW() + INTERVAL '1 month')::timestamp);
+    """),
+
+    (5, "stats rollups", """
+        -- single row, kept up to date as deltas by the enrichment write transaction
+        CREATE TABLE IF NOT EXISTS repo_stats_rollup (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            total_repos BIGINT NOT NULL DEFAULT 0,
+            healthy_repos BIGINT NOT NULL DEFAULT 0,
+            starred_repos BIGINT NOT NULL DEFAULT 0,
+            stars_sum BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS language_popularity (
+            language_name TEXT PRIMARY KEY,
+            repo_count BIGINT NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_language_popularity_repo_count
+            ON language_popularity(repo_count DESC);
+
+        CREATE TABLE IF NOT EXISTS topic_popularity (
+            topic_name TEXT PRIMARY KEY,
+            repo_count BIGINT NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_topic_popularity_repo_count
+            ON topic_popularity(repo_count DESC);
+
+        -- full recompute, for seeding and for repairing drift from concurrent writers
+        CREATE OR REPLACE FUNCTION refresh_repo_rollups() RETURNS VOID AS $$
+        BEGIN
+            INSERT INTO repo_stats_rollup (id, total_repos, healthy_repos, starred_repos, stars_sum, updated_at)
+            SELECT TRUE,
+                   COUNT(*),
+                   COUNT(*) FILTER (WHERE commits_last_30_days > 0 AND activity_score > 10),
+                   COUNT(*) FILTER (WHERE stars > 0),
+                   COALESCE(SUM(stars) FILTER (WHERE stars > 0), 0),
+                   NOW()
+            FROM repos
+            ON CONFLICT (id) DO UPDATE SET
+                total_repos = EXCLUDED.total_repos,
+                healthy_repos = EXCLUDED.healthy_repos,
+                starred_repos = EXCLUDED.starred_repos,
+                stars_sum = EXCLUDED.stars_sum,
+                updated_at = EXCLUDED.updated_at;
+
+            DELETE FROM language_popularity;
+            INSERT INTO language_popularity (language_name, repo_count)
+            SELECT language_name, COUNT(*) FROM repo_languages GROUP BY language_name;
+
+            DELETE FROM topic_popularity;
+            INSERT INTO topic_popularity (topic_name, repo_count)
+            SELECT topic_name, COUNT(*) FROM repo_topics GROUP BY topic_name;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        SELECT refresh_repo_rollups();
+    """),
+
+    (6, "keyset pagination index for /repos", """
+        -- backs ORDER BY stars DESC, repo_id DESC with (stars, repo_id) < cursor, scanned backwards
+        CREATE INDEX IF NOT EXISTS idx_repos_stars_repo_id ON repos (stars, repo_id);
+    """),
+
+    (7, "data generation counter for api response caches", """
+        -- bumped in every write transaction that changes what the read endpoints return,
+        -- bump_data_generation() also NOTIFYs data_generation so api workers drop their caches
+        CREATE TABLE IF NOT EXISTS data_generation (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            generation BIGINT NOT NULL DEFAULT 0,
+            bumped_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        INSERT INTO data_generation DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+        CREATE OR REPLACE FUNCTION bump_data_generation() RETURNS BIGINT AS $$
+        DECLARE
+            new_generation BIGINT;
+        BEGIN
+            UPDATE data_generation
+            SET generation = generation + 1, bumped_at = NOW()
+            RETURNING generation INTO new_generation;
+            -- delivered on commit, dropped with the transaction on rollback
+            PERFORM pg_notify('data_generation', new_generation::text);
+            RETURN new_generation;
+        END;
+        $$ LANGUAGE plpgsql;
+    """),
+
+    (8, "shared question -> generated SQL cache", """
+        -- second tier behind query_engine.sql_cache, shared by every api worker and kept across restarts
+        CREATE TABLE IF NOT EXISTS generated_sql_cache (
+            question_hash TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            sql TEXT NOT NULL,
+            hits BIGINT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            last_used_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        -- eviction drops the least recently used rows, warm-up loads the most recent ones
+        CREATE INDEX IF NOT EXISTS idx_generated_sql_cache_last_used
+            ON generated_sql_cache (last_used_at DESC);
+    """),
+
+    (9, "repo_name lookups for /repos/batch", """
+        CREATE INDEX IF NOT EXISTS idx_repos_repo_name ON repos (repo_name);
+    """),
+
+    (10, "trending windows and leaderboards", """
+        -- events per repo per gh archive hour, kept for two of the longest window
+        CREATE TABLE IF NOT EXISTS repo_hourly_activity (
+            hour TIMESTAMP NOT NULL,
+            repo_id BIGINT NOT NULL,
+            events INTEGER NOT NULL,
+            PRIMARY KEY (hour, repo_id)
+        );
+        -- hours already folded into the windows, so a retried archive file isn't counted twice
+        CREATE TABLE IF NOT EXISTS trending_hours (
+            hour TIMESTAMP PRIMARY KEY,
+            recorded_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+
+        -- one row per rolling window, as_of is the latest archive hour it covers.
+        -- the leaderboard is stale while changes > leaderboard_changes
+        CREATE TABLE IF NOT EXISTS trending_windows (
+            window_name TEXT PRIMARY KEY,
+            hours INTEGER NOT NULL,
+            as_of TIMESTAMP,
+            changes BIGINT NOT NULL DEFAULT 0,
+            leaderboard_changes BIGINT NOT NULL DEFAULT 0
+        );
+        INSERT INTO trending_windows (window_name, hours)
+        VALUES ('1h', 1), ('24h', 24), ('7d', 168)
+        ON CONFLICT DO NOTHING;
+
+        -- events in (as_of - hours, as_of] and in the window before it
+        CREATE TABLE IF NOT EXISTS repo_trending (
+            window_name TEXT NOT NULL,
+            repo_id BIGINT NOT NULL,
+            events BIGINT NOT NULL DEFAULT 0,
+            prev_events BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (window_name, repo_id)
+        );
+
+        -- precomputed top-K per window for everything ('all', ''), per primary language and per topic
+        CREATE TABLE IF NOT EXISTS trending_leaderboard (
+            window_name TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            scope_value TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            repo_id BIGINT NOT NULL,
+            repo_name TEXT,
+            events BIGINT NOT NULL,
+            prev_events BIGINT NOT NULL,
+            velocity BIGINT NOT NULL,
+            PRIMARY KEY (window_name, scope, scope_value, rank)
+        );
+    """),
+
+    (11, "discovery activity filter state", """
+        -- helpers.sketches.ActivityFilter between Discovery runs, one row per filter
+        CREATE TABLE IF NOT EXISTS activity_filter_state (
+            name TEXT PRIMARY KEY,
+            hours INTEGER NOT NULL,
+            sketch BYTEA NOT NULL,
+            heavy_hitters BYTEA NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """),
+
+    (12, "distinct actor sketches from gh archive events", """
+        -- helpers.sketches.HyperLogLog of the actor ids per repo, day and event class
+        -- (actors, pushers, stargazers, issue_authors), unioned over the rolling window
+        CREATE TABLE IF NOT EXISTS repo_actor_sketches (
+            repo_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            event_class TEXT NOT NULL,
+            sketch BYTEA NOT NULL,
+            PRIMARY KEY (day, repo_id, event_class)
+        );
+        CREATE INDEX IF NOT EXISTS idx_repo_actor_sketches_repo_id ON repo_actor_sketches (repo_id);
+
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS actors_last_30_days INTEGER DEFAULT 0;
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS stargazers_last_30_days INTEGER DEFAULT 0;
+        ALTER TABLE repos ADD COLUMN IF NOT EXISTS issue_authors_last_30_days INTEGER DEFAULT 0;
+    """),
+
+    (13, "archive hours already in repo_push_activity", """
+        -- commits/pushes are summed per day, so a retried archive hour must not be added twice
+        CREATE TABLE IF NOT EXISTS push_activity_hours (
+            hour TIMESTAMP PRIMARY KEY,
+            recorded_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """),
+
+    (14, "drop popularity rows the delta fold left at zero", """
+        -- the fold deletes these itself from now on, a full refresh never wrote them
+        DELETE FROM language_popularity WHERE repo_count <= 0;
+        DELETE FROM topic_popularity WHERE repo_count <= 0;
+    """),
+
+    (15, "drop the unread pushers actor sketches", """
+        -- pushers_last_30_days comes from repo_push_activity, nothing reads these
+        DELETE FROM repo_actor_sketches WHERE event_class = 'pushers';
+    """),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+class SchemaOutOfDateError(RuntimeError):
+    pass
+
+
+async def get_schema_version(conn):
+    """Current schema version, 0 for a database that was never migrated."""
+    exists = await conn.fetchval("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not exists:
+        return 0
+    version = await conn.fetchval("SELECT MAX(version) FROM schema_version")
+    return version or 0
+
+
+async def check_schema_version(conn):
+    """Cheap startup check: one catalog lookup and one indexed max()."""
+    version = await get_schema_version(conn)
+    if version < SCHEMA_VERSION:
+        raise SchemaOutOfDateError(
+            f"Database schema is at version {version}, code needs {SCHEMA_VERSION}. "
+            f"Run: python -m helpers.migrations"
+        )
+    return version
+
+
+async def migrate(conn):
+    """Apply every pending migration, each in its own transaction. Returns the list of applied versions."""
+    # one migrator at a time, the others wait here and then find nothing to do
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+        current = await get_schema_version(conn)
+
+        applied = []
+        for version, description, sql in MIGRATIONS:
+            if version <= current:
+                continue
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES ($1, $2)",
+                    version, description
+                )
+            print(f"  ✅ Applied migration {version}: {description}")
+            applied.append(version)
+
+        return applied
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+
+async def main():
+    conn = await asyncpg.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME")
+    )
+    try:
+        applied = await migrate(conn)
+        if not applied:
+            print(f"Schema already at version {SCHEMA_VERSION}")
+        else:
+            print(f"Schema migrated to version {SCHEMA_VERSION}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,21 +1,50 @@
 import os
 import hashlib
+import re
+import threading
 from dotenv import load_dotenv
-from google import genai
+from helpers.intent_matcher import match_intent
 from helpers.lru import LRUCache
 import asyncio
 
 load_dotenv()
 
-CACHE_CAPACITY = 100
-query_cache = LRUCache(CACHE_CAPACITY)
+# tier 1: normalized question -> generated SQL. the schema rarely changes, so keep these for long,
+# that's what saves the gemini round trip
+SQL_CACHE_CAPACITY = int(os.getenv("SQL_CACHE_CAPACITY", 1000))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", 7 * 24 * 3600))
+sql_cache = LRUCache(SQL_CACHE_CAPACITY, ttl=SQL_CACHE_TTL)
+# behind it the generated_sql_cache table (migration 8), shared by every worker and kept across restarts
+SQL_CACHE_MAX_ROWS = int(os.getenv("SQL_CACHE_MAX_ROWS", 10000))
 
-gemini_api_key = os.getenv('GEMINI_API_KEY')
-print(f"Gemini API key: {gemini_api_key}")
-if not gemini_api_key:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
+# tier 2: normalized SQL + limit -> (columns, results). whole result sets live in here, so bound
+# the memory as well as the entry count. cleared whenever the data generation moves
+RESULT_CACHE_CAPACITY = int(os.getenv("RESULT_CACHE_CAPACITY", 100))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 600))
+result_cache = LRUCache(RESULT_CACHE_CAPACITY, ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MAX_BYTES)
 
-client = genai.Client(api_key=gemini_api_key)
+# last data_generation seen (see DBHelper.listen_data_generation), part of every result key
+data_generation = None
+
+# built on the first LLM call: google.genai takes most of a second to import and the api,
+# benches and tests that never reach the LLM shouldn't need a key at all
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        # generate_sql_query runs in worker threads, only build one client
+        with _client_lock:
+            if _client is None:
+                gemini_api_key = os.getenv('GEMINI_API_KEY')
+                if not gemini_api_key:
+                    raise ValueError("GEMINI_API_KEY not found in environment variables")
+                from google import genai
+                _client = genai.Client(api_key=gemini_api_key)
+    return _client
 
 SCHEMA_CONTEXT = """
 You are a SQL query generator for a GitHub repository database.
@@ -30,8 +59,13 @@ Columns:
 - open_issues (INTEGER) - Open issues count
 - closed_issues (INTEGER) - Closed issues count
 - subscribers (INTEGER) - Watchers/subscribers count
-- commits_last_30_days (INTEGER) - Commits in last 30 days
-- contributors_count (INTEGER) - Number of contributors
+- commits_last_30_days (INTEGER) - Commits pushed in last 30 days (from GitHub Archive PushEvents)
+- pushes_last_30_days (INTEGER) - Pushes in last 30 days
+- pushers_last_30_days (INTEGER) - Distinct users who pushed in last 30 days
+- actors_last_30_days (INTEGER) - Distinct users with any event on the repo in last 30 days (estimate)
+- stargazers_last_30_days (INTEGER) - Distinct users who starred in last 30 days (estimate)
+- issue_authors_last_30_days (INTEGER) - Distinct users who opened issues in last 30 days (estimate)
+- contributors_count (INTEGER) - Number of contributors (refreshed weekly)
 - activity_score (INTEGER) - Activity score from GitHub Archive
 - enriched_at (TIMESTAMP) - When data was enriched
 - updated_at (TIMESTAMP) - Last update time
@@ -40,6 +74,8 @@ Related Tables:
 - repo_languages (repo_id, language_name, size_bytes, percentage)
 - repo_topics (repo_id, topic_name)
 - repo_dependencies (repo_id, package_name, requirements, manifest_filename)
+- repo_contributors (repo_id, login)
+- repo_metrics_history (repo_id, captured_at, stars, forks, open_issues, closed_issues) - snapshot each time a metric changed
 
 Examples:
 Q: "Show me top 10 Python repos"
@@ -60,11 +96,14 @@ A: SELECT language_name, COUNT(*) as repo_count FROM repo_languages GROUP BY lan
 Generate ONLY the SQL query, no explanations, no markdown formatting.
 """
 
+# part of every question cache key, editing the prompt retires the SQL generated from the old one
+PROMPT_VERSION = hashlib.md5(SCHEMA_CONTEXT.encode()).hexdigest()[:12]
+
 
 def generate_sql_query(prompt: str) -> str:
     """Generate SQL query from natural language using Gemini"""
     try:
-        response = client.models.generate_content(
+        response = get_client().models.generate_content(
             model="gemini-2.0-flash-exp",
             contents=SCHEMA_CONTEXT + "\n\nQ: " + prompt + "\nA:"
         )
@@ -97,56 +136,122 @@ def is_safe_to_execute(query: str) -> bool:
     return True
 
 
+def normalize_question(question: str) -> str:
+    """Case, spacing and trailing punctuation don't change what's being asked"""
+    return ' '.join(question.lower().split()).rstrip(' ?!.')
+
+
+# a quoted literal (kept as is) or a run of whitespace (collapsed to one space)
+SQL_WHITESPACE = re.compile(r"('(?:[^']|'')*')|\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace outside string literals and drop the trailing semicolon"""
+    sql = SQL_WHITESPACE.sub(lambda m: m.group(1) or ' ', sql.strip())
+    return sql.rstrip('; ')
+
+
 def get_cache_key(question: str) -> str:
     """Generate a consistent cache key from question"""
-    normalized = question.lower().strip()
-    return hashlib.md5(normalized.encode()).hexdigest()
+    return hashlib.md5(f"{PROMPT_VERSION}:{normalize_question(question)}".encode()).hexdigest()
 
 
-async def execute_sql_query(question: str, db_helper, limit: int = 100):
+def set_data_generation(generation):
+    """Drop cached results once the writers bumped the data generation"""
+    global data_generation
+    if generation != data_generation:
+        data_generation = generation
+        result_cache.clear()
+
+
+async def get_sql_for_question(question: str, db_helper=None) -> str:
     """
-    Execute SQL query using db_helper.
-    Returns: (columns, results)
+    Generated SQL for a question. Looks in the process cache, then the shared
+    generated_sql_cache table (when a db_helper is given), and only then asks gemini.
     """
-    sql_query = generate_sql_query(question)
+    cache_key = get_cache_key(question)
+    sql_query = sql_cache.get(cache_key, None)
+    if sql_query is not None:
+        return sql_query
+
+    if db_helper is not None:
+        sql_query = await db_helper.get_cached_sql(cache_key)
+        # the table is writable by anything with db access, check it again before trusting it
+        if sql_query is not None and is_safe_to_execute(sql_query):
+            sql_cache.put(cache_key, sql_query)
+            return sql_query
+
+    # the gemini client is blocking, keep it off the event loop
+    sql_query = await asyncio.to_thread(generate_sql_query, question)
     print(f"Generated SQL: {sql_query}")
-    
+
     if not is_safe_to_execute(sql_query):
         raise ValueError(f"Unsafe SQL generated: {sql_query}")
-    
+
+    # only SQL that passed the check ever gets cached
+    sql_cache.put(cache_key, sql_query)
+    if db_helper is not None:
+        await db_helper.save_cached_sql(cache_key, normalize_question(question), sql_query, SQL_CACHE_MAX_ROWS)
+    return sql_query
+
+
+async def warm_sql_cache(db_helper):
+    """Fill the process cache from the shared table at startup, so a restart doesn't mean a burst of LLM calls"""
+    warmed = 0
+    rows = await db_helper.load_cached_sql(SQL_CACHE_CAPACITY)
+    # oldest first, so the most recently used questions end up most recent in the LRU too
+    for cache_key, sql_query in reversed(rows):
+        if is_safe_to_execute(sql_query):
+            sql_cache.put(cache_key, sql_query)
+            warmed += 1
+    return warmed
+
+
+async def resolve_question(question: str, db_helper=None, limit: int = 100):
+    """(sql, params) for a question: local template when one matches, else cached / generated SQL"""
+    match = match_intent(question, limit)
+    if match is not None:
+        return match.sql, match.params
+    return await get_sql_for_question(question, db_helper), ()
+
+
+async def execute_sql_query(question: str, db_helper, limit: int = 100):
+    """
+    Execute SQL query using db_helper.
+    Returns: (columns, results)
+    """
+    sql_query, params = await resolve_question(question, db_helper, limit)
+
     # Execute using db_helper
-    columns, results = await db_helper.execute_query(sql_query, limit=limit)
-    
+    columns, results = await db_helper.execute_query(sql_query, limit=limit, params=params)
+
     return columns, results
 
 
 async def execute_sql_query_cached(question: str, db_helper, limit: int = 100):
-    """Execute query with LRU caching"""
-    cache_key = get_cache_key(question)
-    
-    # Check cache
-    cached_result = query_cache.get(cache_key)
-    if cached_result != -1:  # Cache hit
+    """
+    Execute query with two cache tiers: question -> SQL, then SQL -> results.
+    Differently worded questions that generate the same SQL share one result entry.
+    Questions matching a helpers.intent_matcher template skip the LLM tier entirely.
+    """
+    sql_query, params = await resolve_question(question, db_helper, limit)
+
+    # taken before the query runs, a bump while it runs leaves the result under the old key
+    result_key = (data_generation, normalize_sql(sql_query), params, limit)
+    cached_result = result_cache.get(result_key, None)
+    if cached_result is not None:
         print(f"✓ Cache hit for: {question}")
         return cached_result
-    
-    # Cache miss - execute query
+
     print(f"✗ Cache miss for: {question}")
-    columns, results = await execute_sql_query(question, db_helper, limit)
-    
-    # Store in cache
-    query_cache.put(cache_key, (columns, results))
-    
-    return columns, results
+    columns, results = await db_helper.execute_query(sql_query, limit=limit, params=params)
+    result_cache.put(result_key, (columns, results))
 
+    return columns, results
 
-# Synchronous wrapper for Flask (since Flask is sync)
-def execute_sql_query_cached_sync(question: str, db_helper, limit: int = 100):
-    """Synchronous wrapper for Flask"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(execute_sql_query_cached(question, db_helper, limit))
-    finally:
-        loop.close()## 4. Create Flask API (`api.py`):
 
+def cache_stats():
+    return {
+        "sql": sql_cache.stats(),
+        "results": result_cache.stats(),
+    }
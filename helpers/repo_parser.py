@@ -0,0 +1,157 @@
+## batch parsing of graphql repository payloads straight into the row tuples the bulk writer needs,
+## no per-repo languages / percentages / topics / dependencies dicts to unpack again with .get calls
+
+
+class RepoBatch:
+    """
+    Row lists for one bulk write, one list per table.
+
+    repos rows: (repo_id, repo_name, stars, forks, open_issues, closed_issues, subscribers,
+                 commits_last_30_days, pushes_last_30_days, pushers_last_30_days, activity_score)
+    languages rows: (repo_id, language_name, size_bytes, percentage)
+    topics rows: (repo_id, topic_name)
+    dependencies rows: (repo_id, package_name, requirements, manifest_filename)
+
+    A child list that is None means the payloads didn't ask for that table at all,
+    so the writer leaves it untouched. An empty list means "this repo has none".
+    """
+
+    __slots__ = ("repos", "languages", "topics", "dependencies", "failed")
+
+    def __init__(self):
+        self.repos = []
+        self.languages = None
+        self.topics = None
+        self.dependencies = None
+        self.failed = []
+
+    @property
+    def repo_ids(self):
+        return [row[0] for row in self.repos]
+
+    @classmethod
+    def from_enriched(cls, enriched_data_list):
+        """Build a batch from the older list of {repo_id, repo_name, parsed_data} dicts."""
+        batch = cls()
+        batch.languages = []
+        batch.topics = []
+        if any('dependencies' in item['parsed_data'] for item in enriched_data_list):
+            batch.dependencies = []
+
+        for item in enriched_data_list:
+            repo_id = item['repo_id']
+            data = item['parsed_data']
+
+            batch.repos.append((
+                repo_id,
+                item['repo_name'],
+                data.get('stars', 0),
+                data.get('forks', 0),
+                data.get('open_issues', 0),
+                data.get('closed_issues', 0),
+                data.get('subscribers', 0),
+                data.get('commits_last_30_days', 0),
+                data.get('pushes_last_30_days', 0),
+                data.get('pushers_last_30_days', 0),
+                item.get('activity_score', 0)
+            ))
+
+            language_percentages = data.get('language_percentages', {})
+            for lang_name, size in data.get('languages', {}).items():
+                batch.languages.append((
+                    repo_id,
+                    lang_name,
+                    size,
+                    float(language_percentages.get(lang_name, 0))
+                ))
+
+            for topic_name in data.get('topics', {}).keys():
+                batch.topics.append((repo_id, topic_name))
+
+            for dep in data.get('dependencies', []):
+                batch.dependencies.append((
+                    repo_id,
+                    dep.get('package', ''),
+                    dep.get('requirements', ''),
+                    dep.get('manifest', '')
+                ))
+
+        return batch
+
+
+def parse_repo_batch(items, push_activity=None):
+    """
+    Parse graphql repository payloads into a RepoBatch.
+
+    Args:
+        items: iterable of (repo_id, repo_name, activity_score, repo_data) tuples
+        push_activity: optional {repo_id: {commits, pushes, pushers}} from
+            DBHelper.get_push_activity()
+
+    Repos whose payload is malformed are skipped and their ids collected in batch.failed.
+    """
+    push_activity = push_activity or {}
+    no_activity = {}
+
+    batch = RepoBatch()
+    repos = batch.repos
+    languages = batch.languages = []
+    topics = batch.topics = []
+    dependencies = None
+
+    for repo_id, repo_name, activity_score, repo_data in items:
+        lang_start = len(languages)
+        topic_start = len(topics)
+        dep_start = len(dependencies) if dependencies is not None else 0
+
+        try:
+            edges = repo_data["languages"]["edges"]
+            # totalSize covers every language, not just the first 10 edges we asked for
+            total_size = repo_data["languages"].get("totalSize")
+            if total_size is None:
+                total_size = 0
+                for edge in edges:
+                    total_size += edge["size"]
+            for edge in edges:
+                size = edge["size"]
+                percentage = size / total_size * 100 if total_size else 0.0
+                languages.append((repo_id, edge["node"]["name"], size, percentage))
+
+            for node in repo_data["repositoryTopics"]["nodes"]:
+                topics.append((repo_id, node["topic"]["name"]))
+
+            manifests = repo_data.get("dependencyGraphManifests")
+            if manifests is not None:
+                if dependencies is None:
+                    dependencies = batch.dependencies = []
+                for manifest in manifests.get("nodes") or ():
+                    filename = manifest["filename"]
+                    for dep in (manifest.get("dependencies") or {}).get("nodes") or ():
+                        dependencies.append(
+                            (repo_id, dep["packageName"], dep.get("requirements", ""), filename)
+                        )
+
+            activity = push_activity.get(repo_id, no_activity)
+            repos.append((
+                repo_id,
+                repo_name,
+                repo_data["stargazerCount"],
+                repo_data["forkCount"],
+                repo_data["openIssues"]["totalCount"],
+                repo_data["closedIssues"]["totalCount"],
+                repo_data["watchers"]["totalCount"],
+                activity.get("commits", 0),
+                activity.get("pushes", 0),
+                activity.get("pushers", 0),
+                activity_score
+            ))
+        except (KeyError, TypeError) as e:
+            print(f"❌ Error parsing repo {repo_id}: {e!r}")
+            # roll back any child rows this repo already appended
+            del languages[lang_start:]
+            del topics[topic_start:]
+            if dependencies is not None:
+                del dependencies[dep_start:]
+            batch.failed.append(repo_id)
+
+    return batch
@@ -0,0 +1,96 @@
+## read-through cache for the api's read endpoints
+## entries are tagged with the data generation they were loaded under (see migration 7),
+## a bump from the processor / enrichment writers invalidates everything at once.
+## the ttl is only a backstop for a missed NOTIFY (listener reconnecting, db failover)
+
+import asyncio
+import time
+
+
+def _consume_exception(task):
+    # errors reach every waiter through the shield, this only stops asyncio
+    # logging "exception never retrieved" when all of them went away
+    if not task.cancelled():
+        task.exception()
+
+
+class ResponseCache:
+    def __init__(self, ttl=60.0, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = None
+        self._entries = {}   # key -> (generation, expires_at, value)
+        self._inflight = {}  # key -> task of the load already running for it
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def set_generation(self, generation):
+        """Called from the LISTEN callback (or a poll) with the latest data generation."""
+        if generation == self.generation:
+            return
+        self.generation = generation
+        self._entries.clear()
+        self.invalidations += 1
+
+    async def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, or await loader() once and cache it.
+
+        Concurrent misses for the same key wait on the first caller's load instead of
+        each going to the db. Exceptions are not cached, every waiter sees the error.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            generation, expires_at, value = entry
+            if generation == self.generation and time.monotonic() < expires_at:
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # the load runs as its own task, so a client that disconnects (cancelling
+            # its handler) doesn't cancel the load for everyone else waiting on it
+            task = asyncio.ensure_future(self._load(key, loader))
+            task.add_done_callback(_consume_exception)
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        # tag with the generation at the start, a bump while loading makes the result stale right away
+        generation = self.generation
+        try:
+            value = await loader()
+            self._store(key, generation, value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def _store(self, key, generation, value):
+        if generation != self.generation:
+            return
+        if len(self._entries) >= self.max_entries:
+            # dicts keep insertion order, drop the oldest entry
+            del self._entries[next(iter(self._entries))]
+        self._entries[key] = (generation, time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "generation": self.generation,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
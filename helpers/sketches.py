@@ -0,0 +1,402 @@
+"""
+Streaming sketches for finding the few active repos in the gh archive firehose.
+
+CountMinSketch    approximate count of any repo in fixed memory, never under-counts
+SpaceSaving       the k heaviest repos with their counts and error bounds
+ActivityFilter    both together, decides which repos are active enough to queue
+HyperLogLog       approximate distinct actors, mergeable across hours and days
+BloomFilter       approximate set of known repo ids, no false negatives
+
+Keys are ints (repo and actor ids). All of them serialize to bytes so they can
+be persisted between runs.
+"""
+
+import heapq
+import itertools
+import math
+import random
+import struct
+import sys
+import zlib
+from array import array
+
+_PRIME = (1 << 61) - 1
+_MAX_COUNT = 0xFFFFFFFF
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(x):
+    """splitmix64 finalizer, spreads sequential ids over all 64 bits"""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class CountMinSketch:
+    """
+    depth rows of width counters, a key's estimate is the smallest of its counters.
+    Overestimates by at most e / width * total with probability 1 - e^-depth.
+
+    Updates are conservative: only counters below the key's new estimate move,
+    which keeps the overestimate far lower on skewed streams like repo activity.
+    """
+
+    HEADER = struct.Struct('<4sIIQQ')  # magic, width, depth, seed, total
+    MAGIC = b'CMS1'
+
+    def __init__(self, width=1 << 18, depth=4, seed=0):
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.total = 0
+        self.table = array('I', bytes(4 * width * depth))
+
+        rng = random.Random(seed)
+        self._hashes = [(rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(depth)]
+
+    def _indexes(self, key):
+        width = self.width
+        return [row * width + (a * key + b) % _PRIME % width for row, (a, b) in enumerate(self._hashes)]
+
+    def estimate(self, key):
+        table = self.table
+        return min(table[i] for i in self._indexes(key))
+
+    def add(self, key, count=1):
+        """Count key and return its new estimate"""
+        table = self.table
+        indexes = self._indexes(key)
+        estimate = min(min(table[i] for i in indexes) + count, _MAX_COUNT)
+        for i in indexes:
+            if table[i] < estimate:
+                table[i] = estimate
+        self.total += count
+        return estimate
+
+    def halve(self):
+        """Age every count by half"""
+        self.table = array('I', [c >> 1 for c in self.table])
+        self.total >>= 1
+
+    def to_bytes(self):
+        table = self.table
+        if sys.byteorder == 'big':
+            table = array('I', table)
+            table.byteswap()
+        header = self.HEADER.pack(self.MAGIC, self.width, self.depth, self.seed, self.total)
+        return header + zlib.compress(table.tobytes(), 1)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, width, depth, seed, total = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError("Not a count-min sketch")
+
+        sketch = cls(width, depth, seed)
+        table = array('I', zlib.decompress(data[cls.HEADER.size:]))
+        if sys.byteorder == 'big':
+            table.byteswap()
+        if len(table) != width * depth:
+            raise ValueError("Count-min sketch is truncated")
+        sketch.table = table
+        sketch.total = total
+        return sketch
+
+
+class SpaceSaving:
+    """
+    The k heaviest keys of a weighted stream (Metwally et al.). When a new key
+    arrives and all k slots are taken it replaces the smallest, inheriting that
+    count as its error. Any key with a true count above total / k is kept.
+    """
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.counts = {}  # key -> [count, error]
+        self._heap = []   # (count, seq, key), entries whose count moved on are skipped
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key, count=1):
+        """Count key and return its (over)estimate"""
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += count
+        elif len(self.counts) < self.k:
+            entry = self.counts[key] = [count, 0]
+        else:
+            floor = self._pop_min()
+            entry = self.counts[key] = [floor + count, floor]
+
+        heapq.heappush(self._heap, (entry[0], next(self._seq), key))
+        if len(self._heap) > 4 * self.k:
+            self._rebuild_heap()
+        return entry[0]
+
+    def _pop_min(self):
+        while True:
+            count, _, key = heapq.heappop(self._heap)
+            entry = self.counts.get(key)
+            if entry is not None and entry[0] == count:
+                del self.counts[key]
+                return count
+
+    def _rebuild_heap(self):
+        self._heap = [(count, next(self._seq), key) for key, (count, _) in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, n=None):
+        """[(key, count, error)] heaviest first, count - error is a guaranteed lower bound"""
+        ranked = sorted(self.counts.items(), key=lambda item: -item[1][0])
+        return [(key, count, error) for key, (count, error) in ranked[:n]]
+
+    def halve(self):
+        for entry in self.counts.values():
+            entry[0] >>= 1
+            entry[1] >>= 1
+        self._rebuild_heap()
+
+    def to_bytes(self):
+        keys = array('q', self.counts)
+        counts = array('Q', (count for count, _ in self.counts.values()))
+        errors = array('Q', (error for _, error in self.counts.values()))
+        if sys.byteorder == 'big':
+            for values in (keys, counts, errors):
+                values.byteswap()
+        return struct.pack('<II', self.k, len(keys)) + keys.tobytes() + counts.tobytes() + errors.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        k, n = struct.unpack_from('<II', data)
+        summary = cls(k)
+        columns = []
+        offset = 8
+        for typecode in ('q', 'Q', 'Q'):
+            values = array(typecode, data[offset:offset + 8 * n])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            columns.append(values)
+            offset += 8 * n
+
+        keys, counts, errors = columns
+        summary.counts = {key: [count, error] for key, count, error in zip(keys, counts, errors)}
+        summary._rebuild_heap()
+        return summary
+
+
+class ActivityFilter:
+    """
+    Which repos in an archive hour are worth queueing: a repo is admitted once its
+    estimated events across all hours seen reach `threshold`. The hour it crosses it
+    carries the whole estimate, so repo_queue.activity_count still sees its history.
+
+    Every `half_life_hours` archive hours all counts are halved, old activity fades
+    and the sketch doesn't saturate. Estimates only ever err high, so a repo that
+    really crossed the threshold is never held back.
+    """
+
+    def __init__(self, threshold, half_life_hours=168, width=1 << 18, depth=4, top_k=1000):
+        self.threshold = threshold
+        self.half_life_hours = half_life_hours
+        self.sketch = CountMinSketch(width, depth)
+        self.heavy_hitters = SpaceSaving(top_k)
+        self.hours = 0
+        self.seen = 0
+        self.admitted = 0
+
+    def admit(self, repo_activity):
+        """
+        Which repos of an archive hour to queue. Only reads the counts: call record()
+        once the hour is saved, so a retried or failed hour is never counted twice.
+
+        Args:
+            repo_activity: {repo_id: {'name': str, 'count': int}} of one archive hour
+
+        Returns:
+            the same shape, only repos at or above the threshold
+        """
+        admitted = {}
+        for repo_id, data in repo_activity.items():
+            count = data['count']
+            estimate = min(self.sketch.estimate(repo_id) + count, _MAX_COUNT)
+            if estimate >= self.threshold:
+                crossed = estimate - count < self.threshold
+                admitted[repo_id] = {'name': data['name'], 'count': estimate if crossed else count}
+        return admitted
+
+    def record(self, repo_activity, admitted):
+        """Fold a saved hour into the counts, with what admit() returned for it"""
+        for repo_id, data in repo_activity.items():
+            self.sketch.add(repo_id, data['count'])
+            self.heavy_hitters.add(repo_id, data['count'])
+
+        self.seen += len(repo_activity)
+        self.admitted += len(admitted)
+        self.hours += 1
+        if self.half_life_hours and self.hours % self.half_life_hours == 0:
+            self.sketch.halve()
+            self.heavy_hitters.halve()
+
+    def restore(self, sketch, heavy_hitters, hours):
+        """Continue from state saved by a previous run"""
+        self.sketch = CountMinSketch.from_bytes(sketch)
+        self.heavy_hitters = SpaceSaving.from_bytes(heavy_hitters)
+        self.hours = hours
+
+
+class HyperLogLog:
+    """
+    Distinct count estimate in at most 2^p bytes, standard error 1.04 / sqrt(2^p)
+    (3.3% at the default p=10). Small sets, which is most repos on most days, stay
+    sparse ({register: rank}) and serialize to 3 bytes per set register; past a
+    quarter of the registers they switch to a dense bytearray. Merging is a
+    register-wise max, so unions over hours, days and windows are exact.
+    """
+
+    SPARSE, DENSE = 0, 1
+
+    def __init__(self, p=10):
+        if not 4 <= p <= 16:
+            raise ValueError("p must be between 4 and 16")
+        self.p = p
+        self.m = 1 << p
+        self.sparse = {}
+        self.dense = None
+
+    def add(self, item):
+        h = _mix64(item)
+        rest_bits = 64 - self.p
+        rest = h & ((1 << rest_bits) - 1)
+        self._set(h >> rest_bits, rest_bits - rest.bit_length() + 1)
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def _set(self, index, rank):
+        if self.dense is not None:
+            if self.dense[index] < rank:
+                self.dense[index] = rank
+        elif self.sparse.get(index, 0) < rank:
+            self.sparse[index] = rank
+            if len(self.sparse) > self.m // 4:
+                self._densify()
+
+    def _densify(self):
+        self.dense = bytearray(self.m)
+        for index, rank in self.sparse.items():
+            self.dense[index] = rank
+        self.sparse = {}
+
+    def registers(self):
+        """(index, rank) of every set register"""
+        if self.dense is None:
+            return self.sparse.items()
+        return ((index, rank) for index, rank in enumerate(self.dense) if rank)
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Can't merge HyperLogLogs of different precision")
+        if other.dense is not None and self.dense is None:
+            self._densify()
+        if self.dense is not None and other.dense is not None:
+            self.dense = bytearray(map(max, self.dense, other.dense))
+            return self
+        for index, rank in other.registers():
+            self._set(index, rank)
+        return self
+
+    def count(self):
+        m = self.m
+        ranks = [rank for _, rank in self.registers()]
+        zeros = m - len(ranks)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / (zeros + sum(2.0 ** -rank for rank in ranks))
+        # linear counting is far more accurate while many registers are still empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_bytes(self):
+        if self.dense is not None:
+            return bytes((self.p, self.DENSE)) + bytes(self.dense)
+        return bytes((self.p, self.SPARSE)) + b''.join(
+            struct.pack('<HB', index, rank) for index, rank in sorted(self.sparse.items())
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        p, mode = data[0], data[1]
+        sketch = cls(p)
+        if mode == cls.DENSE:
+            if len(data) != 2 + sketch.m:
+                raise ValueError("HyperLogLog is truncated")
+            sketch.dense = bytearray(data[2:])
+        else:
+            sketch.sparse = {index: rank for index, rank in struct.iter_unpack('<HB', data[2:])}
+        return sketch
+
+
+class BloomFilter:
+    """
+    Set membership in about 1.2 bytes per key at a 1% false positive rate. A key
+    that was added is always found; a key that wasn't is wrongly found with
+    probability ~error_rate while fewer than `capacity` keys are in.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # double hashing, k positions from two 32 bit halves of one 64 bit hash
+        h = _mix64(key)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, key):
+        array = self.array
+        new = False
+        for position in self._positions(key):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not array[byte] & bit:
+                array[byte] |= bit
+                new = True
+        # keys already in (or false positives) don't count towards capacity
+        self.count += new
+
+    def update(self, keys):
+        # add() inlined, this is the loop that seeds millions of ids at startup
+        array, bits, hashes = self.array, self.bits, range(self.hashes)
+        n = 0
+        for key in keys:
+            h = (key + 0x9E3779B97F4A7C15) & _MASK64
+            h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+            h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK64
+            h ^= h >> 31
+            h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+            new = False
+            for i in hashes:
+                position = (h1 + i * h2) % bits
+                byte, bit = position >> 3, 1 << (position & 7)
+                if not array[byte] & bit:
+                    array[byte] |= bit
+                    new = True
+            n += new
+        self.count += n
+
+    def __contains__(self, key):
+        array = self.array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def saturated(self):
+        """Past capacity the false positive rate climbs quickly"""
+        return self.count > self.capacity
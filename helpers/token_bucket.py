@@ -1,3 +1,5 @@
+import asyncio
+import os
 import time
 import threading
 
@@ -37,6 +39,97 @@ class TokenBucket:
                 return True
             return False
 
+class AsyncTokenBucket:
+    """
+    Awaitable token bucket for one event loop.
+
+    acquire(n) returns once n tokens are taken. Waiters are served in arrival order,
+    so a big acquire isn't starved by a stream of small ones. An acquire larger than
+    the capacity (a chunk bigger than the burst) goes through once the bucket is full
+    and leaves it in debt, which later callers wait off, so the long-run rate holds.
+    Uncontended acquires that fit don't suspend at all.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        :param rate: Tokens added per second.
+        :param capacity: Burst size, defaults to one second of rate.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()  # FIFO, the head waiter sleeps while the rest queue
+        self._waiting = 0
+        self.throttled_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self, tokens: float = 1):
+        if not self._waiting:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return
+
+        self._waiting += 1
+        try:
+            async with self._lock:
+                needed = min(tokens, self.capacity)
+                self._refill()
+                while self._tokens < needed:
+                    delay = (needed - self._tokens) / self.rate
+                    self.throttled_seconds += delay
+                    await asyncio.sleep(delay)
+                    self._refill()
+                self._tokens -= tokens
+        finally:
+            self._waiting -= 1
+
+
+class RateLimiter:
+    """
+    Several named AsyncTokenBuckets, e.g. requests/sec and bytes/sec:
+
+        limiter = RateLimiter(requests=AsyncTokenBucket(10), bytes=AsyncTokenBucket(5_000_000))
+        await limiter.acquire(requests=1)
+        await limiter.acquire(bytes=len(chunk))
+
+    Keys without a bucket are unlimited, so call sites can always acquire.
+    """
+
+    def __init__(self, **buckets):
+        self.buckets = {key: bucket for key, bucket in buckets.items() if bucket is not None}
+
+    async def acquire(self, **tokens):
+        # same key order for every caller, so they queue on the buckets the same way
+        for key in sorted(tokens):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                await bucket.acquire(tokens[key])
+
+    @classmethod
+    def from_env(cls, prefix):
+        """Limits from {prefix}_MAX_REQUESTS_PER_SECOND and {prefix}_MAX_BYTES_PER_SECOND, unset or 0 means unlimited"""
+        requests = float(os.getenv(f"{prefix}_MAX_REQUESTS_PER_SECOND", 0))
+        bytes_per_second = float(os.getenv(f"{prefix}_MAX_BYTES_PER_SECOND", 0))
+        return cls(
+            requests=AsyncTokenBucket(requests, max(requests, 1)) if requests > 0 else None,
+            # a short burst, a full second of bandwidth at once is what shaping is meant to prevent
+            bytes=AsyncTokenBucket(bytes_per_second, bytes_per_second / 10) if bytes_per_second > 0 else None,
+        )
+
+    def describe(self):
+        if not self.buckets:
+            return "unlimited"
+        return ", ".join(f"{bucket.rate:g} {key}/s" for key, bucket in sorted(self.buckets.items()))
+
+
 # Example Usage:
 if __name__ == "__main__":
     # Create a bucket with capacity 10 and a refill rate of 2 tokens/second
@@ -4,15 +4,18 @@ import atexit
 from dotenv import load_dotenv
 
 import helpers.db_helper as db_helper
+from helpers.repo_parser import parse_repo_batch
+from helpers.token_bucket import RateLimiter
 
 load_dotenv()
 
 import os
 import time
-from datetime import datetime, timedelta
 
 import aiohttp as aiohttp
 
+from enrichment import EnrichmentLane
+
 GRAPHQL_URL = "https://api.github.com/graphql"
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
@@ -25,19 +28,8 @@ query ($owner: String!, $name: String!) {
     openIssues: issues(states: OPEN) { totalCount }
     closedIssues: issues(states: CLOSED) { totalCount }
     watchers { totalCount }
-    defaultBranchRef {
-      target {
-        ... on Commit {
-          history(first: 30, since: "%s") {
-            totalCount
-          }
-        }
-      }
-    }
-    mentionableUsers(first: 100) {
-      totalCount
-    }
-    languages(first: 10) {
+    languages(first: 10, orderBy: {field: SIZE, direction: DESC}) {
+      totalSize
       edges {
         node { name }
         size
@@ -58,8 +50,9 @@ class Processor:
         MAX_CON = 5
         self.db_helper = db_helper.DBHelper()
         self.semaphore = asyncio.Semaphore(MAX_CON)
-        # self.bucket = TokenBucket(capacity=4500, refill_rate=4500/3600) ## 4500 requests per hour
-        ##giving small time for tesitng
+        # PROCESSOR_MAX_REQUESTS_PER_SECOND / PROCESSOR_MAX_BYTES_PER_SECOND toward the GitHub API,
+        # shared with the enrichment lane. e.g. 1.25 req/s stays under 4500 requests per hour
+        self.limiter = RateLimiter.from_env("PROCESSOR")
 
         self.github_reset_time = None
         self.rate_limit_lock = asyncio.Lock()
@@ -77,10 +70,12 @@ class Processor:
 
     async def setup(self):
         await self.db_helper.connect()
+        self.db_helper.start_metrics_reporter()
         print("Database connected in processor python")
+        print(f"GitHub API limits: {self.limiter.describe()}")
 
     async def process_repo_queue(self, batch_size):
-        async with self.db_helper.pool.acquire() as conn:
+        async with self.db_helper.acquire("process_repo_queue") as conn:
             results = await conn.fetch(
                 """
             SELECT * FROM repo_queue
@@ -106,20 +101,27 @@ class Processor:
                     await asyncio.sleep(sleep_time + 1)
                     self.remaining_requests = 5000
 
+    async def _update_rate_limit(self, response):
+        async with self.rate_limit_lock:
+            self.remaining_requests = int(
+                response.headers.get("x-ratelimit-remaining", self.remaining_requests)
+            )
+            reset_time = response.headers.get("x-ratelimit-reset")
+            if reset_time:
+                self.rate_limit_reset = int(reset_time)
+
     async def enrich_repo(self, repo_id, owner, name):
         await self._check_rate_limit()
 
         async with self.semaphore:
-            thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
-
-            query = QUERY % thirty_days_ago
             headers = {
                 "Authorization": f"Bearer {GITHUB_TOKEN}",
                 "Content-Type": "application/json",
             }
+            await self.limiter.acquire(requests=1)
             response = await self.session.post(
                 GRAPHQL_URL,
-                json={"query": query, "variables": {"owner": owner, "name": name}},
+                json={"query": QUERY, "variables": {"owner": owner, "name": name}},
                 headers=headers,
             )
 
@@ -127,16 +129,9 @@ class Processor:
                 print(f"❌ Repo {repo_id}: HTTP {response.status}")
                 return None
 
-            async with self.rate_limit_lock:
-                self.remaining_requests = int(
-                    response.headers.get(
-                        "x-ratelimit-remaining", self.remaining_requests
-                    )
-                )
-                reset_time = response.headers.get("x-ratelimit-reset")
-                if reset_time:
-                    self.rate_limit_reset = int(reset_time)
+            await self._update_rate_limit(response)
 
+            await self.limiter.acquire(bytes=len(await response.read()))
             data = await response.json()
 
             # Check for GraphQL errors
@@ -149,59 +144,6 @@ class Processor:
 
             return data["data"]["repository"]
 
-    def parse_repo_data(self, repo_data):
-        commits = []
-        if repo_data.get("defaultBranchRef") and repo_data["defaultBranchRef"].get(
-            "target"
-        ):
-            history = repo_data["defaultBranchRef"]["target"].get("history", {})
-            commits = [node["committedDate"] for node in history.get("nodes", [])]
-
-        languages = {}
-        for edge in repo_data["languages"]["edges"]:
-            lang_name = edge["node"]["name"]
-            size = edge["size"]
-            languages[lang_name] = size
-
-        total_size = sum(languages.values())
-        language_percentages = {
-            lang_name: (size / total_size) * 100
-            for lang_name, size in languages.items()
-        }
-
-        topics = {}
-        for node in repo_data["repositoryTopics"]["nodes"]:
-            topic_name = node["topic"]["name"]
-            topics[topic_name] = topics.get(topic_name, 0) + 1
-
-        dependencies = []
-        for manifest in (
-            repo_data.get("dependencyGraphManifests", {}).get("nodes", []) or []
-        ):
-            for dep in manifest.get("dependencies", {}).get("nodes", []) or []:
-                dependencies.append(
-                    {
-                        "package": dep["packageName"],
-                        "requirements": dep.get("requirements", ""),
-                        "manifest": manifest["filename"],
-                    }
-                )
-
-        return {
-            "stars": repo_data["stargazerCount"],
-            "forks": repo_data["forkCount"],
-            "open_issues": repo_data["openIssues"]["totalCount"],
-            "closed_issues": repo_data["closedIssues"]["totalCount"],
-            "subscribers": repo_data["watchers"]["totalCount"],
-            "commits_last_30_days": len(commits),
-            "contributors_count": repo_data["mentionableUsers"]["totalCount"],
-            "languages": languages,
-            "language_percentages": language_percentages,
-            "topics": topics,
-            "dependencies": dependencies,
-            "commit_dates": commits,  # For trend analysis
-        }
-
     async def process_batch_of_repos(self, batch_size=10):
         ## get repos
         repos = await self.process_repo_queue(batch_size)
@@ -231,8 +173,7 @@ class Processor:
         print(f"Processing {len(tasks)} repos...")
         results = await asyncio.gather(*tasks, return_exceptions=True)
 
-        enriched_data_list = []
-        successful_repo_ids = []
+        payloads = []
         failed_repo_ids = []  # Track failed repos to mark as processed
 
         # Match results to repos by index
@@ -253,23 +194,20 @@ class Processor:
                 failed_repo_ids.append(repo["repo_id"])  # Mark failed repos too
                 continue
 
-            try:
-                parsed_data = self.parse_repo_data(result)
-                enriched_data_list.append(
-                    {
-                        "repo_id": repo["repo_id"],
-                        "repo_name": repo["repo_name"],
-                        "activity_score": repo.get("activity_count", 0),
-                        "parsed_data": parsed_data,
-                    }
-                )
-                successful_repo_ids.append(repo["repo_id"])
-            except Exception as e:
-                print(f"❌ Error parsing repo {repo['repo_id']}: {e}")
-                failed_repo_ids.append(repo["repo_id"])
+            payloads.append(
+                (repo["repo_id"], repo["repo_name"], repo.get("activity_count", 0), result)
+            )
+
+        # Commit/push counts come from the PushEvents Discovery already stored,
+        # so we don't pay GraphQL points for the commit history
+        push_activity = await self.db_helper.get_push_activity(
+            [payload[0] for payload in payloads]
+        )
+        batch = parse_repo_batch(payloads, push_activity)
+        failed_repo_ids.extend(batch.failed)
 
         # Mark both successful AND failed repos as processed
-        all_processed_ids = successful_repo_ids + failed_repo_ids
+        all_processed_ids = batch.repo_ids + failed_repo_ids
         if all_processed_ids:
             await self.db_helper.mark_repos_as_processed(all_processed_ids)
             if failed_repo_ids:
@@ -277,11 +215,14 @@ class Processor:
                     f"  Marked {len(failed_repo_ids)} failed repos as processed (won't retry)"
                 )
 
-        if enriched_data_list:
-            await self.db_helper.bulk_save_enriched_repos(enriched_data_list)
-            print(
-                f"Successfully processed {len(enriched_data_list)}/{len(repos)} repos"
+        if batch.repos:
+            await self.db_helper.bulk_save_repo_batch(batch)
+            # distinct actors come from the archive's actor sketches, not graphql
+            await self.db_helper.refresh_repo_engagement(batch.repo_ids)
+            await self.db_helper.enqueue_for_enrichment(
+                [(row[0], row[1], row[2]) for row in batch.repos]
             )
+            print(f"Successfully processed {len(batch.repos)}/{len(repos)} repos")
         else:
             print(" No repos were successfully enriched")
 
@@ -289,10 +230,14 @@ class Processor:
 async def main():
     processor = Processor()
     await processor.setup()
+    enrichment_lane = EnrichmentLane(processor)
 
     try:
         BATCH_SIZE = 10
+        ROLLUP_REFRESH_EVERY = 500
         MAX_BATCHES = None  # Set to a number to limit, or None for unlimited
+        EMPTY_QUEUE_SLEEP = 5  # seconds between rounds when only the enrichment lane has work
+        IDLE_POLL_INTERVAL = 300  # longest sleep with nothing due, new repos show up without waiting on enrichment
 
         batch_count = 0
         while True:
@@ -306,13 +251,32 @@ async def main():
 
             await processor.process_batch_of_repos(batch_size=BATCH_SIZE)
 
+            # Expensive fields only get whatever budget the core lane leaves over
+            enriched = await enrichment_lane.process_batch()
+
+            batch_count += 1
+
+            # rollups are kept as deltas, a full recompute now and then repairs any drift
+            if batch_count % ROLLUP_REFRESH_EVERY == 0:
+                await processor.db_helper.refresh_stats_rollup()
+
             # Check if there are more repos to process
             repos = await processor.process_repo_queue(1)
-            if not repos:
-                print("\n No more repos to process!")
-                break
+            if repos:
+                continue
+
+            ## core queue is empty: discovery refills it every hour and enrichment rows come due
+            ## again after the refresh interval, so keep the process alive and wait for either
+            if enriched:
+                await asyncio.sleep(EMPTY_QUEUE_SLEEP)
+                continue
 
-            batch_count += 1  # Small delay between batches
+            wait = await processor.db_helper.seconds_until_next_enrichment()
+            if wait is None:
+                wait = IDLE_POLL_INTERVAL
+            wait = min(max(wait, EMPTY_QUEUE_SLEEP), IDLE_POLL_INTERVAL)
+            print(f"\n No repos to process, checking again in {wait:.0f}s")
+            await asyncio.sleep(wait)
 
         print(f"\nFinished processing {batch_count} batches")
     finally:
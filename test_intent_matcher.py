@@ -0,0 +1,69 @@
+# test_intent_matcher.py
+from helpers.intent_matcher import match_intent, parse_number
+
+
+def test_top_repos_by_language():
+    match = match_intent("Show me top 10 Python repos")
+    assert match.intent == 'top_repos_by_language'
+    assert match.params == ('Python', 10)
+    assert '$1' in match.sql and '$2' in match.sql
+
+    assert match_intent("top 5 repos written in C++").params == ('C++', 5)
+    # no N means the default
+    assert match_intent("best golang projects").params == ('Go', 10)
+
+
+def test_unknown_language_goes_to_llm():
+    assert match_intent("show me top 10 foo repos") is None
+
+
+def test_star_thresholds():
+    count = match_intent("How many repos have more than 1000 stars?")
+    assert count.intent == 'repo_count_by_stars'
+    assert 'stars > $1' in count.sql
+    assert count.params == (1000,)
+
+    listing = match_intent("repos with at least 5k stars")
+    assert 'stars >= $1' in listing.sql
+    assert listing.params == (5000, 10)
+
+
+def test_topics_and_popularity():
+    topic = match_intent("Show me repos about machine learning")
+    assert topic.intent == 'repos_by_topic'
+    assert topic.params == ('%machine-learning%', 10)
+
+    assert match_intent("What are the most popular languages?").intent == 'popular_languages'
+    assert match_intent("most popular 3 topics").params == (3,)
+
+
+def test_topic_with_extra_filters_goes_to_llm():
+    assert match_intent("show me repos about machine learning in python") is None
+    assert match_intent("repos about rust with more than 1000 stars") is None
+    assert match_intent("repos about ai by google") is None
+    assert match_intent("repos about web frameworks for go") is None
+    # one or two words are still a topic
+    assert match_intent("repos about rust").params == ('%rust%', 10)
+    assert match_intent("repos tagged with computer vision").params == ('%computer-vision%', 10)
+
+
+def test_limit_caps_n():
+    assert match_intent("top 500 rust repos", limit=100).params == ('Rust', 100)
+
+
+def test_parse_number():
+    assert parse_number("1,000") == 1000
+    assert parse_number("1.5k") == 1500
+    assert parse_number("2m") == 2_000_000
+    # no OverflowError from a float inf, match_intent clamps what comes back
+    assert parse_number("9" * 400) > 2**31
+
+
+def test_star_threshold_fits_int4():
+    assert match_intent("how many repos have more than 5000000000 stars").params == (2**31 - 1,)
+    assert match_intent("repos with over 9999999m stars").params == (2**31 - 1, 10)
+
+
+def test_unmatched_questions():
+    assert match_intent("which repos have the most contributors") is None
+    assert match_intent("top 10 repos by forks") is None
@@ -0,0 +1,72 @@
+# test_lru.py
+import threading
+import time
+
+from helpers.lru import LRUCache
+
+
+def test_get_miss_returns_minus_one():
+    cache = LRUCache(2)
+    assert cache.get('missing') == -1
+    assert cache.get('missing', None) is None
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')  # b is now the oldest
+    cache.put('c', 3)
+
+    assert cache.get('b') == -1
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.evictions == 1
+
+
+def test_ttl_expires_entries():
+    cache = LRUCache(10, ttl=0.05)
+    cache.put('a', 1)
+    cache.put('b', 2, ttl=60)
+    time.sleep(0.06)
+
+    assert cache.get('a') == -1
+    assert cache.get('b') == 2
+    assert cache.expirations == 1
+
+
+def test_byte_budget():
+    cache = LRUCache(100, max_bytes=100, sizeof=len)
+    cache.put('a', 'x' * 40)
+    cache.put('b', 'x' * 40)
+    cache.put('c', 'x' * 40)  # 120 bytes, 'a' has to go
+
+    assert 'a' not in cache
+    assert cache.total_bytes == 80
+
+    # a single value over the budget is refused instead of flushing everything
+    assert cache.put('huge', 'x' * 200) is False
+    assert len(cache) == 2
+
+    # replacing a key frees its old size
+    cache.put('b', 'x')
+    assert cache.total_bytes == 41
+
+
+def test_stats_and_threads():
+    cache = LRUCache(50)
+
+    def worker(offset):
+        for i in range(1000):
+            cache.put((offset + i) % 80, i)
+            cache.get((offset * 7 + i) % 80)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = cache.stats()
+    assert stats['entries'] == len(cache.cache) <= 50
+    assert stats['hits'] + stats['misses'] == 8000
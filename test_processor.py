@@ -1,6 +1,7 @@
 # test_processor.py
 import asyncio
 from processor import Processor
+from helpers.repo_parser import parse_repo_batch
 from dotenv import load_dotenv
 load_dotenv()
 import os
@@ -27,13 +28,14 @@ async def test_enrich_repo():
             print(f"   Languages: {len(repo_data.get('languages', {}).get('edges', []))} found")
             
             # Test parsing
-            parsed = processor.parse_repo_data(repo_data)
+            batch = parse_repo_batch([(repo_id, f"{owner}/{name}", 0, repo_data)])
+            repo_row = batch.repos[0]
             print("\n📊 Parsed Data:")
-            print(f"   Stars: {parsed['stars']}")
-            print(f"   Forks: {parsed['forks']}")
-            print(f"   Open Issues: {parsed['open_issues']}")
-            print(f"   Languages: {list(parsed['languages'].keys())}")
-            print(f"   Topics: {list(parsed['topics'].keys())[:5]}")  # First 5 topics
+            print(f"   Stars: {repo_row[2]}")
+            print(f"   Forks: {repo_row[3]}")
+            print(f"   Open Issues: {repo_row[4]}")
+            print(f"   Languages: {[row[1] for row in batch.languages]}")
+            print(f"   Topics: {[row[1] for row in batch.topics][:5]}")  # First 5 topics
             
             return True
         else:
@@ -48,8 +50,6 @@ async def test_enrich_repo():
 
 async def test_parse_with_mock_data():
     """Test parsing with mock data structure"""
-    processor = Processor()
-    
     # Mock repo data structure
     mock_data = {
         'stargazerCount': 1000,
@@ -57,16 +57,6 @@ async def test_parse_with_mock_data():
         'openIssues': {'totalCount': 50},
         'closedIssues': {'totalCount': 200},
         'watchers': {'totalCount': 300},
-        'defaultBranchRef': {
-            'target': {
-                'history': {
-                    'nodes': [
-                        {'committedDate': '2025-01-15T10:00:00Z'},
-                        {'committedDate': '2025-01-14T10:00:00Z'},
-                    ]
-                }
-            }
-        },
         'mentionableUsers': {'totalCount': 25},
         'languages': {
             'edges': [
@@ -82,15 +72,16 @@ async def test_parse_with_mock_data():
         }
     }
     
-    print("\n🧪 Testing parse_repo_data with mock data...")
+    print("\n🧪 Testing parse_repo_batch with mock data...")
     try:
-        parsed = processor.parse_repo_data(mock_data)
+        batch = parse_repo_batch([(1, 'mock/repo', 0, mock_data)])
+        repo_row = batch.repos[0]
         print("✅ Parsing successful!")
-        print(f"   Stars: {parsed['stars']}")
-        print(f"   Forks: {parsed['forks']}")
-        print(f"   Languages: {parsed['languages']}")
-        print(f"   Language %: {parsed['language_percentages']}")
-        print(f"   Topics: {parsed['topics']}")
+        print(f"   Stars: {repo_row[2]}")
+        print(f"   Forks: {repo_row[3]}")
+        print(f"   Languages: {[(row[1], row[2]) for row in batch.languages]}")
+        print(f"   Language %: {[(row[1], row[3]) for row in batch.languages]}")
+        print(f"   Topics: {[row[1] for row in batch.topics]}")
         return True
     except Exception as e:
         print(f"❌ Parsing error: {e}")
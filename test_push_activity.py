@@ -0,0 +1,117 @@
+# test_push_activity.py
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from discovery import Discovery
+
+
+def push_event(repo_id, actor_id, size=None, commits=None, day='2025-01-15'):
+    payload = {}
+    if size is not None:
+        payload['size'] = size
+    if commits is not None:
+        payload['commits'] = [{} for _ in range(commits)]
+    return {
+        'type': 'PushEvent',
+        'repo': {'id': repo_id},
+        'actor': {'id': actor_id},
+        'created_at': f'{day}T10:00:00Z',
+        'payload': payload,
+    }
+
+
+def test_count_push_event():
+    discovery = Discovery()
+    push_activity = {}
+    discovery.count_push_event(push_activity, push_event(1, 10, size=3))
+    discovery.count_push_event(push_activity, push_event(1, 11, size=2))
+    discovery.count_push_event(push_activity, push_event(1, 10, size=1))
+
+    assert push_activity == {(1, '2025-01-15'): {'commits': 6, 'pushes': 3, 'pushers': {10, 11}}}
+
+
+def test_count_push_event_without_size():
+    discovery = Discovery()
+    push_activity = {}
+    # older payloads only list the commits, some have neither
+    discovery.count_push_event(push_activity, push_event(1, 10, commits=4))
+    discovery.count_push_event(push_activity, push_event(1, 10))
+    discovery.count_push_event(push_activity, push_event(1, 10, size=1, day='2025-01-16'))
+
+    assert push_activity[(1, '2025-01-15')] == {'commits': 4, 'pushes': 2, 'pushers': {10}}
+    assert push_activity[(1, '2025-01-16')]['commits'] == 1
+
+
+def test_saving_an_hour_twice_counts_it_once():
+    if not os.getenv("DB_HOST"):
+        pytest.skip("DB_HOST not set")
+
+    from helpers.db_helper import DBHelper
+
+    repo_id = 999_000_026
+    hour = datetime(1971, 1, 1, 5)
+    today = date.today().isoformat()
+    push_activity = {(repo_id, today): {'commits': 5, 'pushes': 2, 'pushers': {1, 2}}}
+
+    async def run():
+        db_helper = DBHelper()
+        await db_helper.connect()
+        try:
+            assert await db_helper.save_push_activity(push_activity, hour)
+            first = await db_helper.get_push_activity([repo_id])
+            # a retried or re-run archive hour
+            assert not await db_helper.save_push_activity(push_activity, hour)
+            return first, await db_helper.get_push_activity([repo_id])
+        finally:
+            async with db_helper.acquire('test_push_activity') as conn:
+                await conn.execute("DELETE FROM repo_push_activity WHERE repo_id = $1", repo_id)
+                await conn.execute("DELETE FROM push_activity_hours WHERE hour = $1", hour)
+            await db_helper.close()
+
+    first, second = asyncio.run(run())
+    assert first == second == {repo_id: {'commits': 5, 'pushes': 2, 'pushers': 2}}
+
+
+def test_window_is_thirty_days_everywhere():
+    if not os.getenv("DB_HOST"):
+        pytest.skip("DB_HOST not set")
+
+    from helpers.db_helper import PUSH_ACTIVITY_WINDOW_DAYS, DBHelper
+
+    repo_id = 999_000_027
+    today = date.today()
+    last_day = today - timedelta(days=PUSH_ACTIVITY_WINDOW_DAYS - 1)
+    too_old = today - timedelta(days=PUSH_ACTIVITY_WINDOW_DAYS)
+
+    async def run():
+        db_helper = DBHelper()
+        await db_helper.connect()
+        try:
+            # the write path drops the day before the window
+            push_activity = {(repo_id, too_old.isoformat()): {'commits': 1, 'pushes': 1, 'pushers': {1}}}
+            await db_helper.save_push_activity(push_activity, datetime(1971, 1, 1, 6))
+            async with db_helper.acquire('test_push_activity') as conn:
+                assert await conn.fetchval("SELECT COUNT(*) FROM repo_push_activity WHERE repo_id = $1", repo_id) == 0
+                await conn.executemany("""
+                    INSERT INTO repo_push_activity (repo_id, day, commits, pushes, pusher_ids)
+                    VALUES ($1, $2, $3, 1, '{1}')
+                """, [(repo_id, last_day, 10), (repo_id, too_old, 100)])
+
+            # and so do the read and the prune
+            counts = await db_helper.get_push_activity([repo_id])
+            await db_helper.prune_push_activity()
+            async with db_helper.acquire('test_push_activity') as conn:
+                days = await conn.fetch("SELECT day FROM repo_push_activity WHERE repo_id = $1", repo_id)
+            return counts, [row['day'] for row in days]
+        finally:
+            async with db_helper.acquire('test_push_activity') as conn:
+                await conn.execute("DELETE FROM repo_push_activity WHERE repo_id = $1", repo_id)
+                await conn.execute("DELETE FROM push_activity_hours WHERE hour = $1", datetime(1971, 1, 1, 6))
+            await db_helper.close()
+
+    counts, days = asyncio.run(run())
+    assert counts[repo_id]['commits'] == 10
+    assert days == [last_day]
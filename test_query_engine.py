@@ -0,0 +1,38 @@
+# test_query_engine.py
+import asyncio
+from unittest import mock
+
+from helpers import query_engine
+
+
+def test_import_does_not_build_the_llm_client():
+    # importing must not need GEMINI_API_KEY, the client is built on the first LLM call
+    assert query_engine._client is None
+
+
+def test_normalize_question():
+    assert query_engine.normalize_question("  Top   Python repos?? ") == "top python repos"
+    assert query_engine.get_cache_key("Top python repos?") == query_engine.get_cache_key("top python repos")
+
+
+def test_normalize_sql_keeps_literals():
+    sql = "SELECT  repo_name\n FROM repos WHERE repo_name = 'a  b' ;"
+    assert query_engine.normalize_sql(sql) == "SELECT repo_name FROM repos WHERE repo_name = 'a  b'"
+
+
+def test_generated_sql_comments_are_stripped():
+    from helpers.db_helper import _strip_sql_comments
+
+    # a trailing comment would swallow the wrapper's closing paren
+    assert _strip_sql_comments("SELECT repo_name FROM repos ORDER BY stars DESC; -- top repos\n") == \
+        "SELECT repo_name FROM repos ORDER BY stars DESC"
+    assert _strip_sql_comments("/* hint */ SELECT 1 /* done */ ;") == "SELECT 1"
+    # dashes inside literals and identifiers aren't comments
+    assert _strip_sql_comments("SELECT 'a--b', \"x--y\" FROM t") == "SELECT 'a--b', \"x--y\" FROM t"
+
+
+def test_template_questions_skip_the_llm():
+    with mock.patch.object(query_engine, 'generate_sql_query') as generate:
+        sql, params = asyncio.run(query_engine.resolve_question("top 5 rust repos"))
+    generate.assert_not_called()
+    assert params == ('Rust', 5)
@@ -0,0 +1,53 @@
+# test_read_fallback.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+from helpers.db_helper import DBHelper
+
+
+class FakePool:
+    def __init__(self, name, refuse=False):
+        self.name = name
+        self.refuse = refuse
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        if self.refuse:
+            raise ConnectionRefusedError(111, "Connect call failed")
+        yield self.name
+
+
+def make_helper(replica):
+    db_helper = DBHelper()
+    db_helper.pool = FakePool('primary')
+    db_helper.read_pool = replica
+    # lag was just checked and is fine, the replica gets picked
+    db_helper._replica_checked_at = time.monotonic()
+    return db_helper
+
+
+def test_refused_replica_falls_back_to_primary():
+    db_helper = make_helper(FakePool('replica', refuse=True))
+
+    async def run():
+        async with db_helper.acquire_read('test') as conn:
+            return conn._conn
+
+    assert asyncio.run(run()) == 'primary'
+    assert db_helper._replica_down_until > time.monotonic()
+
+
+def test_error_inside_the_body_is_raised():
+    db_helper = make_helper(FakePool('replica'))
+
+    async def run():
+        async with db_helper.acquire_read('test') as conn:
+            assert conn._conn == 'replica'
+            raise ConnectionResetError("replica went away mid query")
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(run())
+    assert db_helper._replica_down_until > time.monotonic()
@@ -0,0 +1,90 @@
+# test_repo_parser.py
+from helpers.repo_parser import RepoBatch, parse_repo_batch
+
+
+def make_payload(stars=1000, manifests=False):
+    payload = {
+        'stargazerCount': stars,
+        'forkCount': 500,
+        'openIssues': {'totalCount': 50},
+        'closedIssues': {'totalCount': 200},
+        'watchers': {'totalCount': 300},
+        'languages': {
+            'edges': [
+                {'node': {'name': 'Python'}, 'size': 5000},
+                {'node': {'name': 'JavaScript'}, 'size': 3000},
+            ]
+        },
+        'repositoryTopics': {
+            'nodes': [
+                {'topic': {'name': 'web'}},
+                {'topic': {'name': 'api'}},
+            ]
+        }
+    }
+    if manifests:
+        payload['dependencyGraphManifests'] = {
+            'nodes': [{
+                'filename': 'requirements.txt',
+                'dependencies': {'nodes': [{'packageName': 'flask', 'requirements': '>= 3'}]}
+            }]
+        }
+    return payload
+
+
+def test_parse_repo_batch_rows():
+    batch = parse_repo_batch(
+        [(1, 'a/b', 7, make_payload())],
+        push_activity={1: {'commits': 12, 'pushes': 4, 'pushers': 2}}
+    )
+
+    assert batch.repos == [(1, 'a/b', 1000, 500, 50, 200, 300, 12, 4, 2, 7)]
+    assert batch.languages == [(1, 'Python', 5000, 62.5), (1, 'JavaScript', 3000, 37.5)]
+    assert batch.topics == [(1, 'web'), (1, 'api')]
+    # core payloads don't ask for dependencies, so the writer must leave them alone
+    assert batch.dependencies is None
+    assert batch.failed == []
+
+
+def test_language_percentages_use_total_size():
+    payload = make_payload()
+    # 2000 bytes of languages past the first 10 edges
+    payload['languages']['totalSize'] = 10000
+
+    batch = parse_repo_batch([(1, 'a/b', 0, payload)])
+    assert batch.languages == [(1, 'Python', 5000, 50.0), (1, 'JavaScript', 3000, 30.0)]
+
+
+def test_parse_repo_batch_dependencies():
+    batch = parse_repo_batch([(1, 'a/b', 0, make_payload(manifests=True))])
+    assert batch.dependencies == [(1, 'flask', '>= 3', 'requirements.txt')]
+
+
+def test_parse_repo_batch_skips_malformed_repo():
+    broken = make_payload()
+    del broken['watchers']
+
+    batch = parse_repo_batch([(1, 'a/b', 0, broken), (2, 'c/d', 0, make_payload())])
+
+    assert batch.failed == [1]
+    assert batch.repo_ids == [2]
+    # child rows of the broken repo are rolled back
+    assert {row[0] for row in batch.languages} == {2}
+    assert {row[0] for row in batch.topics} == {2}
+
+
+def test_from_enriched_matches_batch_parse():
+    parsed = {
+        'stars': 1000, 'forks': 500, 'open_issues': 50, 'closed_issues': 200, 'subscribers': 300,
+        'languages': {'Python': 5000, 'JavaScript': 3000},
+        'language_percentages': {'Python': 62.5, 'JavaScript': 37.5},
+        'topics': {'web': 1, 'api': 1},
+    }
+    legacy = RepoBatch.from_enriched(
+        [{'repo_id': 1, 'repo_name': 'a/b', 'activity_score': 7, 'parsed_data': parsed}]
+    )
+    batch = parse_repo_batch([(1, 'a/b', 7, make_payload())])
+
+    assert legacy.repos == batch.repos
+    assert legacy.languages == batch.languages
+    assert legacy.topics == batch.topics
@@ -0,0 +1,78 @@
+# test_response_cache.py
+import asyncio
+
+import pytest
+
+from helpers.response_cache import ResponseCache
+
+
+def test_concurrent_misses_share_one_load():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"total_repos": 3}
+
+    async def run():
+        cache = ResponseCache()
+        cache.set_generation(1)
+        results = await asyncio.gather(*(cache.get_or_load(('stats',), loader) for _ in range(50)))
+        # served from the cache now
+        results.append(await cache.get_or_load(('stats',), loader))
+        return cache, results
+
+    cache, results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(r == {"total_repos": 3} for r in results)
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 49, 1)
+
+
+def test_generation_bump_invalidates():
+    values = iter([1, 2])
+
+    async def loader():
+        return next(values)
+
+    async def run():
+        cache = ResponseCache()
+        cache.set_generation(1)
+        first = await cache.get_or_load('k', loader)
+        cache.set_generation(2)
+        second = await cache.get_or_load('k', loader)
+        return first, second
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_result_loaded_across_a_bump_is_not_cached():
+    async def run():
+        cache = ResponseCache()
+        cache.set_generation(1)
+
+        async def slow_loader():
+            cache.set_generation(2)  # a writer committed while we were reading
+            return 'old'
+
+        await cache.get_or_load('k', slow_loader)
+        return cache.stats()['entries']
+
+    assert asyncio.run(run()) == 0
+
+
+def test_errors_are_not_cached():
+    attempts = []
+
+    async def loader():
+        attempts.append(1)
+        raise ValueError("Invalid cursor: x")
+
+    async def run():
+        cache = ResponseCache()
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await cache.get_or_load('k', loader)
+
+    asyncio.run(run())
+    assert len(attempts) == 2
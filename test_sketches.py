@@ -0,0 +1,142 @@
+# test_sketches.py
+import random
+
+from helpers.sketches import ActivityFilter, BloomFilter, CountMinSketch, HyperLogLog, SpaceSaving
+
+
+def zipf_stream(n_keys=5000, events=50_000, seed=1):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, n_keys + 1)]
+    return rng.choices(range(1, n_keys + 1), weights=weights, k=events)
+
+
+def test_count_min_never_undercounts():
+    sketch = CountMinSketch(width=512, depth=4)
+    true = {}
+    for key in zipf_stream():
+        sketch.add(key)
+        true[key] = true.get(key, 0) + 1
+
+    assert all(sketch.estimate(key) >= count for key, count in true.items())
+    assert sketch.estimate(1) - true[1] <= sketch.total * 2.72 / 512
+    assert sketch.total == 50_000
+
+
+def test_count_min_round_trip_and_halve():
+    sketch = CountMinSketch(width=256, depth=3, seed=7)
+    sketch.add(42, 10)
+    sketch.add(2**40, 3)
+
+    restored = CountMinSketch.from_bytes(sketch.to_bytes())
+    assert restored.estimate(42) == 10
+    assert restored.estimate(2**40) == 3
+    assert restored.total == 13
+
+    restored.halve()
+    assert restored.estimate(42) == 5
+
+
+def test_space_saving_keeps_heavy_hitters():
+    summary = SpaceSaving(k=50)
+    true = {}
+    for key in zipf_stream():
+        summary.add(key)
+        true[key] = true.get(key, 0) + 1
+
+    assert len(summary) == 50
+    top = summary.top(5)
+    assert [key for key, _, _ in top] == [1, 2, 3, 4, 5]
+    for key, count, error in top:
+        assert count - error <= true[key] <= count
+
+    restored = SpaceSaving.from_bytes(summary.to_bytes())
+    assert restored.top(5) == top
+    restored.add(10**6, 1)
+    assert len(restored) == 50
+
+
+def admit_and_record(activity_filter, hour):
+    admitted = activity_filter.admit(hour)
+    activity_filter.record(hour, admitted)
+    return admitted
+
+
+def test_activity_filter_admits_on_crossing():
+    activity_filter = ActivityFilter(threshold=5, width=1024)
+
+    hour = {1: {'name': 'a/one', 'count': 3}, 2: {'name': 'b/two', 'count': 1}}
+    assert admit_and_record(activity_filter, hour) == {}
+
+    # the hour repo 1 crosses carries its history, after that only the hour's count
+    hour = {1: {'name': 'a/one', 'count': 2}, 2: {'name': 'b/two', 'count': 1}}
+    assert admit_and_record(activity_filter, hour) == {1: {'name': 'a/one', 'count': 5}}
+    assert admit_and_record(activity_filter, {1: {'name': 'a/one', 'count': 1}}) == {1: {'name': 'a/one', 'count': 1}}
+    assert (activity_filter.seen, activity_filter.admitted, activity_filter.hours) == (5, 2, 3)
+
+
+def test_activity_filter_admit_does_not_count():
+    activity_filter = ActivityFilter(threshold=5, width=1024)
+    hour = {1: {'name': 'a/one', 'count': 3}}
+
+    # a failed attempt at an hour, then its retry
+    assert activity_filter.admit(hour) == {}
+    assert admit_and_record(activity_filter, hour) == {}
+    assert activity_filter.sketch.estimate(1) == 3
+    assert activity_filter.hours == 1
+
+
+def test_activity_filter_halves_and_restores():
+    activity_filter = ActivityFilter(threshold=100, half_life_hours=2, width=1024)
+    admit_and_record(activity_filter, {1: {'name': 'a/one', 'count': 40}})
+    admit_and_record(activity_filter, {1: {'name': 'a/one', 'count': 40}})
+    assert activity_filter.sketch.estimate(1) == 40
+
+    restored = ActivityFilter(threshold=100, half_life_hours=2, width=1024)
+    restored.restore(activity_filter.sketch.to_bytes(), activity_filter.heavy_hitters.to_bytes(), activity_filter.hours)
+    assert restored.hours == 2
+    assert restored.sketch.estimate(1) == 40
+    assert restored.heavy_hitters.top(1) == [(1, 40, 0)]
+
+
+def test_hyperloglog_estimates_within_error():
+    for n in (1, 10, 1000, 50_000):
+        sketch = HyperLogLog()
+        sketch.update(random.Random(n).sample(range(10**9), n))
+        # 3 standard errors at p=10
+        assert abs(sketch.count() - n) <= max(1, n * 0.1)
+
+
+def test_hyperloglog_union_and_round_trip():
+    small = HyperLogLog()
+    small.update(range(20))
+    data = small.to_bytes()
+    # sparse, 3 bytes per set register
+    assert len(data) < 2 + 3 * 21
+    assert HyperLogLog.from_bytes(data).count() == small.count()
+
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(range(0, 6000))
+    b.update(range(3000, 9000))
+    assert HyperLogLog.from_bytes(a.to_bytes()).dense is not None
+    union = a.merge(b).merge(small)
+    assert abs(union.count() - 9000) <= 900
+
+    # unions are idempotent, a retried hour doesn't count twice
+    assert union.to_bytes() == HyperLogLog.from_bytes(union.to_bytes()).merge(b).to_bytes()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    known = BloomFilter(10_000)
+    known.update(range(0, 20_000, 2))
+    known.add(10**12)
+
+    assert all(repo_id in known for repo_id in range(0, 20_000, 2))
+    assert 10**12 in known
+    false_positives = sum(repo_id in known for repo_id in range(1, 20_000, 2))
+    assert false_positives < 10_000 * 0.03
+
+    # adding known ids again doesn't use up capacity
+    count = known.count
+    known.update(range(0, 2_000, 2))
+    assert known.count == count
+    assert not known.saturated
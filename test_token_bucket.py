@@ -0,0 +1,81 @@
+# test_token_bucket.py
+import asyncio
+import time
+
+from helpers.token_bucket import AsyncTokenBucket, RateLimiter
+
+
+def test_burst_does_not_wait():
+    async def run():
+        bucket = AsyncTokenBucket(rate=10, capacity=5)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.05
+
+
+def test_acquire_waits_for_refill():
+    async def run():
+        bucket = AsyncTokenBucket(rate=100, capacity=10)
+        start = time.monotonic()
+        for _ in range(30):
+            await bucket.acquire()
+        return time.monotonic() - start, bucket.throttled_seconds
+
+    elapsed, throttled = asyncio.run(run())
+    # 10 from the burst, 20 more at 100/s
+    assert 0.18 < elapsed < 0.5
+    assert throttled > 0.15
+
+
+def test_waiters_are_served_in_order():
+    async def run():
+        bucket = AsyncTokenBucket(rate=200, capacity=1)
+        await bucket.acquire()
+        served = []
+
+        async def waiter(i, tokens):
+            await bucket.acquire(tokens)
+            served.append(i)
+
+        # the big request queued first isn't overtaken by the small ones behind it
+        await asyncio.gather(waiter(0, 1), waiter(1, 5), waiter(2, 1), waiter(3, 1))
+        return served
+
+    assert asyncio.run(run()) == [0, 1, 2, 3]
+
+
+def test_oversized_acquire_goes_into_debt():
+    async def run():
+        bucket = AsyncTokenBucket(rate=1000, capacity=100)
+        start = time.monotonic()
+        await bucket.acquire(300)
+        first = time.monotonic() - start
+        await bucket.acquire(1)
+        return first, time.monotonic() - start
+
+    first, total = asyncio.run(run())
+    assert first < 0.05
+    # the next caller waits off the 200 token debt
+    assert total > 0.18
+
+
+def test_rate_limiter_keys(monkeypatch):
+    monkeypatch.setenv("TEST_MAX_BYTES_PER_SECOND", "1000")
+    monkeypatch.delenv("TEST_MAX_REQUESTS_PER_SECOND", raising=False)
+    limiter = RateLimiter.from_env("TEST")
+    assert set(limiter.buckets) == {'bytes'}
+    assert limiter.describe() == "1000 bytes/s"
+
+    async def run():
+        # requests aren't limited, bytes are
+        for _ in range(1000):
+            await limiter.acquire(requests=1)
+        await limiter.acquire(bytes=1000)
+        await limiter.acquire(bytes=1)
+        return limiter.buckets['bytes'].throttled_seconds
+
+    assert asyncio.run(run()) > 0
+    assert RateLimiter().describe() == "unlimited"